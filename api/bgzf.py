@@ -0,0 +1,150 @@
+"""Random access into BGZF (``bgzip``) compressed files.
+
+BGZF is gzip made of independent members ("blocks") of at most 64 KiB of
+input each, with the compressed size of every block stored in its header.
+Any gzip reader decompresses it as a whole, but because each block starts
+a fresh deflate stream, decompression can also start at any block. A block
+table (the uncompressed start and file offset of each block, what
+``bgzip -i`` stores in a ``.gzi``) maps an uncompressed offset to the block
+that holds it, so reading a few lines touches one or two blocks rather than
+everything before them.
+
+Plain (single member) gzip has no such entry points; ``is_bgzf`` tells the
+two apart so callers can fall back to streaming.
+"""
+import bisect
+import struct
+import zlib
+
+
+GZIP_MAGIC = b'\x1f\x8b'
+FEXTRA = 4
+# the last block of a BGZF file is this empty block
+EOF_BLOCK = bytes.fromhex('1f8b08040000000000ff0600424302001b0003000000000000000000')
+MAX_BLOCK_INPUT = 0xff00
+
+
+def block_size(header, extra):
+    """Total size of the block whose 12-byte ``header`` and extra field are given, or None."""
+    if header[:3] != GZIP_MAGIC + b'\x08' or not header[3] & FEXTRA:
+        return None
+    i = 0
+    while i + 4 <= len(extra):
+        length = struct.unpack_from('<H', extra, i + 2)[0]
+        if extra[i:i + 2] == b'BC' and length == 2:
+            return struct.unpack_from('<H', extra, i + 4)[0] + 1
+        i += 4 + length
+    return None
+
+
+def read_header(inp):
+    """Read one block header at the current position; returns its total size, or None."""
+    header = inp.read(12)
+    if len(header) < 12:
+        return None
+    (xlen,) = struct.unpack_from('<H', header, 10)
+    return block_size(header, inp.read(xlen))
+
+
+def is_bgzf(path):
+    with open(path, mode='rb') as inp:
+        return read_header(inp) is not None
+
+
+def scan_blocks(path):
+    """Block table of a BGZF file: ``(uncompressed starts, file offsets)``.
+
+    Only block headers and trailers are read, not the compressed data.
+    """
+    ustarts, offsets = [], []
+    ustart = offset = 0
+    with open(path, mode='rb') as inp:
+        while True:
+            inp.seek(offset)
+            size = read_header(inp)
+            if size is None:
+                break
+            inp.seek(offset + size - 4)
+            (isize,) = struct.unpack('<I', inp.read(4))
+            if isize:
+                ustarts.append(ustart)
+                offsets.append(offset)
+            ustart += isize
+            offset += size
+    return ustarts, offsets
+
+
+def decompress_block(block):
+    (xlen,) = struct.unpack_from('<H', block, 10)
+    return zlib.decompress(block[12 + xlen:-8], -zlib.MAX_WBITS)
+
+
+def compress(data, level=6):
+    """BGZF-compress ``data`` (what ``bgzip`` writes), for tests and small tools."""
+    blocks = []
+    for i in range(0, len(data), MAX_BLOCK_INPUT):
+        chunk = data[i:i + MAX_BLOCK_INPUT]
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        cdata = compressor.compress(chunk) + compressor.flush()
+        header = struct.pack('<4BI2BH2BHH', 0x1f, 0x8b, 8, FEXTRA, 0, 0, 0xff, 6,
+                             ord('B'), ord('C'), 2, 12 + 6 + len(cdata) + 8 - 1)
+        blocks.append(header + cdata + struct.pack('<II', zlib.crc32(chunk), len(chunk)))
+    blocks.append(EOF_BLOCK)
+    return b''.join(blocks)
+
+
+class BgzfReader:
+    """Binary file-like reader over uncompressed offsets, given a block table.
+
+    ``seek`` and ``read`` decompress only the blocks they touch; the most
+    recently used blocks are kept, since neighbouring lookups usually share one.
+    """
+
+    def __init__(self, path, blocks, cached_blocks=4):
+        self.inp = open(path, mode='rb')
+        self.ustarts, self.offsets = blocks
+        self.cached_blocks = cached_blocks
+        self.cache = {}
+        self.position = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.inp.close()
+
+    def block(self, i):
+        data = self.cache.pop(i, None)
+        if data is None:
+            self.inp.seek(self.offsets[i])
+            size = read_header(self.inp)
+            self.inp.seek(self.offsets[i])
+            data = decompress_block(self.inp.read(size))
+            if len(self.cache) >= self.cached_blocks:
+                self.cache.pop(next(iter(self.cache)))
+        self.cache[i] = data
+        return data
+
+    def seek(self, position):
+        self.position = position
+
+    def tell(self):
+        return self.position
+
+    def read(self, size):
+        chunks = []
+        i = bisect.bisect_right(self.ustarts, self.position) - 1
+        while size > 0 and 0 <= i < len(self.ustarts):
+            data = self.block(i)
+            offset = self.position - self.ustarts[i]
+            chunk = data[offset:offset + size]
+            if not chunk:
+                break
+            chunks.append(chunk)
+            self.position += len(chunk)
+            size -= len(chunk)
+            i += 1
+        return b''.join(chunks)
@@ -0,0 +1,30 @@
+import gzip
+import random
+
+from api.bgzf import BgzfReader, compress, is_bgzf, scan_blocks
+
+
+def test_compress_round_trips_through_gzip(tmp_path):
+    data = bytes(random.Random(1).getrandbits(8) for _ in range(200000))
+    path = tmp_path / 'data.gz'
+    path.write_bytes(compress(data))
+    assert is_bgzf(str(path))
+    assert gzip.decompress(path.read_bytes()) == data
+
+
+def test_reader_seeks_across_blocks(tmp_path):
+    data = b''.join(b'line %d\n' % i for i in range(50000))
+    path = tmp_path / 'data.gz'
+    path.write_bytes(compress(data))
+    blocks = scan_blocks(str(path))
+    assert len(blocks[0]) > 3
+    with BgzfReader(str(path), blocks) as reader:
+        for position, size in [(0, 10), (65270, 40), (len(data) - 5, 100), (123456, 200000)]:
+            reader.seek(position)
+            assert reader.read(size) == data[position:position + size]
+
+
+def test_plain_gzip_is_not_bgzf(tmp_path):
+    path = tmp_path / 'plain.gz'
+    path.write_bytes(gzip.compress(b'x' * 1000))
+    assert not is_bgzf(str(path))
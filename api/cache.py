@@ -0,0 +1,97 @@
+"""Content-addressed LRU cache for rendered figures."""
+import asyncio
+import hashlib
+import json
+from collections import OrderedDict
+
+
+def content_key(payload):
+    """Hash a JSON-serialisable payload into a stable hex key."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """LRU cache of rendered bytes bounded by total size.
+
+    Concurrent ``get_or_compute`` calls for the same key share a single
+    computation instead of each rendering the figure.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.in_flight = {}
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        self.entries[key] = value
+        self.size += len(value)
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    async def get_or_compute(self, key, compute):
+        """Return the cached value for ``key``, awaiting ``compute()`` on a miss.
+
+        The computation runs in its own task, shared by every caller waiting on
+        the key, so a cancelled caller (a client that disconnected) does not
+        cancel it for the others. It is cancelled only when no caller is left.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        entry = self.in_flight.get(key)
+        if entry is None:
+            self.misses += 1
+            # [task, number of callers waiting on it]
+            entry = self.in_flight[key] = [None, 0]
+            entry[0] = asyncio.ensure_future(self._compute(key, compute, entry))
+        else:
+            self.coalesced += 1
+        task = entry[0]
+        entry[1] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            entry[1] -= 1
+            if not entry[1] and not task.done():
+                task.cancel()
+                if self.in_flight.get(key) is entry:
+                    del self.in_flight[key]
+
+    async def _compute(self, key, compute, entry):
+        try:
+            value = await compute()
+        finally:
+            if self.in_flight.get(key) is entry:
+                del self.in_flight[key]
+        self.put(key, value)
+        return value
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
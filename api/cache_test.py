@@ -0,0 +1,85 @@
+import asyncio
+
+from api.cache import RenderCache, content_key
+
+
+def test_content_key_ignores_key_order():
+    assert content_key({'a': 1, 'b': [1, 2]}) == content_key({'b': [1, 2], 'a': 1})
+    assert content_key({'a': 1}) != content_key({'a': 2})
+
+
+def test_lru_evicts_to_byte_budget():
+    cache = RenderCache(max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.get('a')
+    cache.put('c', b'1234')
+    assert cache.get('b') is None
+    assert cache.get('a') == b'1234'
+    assert cache.stats()['bytes'] == 8
+
+
+def test_concurrent_requests_are_coalesced():
+    cache = RenderCache(max_bytes=1024)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return b'<svg/>'
+
+    async def burst():
+        return await asyncio.gather(*(cache.get_or_compute('k', compute) for _ in range(5)))
+
+    assert asyncio.run(burst()) == [b'<svg/>'] * 5
+    assert len(calls) == 1
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['coalesced'] == 4
+    asyncio.run(cache.get_or_compute('k', compute))
+    assert cache.stats()['hits'] == 1
+
+
+def test_cancelled_caller_does_not_fail_coalesced_callers():
+    cache = RenderCache(max_bytes=1024)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return b'<svg/>'
+
+    async def leader_disconnects():
+        leader = asyncio.ensure_future(cache.get_or_compute('k', compute))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(cache.get_or_compute('k', compute))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        return await waiter, leader.cancelled()
+
+    assert asyncio.run(leader_disconnects()) == (b'<svg/>', True)
+    assert len(calls) == 1
+    assert cache.get('k') == b'<svg/>'
+
+
+def test_computation_is_cancelled_when_every_caller_is():
+    cache = RenderCache(max_bytes=1024)
+    finished = []
+
+    async def compute():
+        await asyncio.sleep(0.05)
+        finished.append(1)
+        return b'<svg/>'
+
+    async def everyone_disconnects():
+        callers = [asyncio.ensure_future(cache.get_or_compute('k', compute)) for _ in range(2)]
+        await asyncio.sleep(0.01)
+        for caller in callers:
+            caller.cancel()
+        await asyncio.gather(*callers, return_exceptions=True)
+        await asyncio.sleep(0.1)
+        # a new caller starts a fresh computation instead of joining the cancelled one
+        return await cache.get_or_compute('k', compute)
+
+    assert asyncio.run(everyone_disconnects()) == b'<svg/>'
+    assert finished == [1]
+    assert cache.in_flight == {}
@@ -0,0 +1,202 @@
+"""Columnar request bodies for the batch SVG endpoint.
+
+The JSON schema of ``BatchGeneStructureRequest`` sends every feature as a
+``{start, end}`` object, and pydantic builds a ``Position`` model for each one
+before drawing starts. The encodings here carry each feature kind as parallel
+``starts``/``ends`` integer columns instead, decoded straight into NumPy arrays
+(``geometry.Positions``) and validated a whole array at a time.
+
+* JSON (``application/json``)::
+
+    {"draw_settings": {...},
+     "transcripts": [{"transcript_id": "t1", "strand": "+", "start": 100, "end": 900,
+                      "cds": {"starts": [100, 500], "ends": [300, 900]},
+                      "five_prime_utrs": {...}, "three_prime_utrs": {...}, "exons": {...}}]}
+
+* MessagePack (``application/msgpack``): the same structure. ``starts`` and
+  ``ends`` may also be ``bin`` values holding little-endian int64s. Needs the
+  optional ``msgpack`` package.
+
+* Packed binary (``application/vnd.genestructure.columnar``): ``MAGIC``, the
+  length of a JSON header as a little-endian uint32, the header, then every
+  start followed by every end as little-endian int64s. The header is the JSON
+  form with feature counts in place of columns (``"cds": 2``); features are
+  laid out transcript by transcript, kinds in ``KIND_FIELDS`` order.
+
+Missing feature kinds are empty. Variants are not part of the columnar form.
+"""
+import hashlib
+import json
+import struct
+
+import numpy as np
+
+from api.geometry import KIND_FIELDS, Positions
+
+
+MAGIC = b'GSC1'
+JSON_TYPE = 'application/json'
+MSGPACK_TYPES = ('application/msgpack', 'application/x-msgpack', 'application/vnd.msgpack')
+BINARY_TYPE = 'application/vnd.genestructure.columnar'
+CONTENT_TYPES = (JSON_TYPE, *MSGPACK_TYPES, BINARY_TYPE)
+
+NAMES = [name for _, name, _ in KIND_FIELDS]
+
+
+class UnsupportedEncoding(ValueError):
+    """The body's content type is not one of ``CONTENT_TYPES`` (or msgpack is not installed)."""
+
+
+def int_column(values, what):
+    if isinstance(values, (bytes, bytearray, memoryview)):
+        if len(values) % 8:
+            raise ValueError(f"{what} must hold little-endian int64 values.")
+        return np.frombuffer(values, dtype='<i8').astype(np.int64, copy=False)
+    array = np.asarray(values)
+    if array.ndim != 1 or (array.size and array.dtype.kind not in 'iu'):
+        raise ValueError(f"{what} must be an array of integers.")
+    return array.astype(np.int64, copy=False)
+
+
+def check_positions(starts, ends, what):
+    """Vectorised checks for a whole column pair."""
+    if len(starts) != len(ends):
+        raise ValueError(f"{what}: starts and ends differ in length.")
+    if len(starts) and starts.min() < 1:
+        raise ValueError(f"{what}: positions must be at least 1.")
+    if (starts > ends).any():
+        raise ValueError(f"{what}: positions must have start <= end.")
+
+
+def check_transcripts(transcripts):
+    if not isinstance(transcripts, list):
+        raise ValueError("transcripts must be an array.")
+    for i, header in enumerate(transcripts):
+        if not isinstance(header, dict):
+            raise ValueError(f"transcripts[{i}] must be an object.")
+    return transcripts
+
+
+def transcript_record(header, columns):
+    strand = header.get('strand')
+    if strand not in ('+', '-'):
+        raise ValueError(f"Transcript {header.get('transcript_id')}: strand must be '+' or '-'.")
+    try:
+        transcript_id = str(header['transcript_id'])
+        start, end = int(header['start']), int(header['end'])
+    except (KeyError, TypeError) as e:
+        raise ValueError(f"Transcripts need transcript_id, start and end: {e}")
+    record = {
+        'transcript_id': transcript_id,
+        'strand': strand,
+        'start': start,
+        'end': end,
+        'total_length': end - start,
+        'variants': [],
+    }
+    record.update(columns)
+    return record
+
+
+def decode_transcripts(transcripts):
+    """Records for the JSON / MessagePack form."""
+    records = []
+    for header in check_transcripts(transcripts):
+        columns = {}
+        for name in NAMES:
+            column = header.get(name) or {}
+            what = f"Transcript {header.get('transcript_id')} {name}"
+            if not isinstance(column, dict):
+                raise ValueError(f"{what} must be an object with starts and ends.")
+            starts = int_column(column.get('starts', []), what)
+            ends = int_column(column.get('ends', []), what)
+            check_positions(starts, ends, what)
+            columns[name] = Positions(starts, ends)
+        records.append(transcript_record(header, columns))
+    return records
+
+
+def decode_binary(body):
+    if body[:4] != MAGIC or len(body) < 8:
+        raise ValueError("Not a packed columnar body.")
+    (header_length,) = struct.unpack_from('<I', body, 4)
+    header = json.loads(bytes(body[8:8 + header_length]))
+    if not isinstance(header, dict):
+        raise ValueError("The packed header must be an object.")
+    transcripts = check_transcripts(header.get('transcripts', []))
+    counts = np.array([[int(t.get(name, 0)) for name in NAMES] for t in transcripts], dtype=np.int64)
+    counts = counts.reshape(-1, len(NAMES))
+    if len(counts) and counts.min() < 0:
+        raise ValueError("Feature counts must not be negative.")
+    total = int(counts.sum())
+    values = np.frombuffer(body, dtype='<i8', offset=8 + header_length)
+    if len(values) != 2 * total:
+        raise ValueError(f"Expected {2 * total} positions after the header, found {len(values)}.")
+    starts, ends = values[:total], values[total:]
+    check_positions(starts, ends, "features")
+
+    offsets = np.concatenate(([0], np.cumsum(counts.ravel()))).tolist()
+    records = []
+    for i, transcript in enumerate(transcripts):
+        columns = {}
+        for k, name in enumerate(NAMES):
+            lo, hi = offsets[i * len(NAMES) + k], offsets[i * len(NAMES) + k + 1]
+            columns[name] = Positions(starts[lo:hi], ends[lo:hi])
+        records.append(transcript_record(transcript, columns))
+    return header.get('draw_settings'), records
+
+
+def encode_binary(draw_settings, gene_structures):
+    """Pack ``GeneStructureInfo``-shaped dicts into the binary form (for clients and tests)."""
+    transcripts = []
+    starts, ends = [], []
+    for gene_structure in gene_structures:
+        header = {key: gene_structure[key] for key in ('transcript_id', 'strand', 'start', 'end')}
+        for name in NAMES:
+            positions = gene_structure.get(name, [])
+            header[name] = len(positions)
+            starts.extend(pos['start'] for pos in positions)
+            ends.extend(pos['end'] for pos in positions)
+        transcripts.append(header)
+    header = json.dumps({'draw_settings': draw_settings, 'transcripts': transcripts}).encode('utf-8')
+    return b''.join([
+        MAGIC, struct.pack('<I', len(header)), header,
+        np.array(starts + ends, dtype='<i8').tobytes(),
+    ])
+
+
+def media_type(content_type):
+    return (content_type or JSON_TYPE).split(';')[0].strip().lower()
+
+
+def decode_request(body, content_type):
+    """Return ``(draw_settings dict, [record])`` for a columnar body."""
+    kind = media_type(content_type)
+    if kind == BINARY_TYPE:
+        draw_settings, records = decode_binary(body)
+    elif kind in (JSON_TYPE, *MSGPACK_TYPES):
+        if kind == JSON_TYPE:
+            data = json.loads(body)
+        else:
+            try:
+                import msgpack
+            except ImportError:
+                raise UnsupportedEncoding("MessagePack bodies need the msgpack package.")
+            data = msgpack.unpackb(body, raw=False)
+        if not isinstance(data, dict):
+            raise ValueError("The request body must be an object.")
+        draw_settings, records = data.get('draw_settings'), decode_transcripts(data.get('transcripts', []))
+    else:
+        raise UnsupportedEncoding(f"Unsupported content type {kind}; use one of {', '.join(CONTENT_TYPES)}.")
+    if not isinstance(draw_settings, dict):
+        raise ValueError("draw_settings is required.")
+    if not records:
+        raise ValueError("No gene structures provided.")
+    return draw_settings, records
+
+
+def request_key(body, content_type):
+    """Cache key / ETag of a columnar body (the body already contains the draw settings)."""
+    digest = hashlib.sha256(media_type(content_type).encode('utf-8'))
+    digest.update(body)
+    return digest.hexdigest()
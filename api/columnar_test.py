@@ -0,0 +1,113 @@
+import json
+import os
+
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+
+from api.columnar import BINARY_TYPE, decode_request, encode_binary
+from api.geometry import structure_arrays
+from api.gff import iter_transcripts
+from api.index import app
+
+
+UTILS_DIR = os.path.join(os.path.dirname(__file__), '..', 'app', 'utils')
+RICE_GFF = os.path.join(UTILS_DIR, 'transcripts.gff')
+
+DRAW_SETTINGS = {
+    'mode': 'gene',
+    'utr_color': '#d3d3d3',
+    'exon_color': '#0077cc',
+    'line_color': '#000000',
+    'intron_shape': 'straight',
+}
+
+
+client = TestClient(app)
+
+
+def load_structures():
+    with open(RICE_GFF) as inp:
+        return [t for t in iter_transcripts(inp) if t['cds']][:5]
+
+
+def columnar_json(structures):
+    transcripts = []
+    for s in structures:
+        transcript = {key: s[key] for key in ('transcript_id', 'strand', 'start', 'end')}
+        for name in ('cds', 'five_prime_utrs', 'three_prime_utrs', 'exons'):
+            transcript[name] = {'starts': [p['start'] for p in s[name]], 'ends': [p['end'] for p in s[name]]}
+        transcripts.append(transcript)
+    return {'draw_settings': DRAW_SETTINGS, 'transcripts': transcripts}
+
+
+def test_decoded_columns_flatten_like_the_json_schema():
+    structures = load_structures()
+    for body, content_type in [
+        (json.dumps(columnar_json(structures)).encode(), 'application/json'),
+        (encode_binary(DRAW_SETTINGS, structures), BINARY_TYPE),
+    ]:
+        draw_settings, records = decode_request(body, content_type)
+        assert draw_settings == DRAW_SETTINGS
+        for record, structure in zip(records, structures):
+            for actual, expected in zip(structure_arrays(record), structure_arrays(structure)):
+                np.testing.assert_array_equal(actual, expected)
+
+
+@pytest.mark.parametrize('encoding', ['json', 'binary'])
+def test_columnar_endpoint_matches_json_schema(encoding):
+    structures = load_structures()
+    expected = client.post('/api/py/generate-gene-structures-svg', json={
+        'draw_settings': DRAW_SETTINGS, 'gene_structures': structures})
+    if encoding == 'json':
+        response = client.post('/api/py/generate-gene-structures-columnar', json=columnar_json(structures))
+    else:
+        response = client.post('/api/py/generate-gene-structures-columnar',
+                               content=encode_binary(DRAW_SETTINGS, structures),
+                               headers={'Content-Type': BINARY_TYPE})
+    assert response.status_code == 200, response.text
+    assert response.text == expected.text
+    assert response.headers['ETag']
+
+
+def test_columnar_endpoint_matches_json_schema_with_msgpack():
+    msgpack = pytest.importorskip('msgpack')
+    structures = load_structures()
+    body = columnar_json(structures)
+    for transcript in body['transcripts']:
+        # columns may also be packed little-endian int64s
+        transcript['cds'] = {k: np.array(v, dtype='<i8').tobytes() for k, v in transcript['cds'].items()}
+    expected = client.post('/api/py/generate-gene-structures-svg', json={
+        'draw_settings': DRAW_SETTINGS, 'gene_structures': structures})
+    response = client.post('/api/py/generate-gene-structures-columnar', content=msgpack.packb(body),
+                           headers={'Content-Type': 'application/msgpack'})
+    assert response.text == expected.text
+
+
+def test_columnar_endpoint_rejects_bad_columns():
+    body = columnar_json(load_structures()[:1])
+    body['transcripts'][0]['cds']['ends'].pop()
+    response = client.post('/api/py/generate-gene-structures-columnar', json=body)
+    assert response.status_code == 400
+    assert 'differ in length' in response.json()['detail']
+
+    body = columnar_json(load_structures()[:1])
+    body['transcripts'][0]['cds']['starts'][0] = 10 ** 9
+    assert client.post('/api/py/generate-gene-structures-columnar', json=body).status_code == 400
+
+    for transcripts in (['Os01t0100100-01'], [None], {'cds': {}}, 1):
+        body = columnar_json(load_structures()[:1])
+        body['transcripts'] = transcripts
+        assert client.post('/api/py/generate-gene-structures-columnar', json=body).status_code == 400
+    body = columnar_json(load_structures()[:1])
+    body['transcripts'][0]['cds'] = [1, 2]
+    assert client.post('/api/py/generate-gene-structures-columnar', json=body).status_code == 400
+
+    packed = encode_binary(DRAW_SETTINGS, load_structures()[:1])
+    response = client.post('/api/py/generate-gene-structures-columnar', content=packed[:-8],
+                           headers={'Content-Type': BINARY_TYPE})
+    assert response.status_code == 400
+
+    response = client.post('/api/py/generate-gene-structures-columnar', content=b'x',
+                           headers={'Content-Type': 'text/csv'})
+    assert response.status_code == 415
@@ -0,0 +1,102 @@
+"""Runs CPU-bound renders off the event loop with bounded admission.
+
+An ``async def`` endpoint that renders inline holds the event loop for the
+whole render, stalling every other request on the worker (health checks
+included). ``RenderQueue.run`` hands the render to a thread or process pool
+instead. At most ``workers`` renders execute at once and up to ``max_queued``
+more wait in the pool's queue. Past that, ``run`` raises ``Saturated``
+straight away, so the caller can answer 503 with a ``Retry-After`` estimated
+from recent render times rather than letting latency pile up.
+"""
+import asyncio
+import math
+import time
+
+
+class Saturated(Exception):
+
+    def __init__(self, retry_after):
+        super().__init__(f"Render queue is full; retry after {retry_after} s.")
+        self.retry_after = retry_after
+
+
+def timed_call(func, args):
+    """Worker-side wrapper: when the call started, for the queue wait, and its result."""
+    started = time.monotonic()
+    return started, func(*args)
+
+
+class RenderQueue:
+    """Bounded in-flight counter in front of an executor.
+
+    ``kind`` is ``"thread"``, ``"process"`` or ``"inline"`` (render on the
+    event loop, for debugging). The executor is created on first use.
+    """
+
+    def __init__(self, kind="thread", workers=4, max_queued=16):
+        if kind not in ("thread", "process", "inline"):
+            raise ValueError(f"Unknown render executor: {kind}")
+        self.kind = kind
+        self.workers = max(workers, 1)
+        self.max_queued = max_queued
+        self.executor = None
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        # exponential moving average of render seconds, for Retry-After
+        self.average_seconds = 0.05
+
+    def get_executor(self):
+        if self.executor is None and self.kind != "inline":
+            if self.kind == "process":
+                from concurrent.futures import ProcessPoolExecutor
+
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                from concurrent.futures import ThreadPoolExecutor
+
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        return self.executor
+
+    @property
+    def queued(self):
+        return max(self.in_flight - self.workers, 0)
+
+    def retry_after(self):
+        # time for everything ahead of a new request to drain through the workers
+        return max(1, math.ceil(self.average_seconds * (self.in_flight + 1) / self.workers))
+
+    async def run(self, func, *args, shed=True):
+        """Run ``func(*args)`` in the pool; returns ``(queue_wait_seconds, result)``.
+
+        With ``shed`` a full queue raises ``Saturated`` instead of waiting.
+        """
+        if shed and self.in_flight >= self.workers + self.max_queued:
+            self.rejected += 1
+            raise Saturated(self.retry_after())
+        submitted = time.monotonic()
+        self.in_flight += 1
+        try:
+            if self.kind == "inline":
+                started, result = timed_call(func, args)
+            else:
+                loop = asyncio.get_running_loop()
+                started, result = await loop.run_in_executor(self.get_executor(), timed_call, func, args)
+        finally:
+            self.in_flight -= 1
+        finished = time.monotonic()
+        self.completed += 1
+        self.average_seconds += 0.2 * ((finished - started) - self.average_seconds)
+        return started - submitted, result
+
+    def stats(self):
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "max_queued": self.max_queued,
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "average_seconds": self.average_seconds,
+        }
@@ -0,0 +1,56 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from api.executor import RenderQueue, Saturated
+
+
+def test_render_queue_sheds_load_when_full():
+    release = threading.Event()
+
+    async def main():
+        queue = RenderQueue('thread', workers=1, max_queued=1)
+        running = asyncio.ensure_future(queue.run(release.wait, 5))
+        waiting = asyncio.ensure_future(queue.run(time.perf_counter))
+        await asyncio.sleep(0.05)
+        assert (queue.in_flight, queue.queued) == (2, 1)
+
+        with pytest.raises(Saturated) as excinfo:
+            await queue.run(time.perf_counter)
+        assert excinfo.value.retry_after >= 1
+        # without shedding a render waits for its turn instead
+        unshed = asyncio.ensure_future(queue.run(time.perf_counter, shed=False))
+
+        # the event loop stays free while the worker is busy
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        assert time.perf_counter() - started < 0.5
+
+        release.set()
+        _, result = await running
+        wait, _ = await waiting
+        await unshed
+        assert result is True
+        assert wait >= 0.04
+        return queue.stats()
+
+    stats = asyncio.run(main())
+    assert stats['rejected'] == 1
+    assert stats['completed'] == 3
+    assert stats['in_flight'] == 0
+
+
+def test_render_queue_runs_inline_and_in_processes():
+    async def main(kind):
+        queue = RenderQueue(kind, workers=1)
+        _, result = await queue.run(sum, [1, 2, 3])
+        if queue.executor is not None:
+            queue.executor.shutdown()
+        return result
+
+    assert asyncio.run(main('inline')) == 6
+    assert asyncio.run(main('process')) == 6
+    with pytest.raises(ValueError):
+        RenderQueue('fibers')
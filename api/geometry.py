@@ -0,0 +1,519 @@
+"""Vectorised transcript geometry shared by the API and the GeneSTRUCTURE CLI.
+
+A transcript is held as three parallel arrays: ``starts``, ``ends`` and
+``kinds`` (one of the feature kinds below). Shifting onto a drawing axis,
+strand reversal, validation, ordering and scaling to pixels are whole-array
+operations, so cost stays flat per segment even for transcripts with
+thousands of exons.
+"""
+import numpy as np
+
+
+CDS, FIVE_PRIME_UTR, THREE_PRIME_UTR, EXON = range(4)
+
+# (kind, GeneStructureInfo field, label used in validation errors)
+KIND_FIELDS = (
+    (CDS, 'cds', 'CDS'),
+    (FIVE_PRIME_UTR, 'five_prime_utrs', "5' UTR"),
+    (THREE_PRIME_UTR, 'three_prime_utrs', "3' UTR"),
+    (EXON, 'exons', 'Exon'),
+)
+DRAWN_KINDS = (CDS, FIVE_PRIME_UTR, THREE_PRIME_UTR)
+
+
+def field(obj, name, *default):
+    if isinstance(obj, dict):
+        return obj.get(name, *default) if default else obj[name]
+    return getattr(obj, name, *default)
+
+
+class Positions:
+    """Intervals of one feature kind held as ``starts``/``ends`` int64 arrays.
+
+    Decoded columnar requests (``api.columnar``) use this in place of a list of
+    ``{start, end}`` objects. It iterates as such dicts, so code written for
+    the list shape keeps working, while ``structure_arrays`` uses the arrays
+    as they are.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, starts, ends):
+        self.starts = starts
+        self.ends = ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        for start, end in zip(self.starts.tolist(), self.ends.tolist()):
+            yield {'start': start, 'end': end}
+
+
+def structure_arrays(gene_structure):
+    """Flatten a GeneStructureInfo (model or dict) into ``starts, ends, kinds`` arrays."""
+    columns = [field(gene_structure, name) for _, name, _ in KIND_FIELDS]
+    if all(isinstance(positions, Positions) for positions in columns):
+        return (
+            np.concatenate([positions.starts for positions in columns]),
+            np.concatenate([positions.ends for positions in columns]),
+            np.repeat(np.array([kind for kind, _, _ in KIND_FIELDS], dtype=np.int8),
+                      [len(positions) for positions in columns]),
+        )
+
+    starts, ends, kinds = [], [], []
+    for kind, name, _ in KIND_FIELDS:
+        positions = field(gene_structure, name)
+        starts.extend(field(pos, 'start') for pos in positions)
+        ends.extend(field(pos, 'end') for pos in positions)
+        kinds.extend([kind] * len(positions))
+    return (
+        np.array(starts, dtype=np.int64),
+        np.array(ends, dtype=np.int64),
+        np.array(kinds, dtype=np.int8),
+    )
+
+
+def get_axis(gene_structures):
+    """Shared drawing axis ``(origin, axis_end, flip)`` for one or more transcripts.
+
+    The axis is flipped only when every transcript is on the minus strand, so
+    that 5' -> 3' reads left to right.
+    """
+    origin = min(min(field(gs, 'start'), field(gs, 'end')) for gs in gene_structures)
+    axis_end = max(max(field(gs, 'start'), field(gs, 'end')) for gs in gene_structures)
+    flip = all(field(gs, 'strand') == '-' for gs in gene_structures)
+    return origin, axis_end, flip
+
+
+def normalize(starts, ends, axis):
+    """Move genomic coordinates onto ``axis``, mirroring them when it is flipped."""
+    origin, axis_end, flip = axis
+    if flip:
+        return axis_end - ends, axis_end - starts
+    return starts - origin, ends - origin
+
+
+def validate(starts, ends, kinds):
+    """Raise ValueError naming the first feature kind with start > end."""
+    bad = starts > ends
+    if bad.any():
+        bad_kinds = set(kinds[bad].tolist())
+        for kind, _, label in KIND_FIELDS:
+            if kind in bad_kinds:
+                raise ValueError(f"{label} positions must have start <= end")
+
+
+def to_pixels(values, scale=10, margin_x=0):
+    return values / scale + margin_x
+
+
+def transcript_layout(gene_structure, axis, margin_x, scale=10):
+    """Pixel geometry of one transcript on ``axis``.
+
+    Returns ``{kind: (x, width)}`` for the drawn kinds, in input order, and the
+    ``(x1, x2)`` of the intron lines joining consecutive segments ordered by end.
+    Values are plain Python lists, ready to format.
+    """
+    starts, ends, kinds = structure_arrays(gene_structure)
+    starts, ends = normalize(starts, ends, axis)
+    validate(starts, ends, kinds)
+
+    x = to_pixels(starts, scale, margin_x)
+    width = (ends - starts + 1) / scale
+    rects = {}
+    for kind in DRAWN_KINDS:
+        mask = kinds == kind
+        rects[kind] = (x[mask].tolist(), width[mask].tolist())
+
+    drawn = np.isin(kinds, DRAWN_KINDS)
+    order = np.argsort(ends[drawn], kind='stable')
+    drawn_starts = starts[drawn][order]
+    drawn_ends = ends[drawn][order]
+    introns = (
+        to_pixels(drawn_ends[:-1], scale, margin_x).tolist(),
+        to_pixels(drawn_starts[1:], scale, margin_x).tolist(),
+    )
+    return rects, introns
+
+
+def lod_layout(gene_structure, axis, margin_x, scale, merge_px=1.0, original=None):
+    """Level-of-detail variant of ``transcript_layout``.
+
+    Features of one kind less than ``merge_px`` pixels apart are merged into a
+    single rect, and intron lines join the merged union of all features, so the
+    number of glyphs is bounded by the pixel width rather than the exon count.
+    When ``original`` (the uncompressed structure, segment for segment) is
+    given, also returns one dict per glyph with its exact genomic extent.
+    """
+    starts, ends, kinds = structure_arrays(gene_structure)
+    starts, ends = normalize(starts, ends, axis)
+    validate(starts, ends, kinds)
+    x0 = to_pixels(starts, scale, margin_x)
+    x1 = to_pixels(ends + 1, scale, margin_x)
+    if original is not None:
+        genomic_starts, genomic_ends, _ = structure_arrays(original)
+
+    rects = {}
+    glyphs = []
+    for kind, name, _ in KIND_FIELDS:
+        if kind not in DRAWN_KINDS:
+            continue
+        index = np.flatnonzero(kinds == kind)
+        order, first, block_x0, block_x1 = merge_blocks(x0[index], x1[index], merge_px)
+        rects[kind] = (block_x0.tolist(), (block_x1 - block_x0).tolist())
+        if original is None or len(index) == 0:
+            continue
+        members = index[order]
+        block_starts = np.minimum.reduceat(genomic_starts[members], first)
+        block_ends = np.maximum.reduceat(genomic_ends[members], first)
+        counts = np.diff(np.append(first, len(members)))
+        for values in zip(block_x0.tolist(), (block_x1 - block_x0).tolist(),
+                          block_starts.tolist(), block_ends.tolist(), counts.tolist()):
+            glyphs.append(dict(zip(('x', 'width', 'start', 'end', 'features'), values), kind=name))
+
+    drawn = np.isin(kinds, DRAWN_KINDS)
+    _, _, union_x0, union_x1 = merge_blocks(x0[drawn], x1[drawn], merge_px)
+    introns = (union_x1[:-1].tolist(), union_x0[1:].tolist())
+    if original is None:
+        return rects, introns
+    return rects, introns, glyphs
+
+
+INTRON_MODES = ('linear', 'fixed', 'log', 'capped')
+
+
+def compress_gaps(gaps, mode, intron_length):
+    """New lengths for intron gaps: unchanged, all ``intron_length``, log-scaled or capped."""
+    if mode == 'linear':
+        return gaps
+    if intron_length <= 0:
+        raise ValueError(f"intron_length must be positive: {intron_length}")
+    if mode == 'fixed':
+        return np.full_like(gaps, intron_length)
+    if mode == 'capped':
+        return np.minimum(gaps, intron_length)
+    if mode == 'log':
+        # close to linear for short introns, logarithmic beyond intron_length
+        return np.rint(intron_length * np.log2(1 + gaps / intron_length)).astype(np.int64)
+    raise ValueError(f"Unknown intron mode: {mode}")
+
+
+class IntronMap:
+    """Piecewise-linear genomic -> axis map that shrinks the gaps between exonic blocks.
+
+    Blocks are the union of the features of all given transcripts, so stacked
+    transcripts stay aligned. Positions inside a block keep 1 bp = 1 unit, so
+    feature lengths are exact; positions inside a gap scale with it.
+    """
+
+    def __init__(self, gene_structures, mode, intron_length=100):
+        starts, ends = [], []
+        for gene_structure in gene_structures:
+            s, e, _ = structure_arrays(gene_structure)
+            starts.append(s)
+            ends.append(e)
+        block_starts, block_ends = merge_segments(np.concatenate(starts), np.concatenate(ends))
+        gaps = compress_gaps(block_starts[1:] - block_ends[:-1] - 1, mode, intron_length)
+        lengths = block_ends - block_starts + 1
+        mapped_starts = block_starts[0] + np.concatenate(([0], np.cumsum(lengths[:-1] + gaps)))
+        self.genomic = np.column_stack((block_starts, block_ends + 1)).ravel()
+        self.mapped = np.column_stack((mapped_starts, mapped_starts + lengths)).ravel()
+
+    def __call__(self, positions):
+        return np.rint(np.interp(positions, self.genomic, self.mapped)).astype(np.int64)
+
+    def positions(self, positions):
+        starts = self([field(pos, 'start') for pos in positions]).tolist()
+        ends = self([field(pos, 'end') for pos in positions]).tolist()
+        return [dict(start=s, end=e) for s, e in zip(starts, ends)]
+
+    def structure(self, gene_structure):
+        """A dict copy of ``gene_structure`` with every coordinate mapped."""
+        start, end = self([field(gene_structure, 'start'), field(gene_structure, 'end')]).tolist()
+        mapped = {
+            'transcript_id': field(gene_structure, 'transcript_id'),
+            'strand': field(gene_structure, 'strand'),
+            'start': start,
+            'end': end,
+            'total_length': end - start,
+        }
+        for _, name, _ in KIND_FIELDS:
+            mapped[name] = self.positions(field(gene_structure, name))
+        variants = field(gene_structure, 'variants', [])
+        mapped['variants'] = [
+            dict(pos, kind=field(variant, 'kind'))
+            for pos, variant in zip(self.positions(variants), variants)
+        ]
+        return mapped
+
+
+def variant_layout(variants, axis, margin_x, scale=10):
+    """Pixel span ``(x1, x2)`` of each variant on ``axis``, as plain lists.
+
+    Spans cover whole bases like the feature rects. Insertions collapse to the
+    boundary after their anchor base (5' -> 3' after mirroring), so ``x1 == x2``.
+    """
+    starts = np.array([field(v, 'start') for v in variants], dtype=np.int64)
+    ends = np.array([field(v, 'end') for v in variants], dtype=np.int64)
+    insertion = np.array([field(v, 'kind') == 'insertion' for v in variants], dtype=bool)
+    starts, ends = normalize(starts, ends, axis)
+    x1 = to_pixels(starts, scale, margin_x)
+    x2 = to_pixels(ends + 1, scale, margin_x)
+    boundary = x1 if axis[2] else x2
+    x1 = np.where(insertion, boundary, x1)
+    x2 = np.where(insertion, boundary, x2)
+    return x1.tolist(), x2.tolist()
+
+
+def domain_segments(gene_structures, domains):
+    """Map protein domains to the genomic segments they cover, for many transcripts at once.
+
+    ``domains`` have 1-based inclusive amino-acid ``start``/``end`` and an
+    optional ``transcript_id``; a domain without one applies to every
+    transcript. Each domain's coding range (codons ``start`` to ``end``) is
+    intersected with every CDS segment of its transcript, taken 5' -> 3', so a
+    domain spanning introns comes back as one segment per exon. The
+    intersections of all domains with all segments are computed as flat
+    arrays in one pass. Ranges past the end of the CDS are clipped.
+
+    Returns ``(rows, domain_index, starts, ends)``: the transcript index and
+    the domain index of each segment and its genomic extent (1-based,
+    inclusive), grouped by transcript.
+    """
+    aa_starts = np.array([field(d, 'start') for d in domains], dtype=np.int64)
+    aa_ends = np.array([field(d, 'end') for d in domains], dtype=np.int64)
+    if len(domains) and (aa_starts.min() < 1 or (aa_starts > aa_ends).any()):
+        raise ValueError("Domains need 1 <= start <= end (amino-acid positions)")
+
+    # CDS segments of every transcript in transcript order, flattened
+    seg_starts, seg_ends, minus, counts = [], [], [], []
+    rows_by_id = {}
+    for row, gene_structure in enumerate(gene_structures):
+        starts, ends, kinds = structure_arrays(gene_structure)
+        starts, ends = merge_segments(starts[kinds == CDS], ends[kinds == CDS])
+        reverse = field(gene_structure, 'strand') == '-'
+        seg_starts.append(starts[::-1] if reverse else starts)
+        seg_ends.append(ends[::-1] if reverse else ends)
+        minus.append(np.full(len(starts), reverse))
+        counts.append(len(starts))
+        rows_by_id.setdefault(field(gene_structure, 'transcript_id'), []).append(row)
+    counts = np.array(counts, dtype=np.int64)
+    if not counts.sum():
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, empty, empty
+    seg_starts = np.concatenate(seg_starts)
+    seg_ends = np.concatenate(seg_ends)
+    minus = np.concatenate(minus)
+    seg_offsets = np.concatenate(([0], np.cumsum(counts)))
+
+    # coding (CDS-relative) range of each segment, restarting at 1 for every transcript
+    # (transcripts without a CDS repeat zero times, so clipping their offset is harmless)
+    lengths = seg_ends - seg_starts + 1
+    before = np.cumsum(lengths) - lengths
+    transcript_before = before[np.minimum(seg_offsets[:-1], len(before) - 1)]
+    coding_starts = before - np.repeat(transcript_before, counts) + 1
+    coding_ends = coding_starts + lengths - 1
+
+    # (transcript, domain) pairs, then every pair against each segment of its transcript
+    pair_rows, pair_domains = [], []
+    for i, domain in enumerate(domains):
+        transcript_id = field(domain, 'transcript_id', None)
+        rows = range(len(gene_structures)) if transcript_id is None else rows_by_id.get(transcript_id, [])
+        pair_rows.extend(rows)
+        pair_domains.extend([i] * len(rows))
+    pair_rows = np.array(pair_rows, dtype=np.int64)
+    pair_domains = np.array(pair_domains, dtype=np.int64)
+    order = np.argsort(pair_rows, kind='stable')
+    pair_rows, pair_domains = pair_rows[order], pair_domains[order]
+    per_pair = counts[pair_rows]
+    pair_first = np.cumsum(per_pair) - per_pair
+    within = np.arange(per_pair.sum()) - np.repeat(pair_first, per_pair)
+    segment = np.repeat(seg_offsets[pair_rows], per_pair) + within
+    domain = np.repeat(pair_domains, per_pair)
+
+    lo = np.maximum((aa_starts[domain] - 1) * 3 + 1, coding_starts[segment])
+    hi = np.minimum(aa_ends[domain] * 3, coding_ends[segment])
+    keep = lo <= hi
+    segment, domain, lo, hi = segment[keep], domain[keep], lo[keep], hi[keep]
+    into_lo = lo - coding_starts[segment]
+    into_hi = hi - coding_starts[segment]
+    reverse = minus[segment]
+    starts = np.where(reverse, seg_ends[segment] - into_hi, seg_starts[segment] + into_lo)
+    ends = np.where(reverse, seg_ends[segment] - into_lo, seg_starts[segment] + into_hi)
+    rows = np.repeat(np.arange(len(gene_structures)), counts)[segment]
+    return rows, domain, starts, ends
+
+
+def domain_layout(starts, ends, axis, margin_x, scale=10):
+    """Pixel ``(x, width)`` of domain segments on ``axis``, like the feature rects."""
+    starts, ends = normalize(starts, ends, axis)
+    return to_pixels(starts, scale, margin_x).tolist(), ((ends - starts + 1) / scale).tolist()
+
+
+def _result(values, scalar):
+    return values.item() if scalar else values
+
+
+def merge_blocks(starts, ends, gap=1):
+    """Sort intervals and group those at most ``gap`` apart.
+
+    Returns ``(order, first, block_starts, block_ends)``: the sort order, the
+    index (into the sorted intervals) where each block begins, and each block's
+    extent. With the default ``gap=1`` overlapping or abutting closed integer
+    intervals merge.
+    """
+    order = np.argsort(starts, kind='stable')
+    starts, ends = starts[order], ends[order]
+    if len(starts) == 0:
+        return order, np.zeros(0, dtype=np.int64), starts, ends
+    running_end = np.maximum.accumulate(ends)
+    new_block = np.empty(len(starts), dtype=bool)
+    new_block[0] = True
+    new_block[1:] = starts[1:] > running_end[:-1] + gap
+    first = np.flatnonzero(new_block)
+    last = np.append(first[1:], len(starts)) - 1
+    return order, first, starts[first], running_end[last]
+
+
+def merge_segments(starts, ends, gap=1):
+    """Sort closed intervals and merge overlapping or abutting ones."""
+    _, _, block_starts, block_ends = merge_blocks(starts, ends, gap)
+    return block_starts, block_ends
+
+
+def contains(starts, ends, positions):
+    """Whether each position lies in one of the sorted, disjoint intervals."""
+    positions = np.asarray(positions)
+    index = np.searchsorted(starts, positions, side='right') - 1
+    inside = (index >= 0) & (positions <= ends[np.clip(index, 0, None)])
+    return _result(inside, positions.ndim == 0)
+
+
+class CoordinateMapper:
+    """Genomic <-> cDNA <-> protein coordinate conversion for one transcript.
+
+    All coordinates are 1-based and inclusive. cDNA and protein positions count
+    5' -> 3' along the transcript, so minus-strand transcripts count down the
+    genome. Cumulative exon offsets are computed once; every lookup is a
+    ``searchsorted`` and accepts a scalar or an array. Positions that do not map
+    (intronic, outside the transcript, beyond the CDS) come back as -1.
+    """
+
+    def __init__(self, exon_starts, exon_ends, strand='+', cds_start=None, cds_end=None):
+        starts, ends = merge_segments(np.asarray(exon_starts, dtype=np.int64),
+                                      np.asarray(exon_ends, dtype=np.int64))
+        self.starts = starts
+        self.ends = ends
+        self.strand = strand
+        lengths = ends - starts + 1
+        # offset of each exon's 5' end in cDNA coordinates, indexed in genomic order
+        if strand == '-':
+            before = np.cumsum(lengths[::-1]) - lengths[::-1]
+            self.cdna_before = before[::-1]
+        else:
+            self.cdna_before = np.cumsum(lengths) - lengths
+        self.transcript_length = int(lengths.sum())
+        # cDNA end of each exon in transcript order, for cDNA -> genomic lookups
+        ordered_lengths = lengths[::-1] if strand == '-' else lengths
+        self.cdna_ends = np.cumsum(ordered_lengths)
+        self.cdna_starts = self.cdna_ends - ordered_lengths
+
+        self.cds_offset = None
+        if cds_start is not None and cds_end is not None:
+            first_base = cds_end if strand == '-' else cds_start
+            self.cds_offset = int(self.genomic_to_cdna(first_base)) - 1
+            self.cds_length = int(self.genomic_to_cdna(cds_start if strand == '-' else cds_end)) - self.cds_offset
+
+    @classmethod
+    def from_structure(cls, gene_structure):
+        """Build a mapper from a GeneStructureInfo (model or dict).
+
+        Exon rows are used when present; otherwise exons are reconstructed by
+        merging the CDS and UTR segments, as in IRGSP annotations.
+        """
+        starts, ends, kinds = structure_arrays(gene_structure)
+        exon = kinds == EXON
+        if not exon.any():
+            exon = np.isin(kinds, DRAWN_KINDS)
+        cds = kinds == CDS
+        cds_start = int(starts[cds].min()) if cds.any() else None
+        cds_end = int(ends[cds].max()) if cds.any() else None
+        return cls(starts[exon], ends[exon], field(gene_structure, 'strand'), cds_start, cds_end)
+
+    def _to_transcript_order(self, index):
+        return len(self.starts) - 1 - index if self.strand == '-' else index
+
+    def locate(self, genomic):
+        """Return ``(index, in_exon)`` for genomic positions.
+
+        ``index`` counts exons in transcript order when ``in_exon`` is true, and
+        otherwise the intron following exon ``index`` in transcript order. It is
+        -1 for positions outside the transcript.
+        """
+        genomic = np.asarray(genomic)
+        scalar = genomic.ndim == 0
+        genomic = np.atleast_1d(genomic)
+        left = np.searchsorted(self.starts, genomic, side='right') - 1
+        in_exon = (left >= 0) & (genomic <= self.ends[np.clip(left, 0, None)])
+        outside = (left < 0) | ((left == len(self.starts) - 1) & ~in_exon)
+        index = self._to_transcript_order(left)
+        if self.strand == '-':
+            # on the minus strand the intron after exon k (transcript order) lies left of it
+            index = np.where(in_exon, index, index - 1)
+        index = np.where(outside, -1, index)
+        return _result(index, scalar), _result(in_exon, scalar)
+
+    def genomic_to_cdna(self, genomic):
+        genomic = np.asarray(genomic)
+        scalar = genomic.ndim == 0
+        genomic = np.atleast_1d(genomic)
+        left = np.searchsorted(self.starts, genomic, side='right') - 1
+        safe = np.clip(left, 0, None)
+        in_exon = (left >= 0) & (genomic <= self.ends[safe])
+        if self.strand == '-':
+            cdna = self.cdna_before[safe] + (self.ends[safe] - genomic) + 1
+        else:
+            cdna = self.cdna_before[safe] + (genomic - self.starts[safe]) + 1
+        return _result(np.where(in_exon, cdna, -1), scalar)
+
+    def cdna_to_genomic(self, cdna):
+        cdna = np.asarray(cdna)
+        scalar = cdna.ndim == 0
+        cdna = np.atleast_1d(cdna)
+        valid = (cdna >= 1) & (cdna <= self.transcript_length)
+        t = np.clip(np.searchsorted(self.cdna_ends, cdna, side='left'), 0, len(self.starts) - 1)
+        offset = cdna - self.cdna_starts[t] - 1
+        genomic_index = self._to_transcript_order(t)
+        if self.strand == '-':
+            genomic = self.ends[genomic_index] - offset
+        else:
+            genomic = self.starts[genomic_index] + offset
+        return _result(np.where(valid, genomic, -1), scalar)
+
+    def protein_to_cdna(self, aa):
+        """cDNA position of the first base of each codon."""
+        self._require_cds()
+        aa = np.asarray(aa)
+        valid = (aa >= 1) & (aa * 3 <= self.cds_length)
+        return _result(np.where(valid, self.cds_offset + (aa - 1) * 3 + 1, -1), aa.ndim == 0)
+
+    def cdna_to_protein(self, cdna):
+        self._require_cds()
+        cdna = np.asarray(cdna)
+        coding = cdna - self.cds_offset
+        valid = (coding >= 1) & (coding <= self.cds_length)
+        return _result(np.where(valid, (coding - 1) // 3 + 1, -1), cdna.ndim == 0)
+
+    def protein_to_genomic(self, aa):
+        cdna = np.asarray(self.protein_to_cdna(aa))
+        genomic = self.cdna_to_genomic(np.where(cdna > 0, cdna, 0))
+        return _result(np.where(cdna > 0, genomic, -1), cdna.ndim == 0)
+
+    def genomic_to_protein(self, genomic):
+        cdna = np.asarray(self.genomic_to_cdna(genomic))
+        protein = self.cdna_to_protein(np.where(cdna > 0, cdna, 0))
+        return _result(np.where(cdna > 0, protein, -1), cdna.ndim == 0)
+
+    def _require_cds(self):
+        if self.cds_offset is None:
+            raise ValueError("Transcript has no CDS")
@@ -0,0 +1,169 @@
+import time
+
+import numpy as np
+import pytest
+
+from api.geometry import (
+    CDS, EXON, FIVE_PRIME_UTR, THREE_PRIME_UTR, CoordinateMapper, IntronMap, contains, domain_segments,
+    get_axis, lod_layout, normalize, structure_arrays, transcript_layout, validate,
+)
+
+
+def make_structure(n_segments, strand='+', seg_len=100, gap=50):
+    starts = 1000 + np.arange(n_segments) * (seg_len + gap)
+    cds = [{'start': int(s), 'end': int(s + seg_len - 1)} for s in starts]
+    return {
+        'transcript_id': 't1',
+        'strand': strand,
+        'start': cds[0]['start'],
+        'end': cds[-1]['end'],
+        'total_length': cds[-1]['end'] - cds[0]['start'],
+        'exons': [],
+        'cds': cds,
+        'five_prime_utrs': [],
+        'three_prime_utrs': [],
+    }
+
+
+def test_structure_arrays_tags_kinds():
+    structure = make_structure(2)
+    structure['five_prime_utrs'] = [{'start': 900, 'end': 999}]
+    structure['exons'] = [{'start': 900, 'end': 1099}]
+    starts, ends, kinds = structure_arrays(structure)
+    assert kinds.tolist() == [CDS, CDS, FIVE_PRIME_UTR, EXON]
+    assert starts.tolist() == [1000, 1150, 900, 900]
+
+
+def test_normalize_flips_minus_strand():
+    structure = make_structure(2, strand='-')
+    axis = get_axis([structure])
+    assert axis == (1000, 1249, True)
+    starts, ends, _ = structure_arrays(structure)
+    starts, ends = normalize(starts, ends, axis)
+    assert starts.tolist() == [150, 0]
+    assert ends.tolist() == [249, 99]
+
+
+def test_validate_names_the_bad_kind():
+    starts = np.array([1, 10])
+    ends = np.array([5, 9])
+    with pytest.raises(ValueError, match="3' UTR"):
+        validate(starts, ends, np.array([CDS, THREE_PRIME_UTR]))
+    validate(np.array([5]), np.array([5]), np.array([CDS]))
+
+
+def test_transcript_layout_orders_introns_by_end():
+    structure = make_structure(3)
+    rects, introns = transcript_layout(structure, get_axis([structure]), margin_x=50)
+    assert rects[CDS] == ([50.0, 65.0, 80.0], [10.0, 10.0, 10.0])
+    assert rects[THREE_PRIME_UTR] == ([], [])
+    assert introns == ([59.9, 74.9], [65.0, 80.0])
+
+
+def test_transcript_layout_scales_to_large_transcripts():
+    structure = make_structure(20000, strand='-')
+    began = time.perf_counter()
+    rects, introns = transcript_layout(structure, get_axis([structure]), margin_x=50)
+    assert time.perf_counter() - began < 1.0
+    assert len(rects[CDS][0]) == 20000
+    assert len(introns[0]) == 19999
+
+
+def test_coordinate_mapper_plus_strand():
+    mapper = CoordinateMapper([30, 10], [39, 19], '+', cds_start=12, cds_end=35)
+    assert mapper.genomic_to_cdna([10, 19, 20, 30, 39]).tolist() == [1, 10, -1, 11, 20]
+    assert mapper.cdna_to_genomic(np.arange(9, 13)).tolist() == [18, 19, 30, 31]
+    assert mapper.protein_to_genomic(4) == 31
+    assert mapper.genomic_to_protein([12, 15, 35]).tolist() == [1, 2, 5]
+    assert mapper.protein_to_genomic(5) == -1
+    index, in_exon = mapper.locate([5, 10, 25, 39, 45])
+    assert index.tolist() == [-1, 0, 0, 1, -1]
+    assert in_exon.tolist() == [False, True, False, True, False]
+
+
+def test_coordinate_mapper_minus_strand():
+    mapper = CoordinateMapper([10, 30], [19, 39], '-', cds_start=12, cds_end=35)
+    assert mapper.genomic_to_cdna([39, 30, 19, 10]).tolist() == [1, 10, 11, 20]
+    assert mapper.cdna_to_genomic([1, 10, 11, 20]).tolist() == [39, 30, 19, 10]
+    assert mapper.protein_to_genomic([1, 2]).tolist() == [35, 32]
+    assert mapper.locate(25) == (0, False)
+    assert mapper.locate(10) == (1, True)
+
+
+def test_coordinate_mapper_merges_cds_and_utrs_into_exons():
+    structure = make_structure(2)
+    structure['five_prime_utrs'] = [{'start': 900, 'end': 999}]
+    mapper = CoordinateMapper.from_structure(structure)
+    assert mapper.starts.tolist() == [900, 1150]
+    assert mapper.cdna_to_protein(101) == 1
+    assert mapper.transcript_length == 300
+
+
+def test_contains_uses_sorted_intervals():
+    starts, ends = np.array([1, 10]), np.array([5, 20])
+    assert contains(starts, ends, [0, 1, 6, 20, 21]).tolist() == [False, True, False, True, False]
+    assert contains(starts, ends, 3) is True
+
+
+def test_lod_layout_merges_sub_pixel_features():
+    structure = make_structure(10000)
+    original = dict(structure)
+    axis = get_axis([structure])
+    scale = (axis[1] - axis[0]) / 1000
+    rects, introns, glyphs = lod_layout(structure, axis, 50, scale, original=original)
+
+    # 150 bp per segment is far below one pixel, so everything becomes one glyph
+    assert len(rects[CDS][0]) == 1
+    assert introns == ([], [])
+    assert glyphs == [{'x': 50.0, 'width': pytest.approx(1000, rel=1e-3), 'start': 1000,
+                       'end': structure['end'], 'features': 10000, 'kind': 'cds'}]
+
+
+@pytest.mark.parametrize('mode, gap', [('linear', 50000), ('fixed', 100), ('capped', 100), ('log', 897)])
+def test_intron_map_compresses_gaps_between_blocks(mode, gap):
+    structure = make_structure(3, gap=50000)
+    mapped = IntronMap([structure], mode, intron_length=100).structure(structure)
+
+    # exons keep their length; only the introns shrink
+    lengths = [pos['end'] - pos['start'] for pos in mapped['cds']]
+    gaps = [b['start'] - a['end'] - 1 for a, b in zip(mapped['cds'], mapped['cds'][1:])]
+    assert lengths == [99, 99, 99]
+    assert gaps == [gap, gap]
+    assert mapped['start'] == 1000
+    assert mapped['end'] == mapped['cds'][-1]['end']
+
+
+def test_intron_map_rejects_unknown_mode():
+    with pytest.raises(ValueError, match='Unknown intron mode'):
+        IntronMap([make_structure(2)], 'squash')
+
+
+def test_domain_segments_split_at_exon_boundaries_on_both_strands():
+    plus, minus = make_structure(4, seg_len=99), make_structure(4, strand='-', seg_len=99)
+    minus['transcript_id'] = 't2'
+    domains = [{'start': 30, 'end': 40}, {'start': 100, 'end': 500}, {'start': 1, 'end': 5, 'transcript_id': 't2'}]
+    rows, domain_index, starts, ends = domain_segments([plus, minus], domains)
+
+    for row, structure in enumerate([plus, minus]):
+        mapper = CoordinateMapper.from_structure(structure)
+        for i, domain in enumerate(domains):
+            if domain.get('transcript_id', structure['transcript_id']) != structure['transcript_id']:
+                assert not ((rows == row) & (domain_index == i)).any()
+                continue
+            # every base of the domain's codons, clipped to the CDS (132 codons)
+            last = min(domain['end'], mapper.cds_length // 3)
+            cdna = np.arange(mapper.protein_to_cdna(domain['start']), mapper.protein_to_cdna(last) + 3)
+            expected = set(mapper.cdna_to_genomic(cdna).tolist())
+            mask = (rows == row) & (domain_index == i)
+            covered = [set(range(start, end + 1)) for start, end in zip(starts[mask], ends[mask])]
+            assert set().union(*covered) == expected
+    # 30-40 aa spans the first exon boundary (99 bp = 33 codons) on both strands
+    assert ((rows == 0) & (domain_index == 0)).sum() == 2
+    assert ((rows == 1) & (domain_index == 0)).sum() == 2
+
+
+def test_domain_segments_rejects_bad_ranges():
+    with pytest.raises(ValueError):
+        domain_segments([make_structure(2)], [{'start': 10, 'end': 5}])
+    rows, _, _, _ = domain_segments([make_structure(2)], [{'start': 1000, 'end': 2000}])
+    assert len(rows) == 0
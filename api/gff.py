@@ -0,0 +1,428 @@
+"""GFF3 helpers shared by the FastAPI app and the GeneSTRUCTURE CLI."""
+import bisect
+import gzip
+import heapq
+import itertools
+import json
+import logging
+import os
+import re
+import zlib
+from urllib.parse import unquote
+
+from api.bgzf import GZIP_MAGIC, BgzfReader, is_bgzf, scan_blocks
+
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPT_TYPES = {'mrna'}
+STRUCTURE_KEYS = {
+    'cds': 'cds',
+    'exon': 'exons',
+    'five_prime_utr': 'five_prime_utrs',
+    'three_prime_utr': 'three_prime_utrs',
+}
+STRUCTURE_TYPES = set(STRUCTURE_KEYS)
+
+INDEX_SUFFIX = '.gsidx'
+INDEX_VERSION = 3
+
+
+def parse_attributes(column):
+    """Parse a GFF3 attribute column into ``{key: [values]}``."""
+    attributes = {}
+    for field in column.strip().split(';'):
+        if not field:
+            continue
+        key, _, value = field.partition('=')
+        attributes[key.strip()] = [unquote(v) for v in value.split(',')]
+    return attributes
+
+
+def row_keys(fields):
+    """IDs a structure row belongs to: ID for mRNAs, Parent for their children."""
+    feature_type = fields[2].lower()
+    attributes = parse_attributes(fields[8])
+    if feature_type in TRANSCRIPT_TYPES:
+        return attributes.get('ID', [])
+    if feature_type in STRUCTURE_TYPES:
+        return attributes.get('Parent', [])
+    return []
+
+
+def strip_prefix(feature_id):
+    # Ensembl GFF3 prefixes IDs with the feature type ("transcript:EER90453")
+    _, sep, rest = feature_id.partition(':')
+    return rest if sep else None
+
+
+def new_transcript(fields, attributes, transcript_id):
+    start, end = int(fields[3]), int(fields[4])
+    return {
+        'transcript_id': transcript_id,
+        'seq_id': fields[0],
+        'strand': fields[6],
+        'total_length': end - start,
+        'exons': [],
+        'cds': [],
+        'five_prime_utrs': [],
+        'three_prime_utrs': [],
+        'start': start,
+        'end': end,
+        'attributes': attributes,
+    }
+
+
+class TranscriptParser:
+    """Push-style GFF3 transcript parser.
+
+    mRNA rows open a record and CDS/exon/UTR rows are grouped into it by
+    Parent. ``feed`` returns the records no later row can belong to: on a
+    ``###`` directive, a new seqid, or the first row starting past their end
+    (GFF3 files are coordinate sorted). Only transcripts overlapping the current
+    position are held in memory. Records have the shape of ``GeneStructureInfo``
+    in ``api/index.py``.
+    """
+
+    def __init__(self):
+        self.open_transcripts = {}
+        self.closing = []
+        self.orphans = {}
+        self.order = itertools.count()
+        self.seq_id = None
+
+    def _pop_until(self, position):
+        done = []
+        while self.closing and (position is None or self.closing[0][0] < position):
+            _, _, transcript_id = heapq.heappop(self.closing)
+            done.append(self.open_transcripts.pop(transcript_id))
+        return done
+
+    def feed(self, line):
+        """Consume one line and return the transcripts it completed."""
+        if line.startswith('###'):
+            self.orphans.clear()
+            return self._pop_until(None)
+        if line.startswith('#') or not line.strip():
+            return []
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) != 9:
+            return []
+
+        done = []
+        if fields[0] != self.seq_id:
+            done = self._pop_until(None)
+            self.orphans.clear()
+            self.seq_id = fields[0]
+
+        start = int(fields[3])
+        done.extend(self._pop_until(start))
+
+        feature_type = fields[2].lower()
+        if feature_type in TRANSCRIPT_TYPES:
+            attributes = parse_attributes(fields[8])
+            for transcript_id in attributes.get('ID', []):
+                if transcript_id in self.open_transcripts:
+                    continue
+                record = new_transcript(fields, attributes, transcript_id)
+                for key, position in self.orphans.pop(transcript_id, []):
+                    record[key].append(position)
+                self.open_transcripts[transcript_id] = record
+                heapq.heappush(self.closing, (record['end'], next(self.order), transcript_id))
+        elif feature_type in STRUCTURE_TYPES:
+            key = STRUCTURE_KEYS[feature_type]
+            position = {'start': start, 'end': int(fields[4])}
+            for parent in parse_attributes(fields[8]).get('Parent', []):
+                if parent in self.open_transcripts:
+                    self.open_transcripts[parent][key].append(position)
+                else:
+                    self.orphans.setdefault(parent, []).append((key, position))
+        return done
+
+    def close(self):
+        """Return every transcript still open at the end of the input."""
+        self.orphans.clear()
+        return self._pop_until(None)
+
+
+def is_gzipped(path):
+    with open(path, mode='rb') as inp:
+        return inp.read(2) == GZIP_MAGIC
+
+
+def open_gff(path):
+    """Open a GFF3 file for a full pass as text, decompressing gzip and BGZF on the fly."""
+    if is_gzipped(path):
+        return gzip.open(path, mode='rt', encoding='utf-8')
+    return open(path, mode='r', encoding='utf-8')
+
+
+def iter_transcripts(lines):
+    """Stream transcript records out of GFF3 text lines in a single pass."""
+    parser = TranscriptParser()
+    for line in lines:
+        yield from parser.feed(line)
+    yield from parser.close()
+
+
+REGION_PATTERN = re.compile(r'^\s*(\S+?):([\d,]+)(?:-|\.\.)([\d,]+)\s*$')
+
+
+def parse_region(region):
+    """Parse ``chr:start-end`` (1-based, inclusive, commas allowed) into ``(seq_id, start, end)``."""
+    match = REGION_PATTERN.match(region)
+    if match is None:
+        raise ValueError(f'Invalid region "{region}", expected chr:start-end.')
+    seq_id = match.group(1)
+    start, end = (int(match.group(i).replace(',', '')) for i in (2, 3))
+    if start < 1 or end < start:
+        raise ValueError(f'Invalid region "{region}": start must be at least 1 and not after end.')
+    return seq_id, start, end
+
+
+class RegionIndex:
+    """Per-seqid interval index of ``(start, end, value)`` entries.
+
+    Entries are sorted by start, with the running maximum of their ends kept
+    alongside. Entries starting after the query end are cut off by one bisect
+    on the starts and those wholly before the query start by one bisect on the
+    (non-decreasing) running maximum, so a query costs O(log n + k) plus any
+    entries nested inside a longer one that ends within the query.
+    """
+
+    def __init__(self, entries=()):
+        by_seq_id = {}
+        for seq_id, start, end, value in entries:
+            by_seq_id.setdefault(seq_id, []).append((start, end, value))
+        self.entries = {}
+        for seq_id, items in by_seq_id.items():
+            items.sort(key=lambda item: (item[0], item[1]))
+            self.entries[seq_id] = items
+        self._build()
+
+    @classmethod
+    def from_json(cls, data):
+        index = cls()
+        index.entries = {seq_id: [tuple(item) for item in items] for seq_id, items in data.items()}
+        index._build()
+        return index
+
+    def to_json(self):
+        return self.entries
+
+    def _build(self):
+        self.starts = {}
+        self.max_ends = {}
+        for seq_id, items in self.entries.items():
+            self.starts[seq_id] = [item[0] for item in items]
+            self.max_ends[seq_id] = list(itertools.accumulate((item[1] for item in items), max))
+
+    def __len__(self):
+        return sum(len(items) for items in self.entries.values())
+
+    def query(self, seq_id, start, end):
+        """Values of the entries overlapping ``start..end`` (inclusive), in start order."""
+        items = self.entries.get(seq_id)
+        if not items:
+            return []
+        lo = bisect.bisect_left(self.max_ends[seq_id], start)
+        hi = bisect.bisect_right(self.starts[seq_id], end)
+        return [value for item_start, item_end, value in items[lo:hi] if item_end >= start]
+
+
+class LineDecoder:
+    """Split a stream of byte chunks into text lines, gunzipping on the fly.
+
+    Gzip input is detected from its magic bytes; multi-member files (including
+    bgzip output) are decompressed member by member.
+    """
+
+    def __init__(self, encoding='utf-8'):
+        self.encoding = encoding
+        self.gzipped = None
+        self.decompressor = None
+        self.buffer = b''
+
+    def _decompress(self, chunk):
+        out = []
+        while chunk:
+            if self.decompressor is None:
+                self.decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+            out.append(self.decompressor.decompress(chunk))
+            chunk = b''
+            if self.decompressor.eof:
+                chunk = self.decompressor.unused_data
+                self.decompressor = None
+        return b''.join(out)
+
+    def feed(self, chunk):
+        if self.gzipped is None:
+            self.buffer += chunk
+            if len(self.buffer) < 2:
+                return []
+            chunk, self.buffer = self.buffer, b''
+            self.gzipped = chunk[:2] == GZIP_MAGIC
+        if self.gzipped:
+            chunk = self._decompress(chunk)
+        data = self.buffer + chunk
+        lines = data.split(b'\n')
+        self.buffer = lines.pop()
+        return [line.decode(self.encoding) for line in lines]
+
+    def close(self):
+        if self.decompressor is not None:
+            self.buffer += self.decompressor.flush()
+            self.decompressor = None
+        lines = [self.buffer.decode(self.encoding)] if self.buffer else []
+        self.buffer = b''
+        return lines
+
+
+class GffIndex:
+    """On-disk index of transcript rows in a GFF3 file.
+
+    Maps every mRNA ID to the byte spans (offset, length, first line, line count)
+    of its own row and its CDS/exon/UTR children, so a lookup seeks straight to
+    those rows instead of rescanning the whole file. mRNA extents also go into a
+    ``RegionIndex`` for ``chr:start-end`` queries. The index is stored next to
+    the GFF as ``<gff_path>.gsidx`` and rebuilt whenever the GFF's size or mtime
+    changes.
+
+    Compressed GFFs are indexed by uncompressed offsets. For BGZF (``bgzip``)
+    files the index also keeps the block table, so a lookup decompresses only
+    the blocks holding its rows; plain gzip has to be decompressed from the
+    start on every lookup.
+    """
+
+    def __init__(self, gff_path, index_path=None):
+        self.gff_path = gff_path
+        self.index_path = index_path or gff_path + INDEX_SUFFIX
+        self.signature = None
+        self.spans = {}
+        self.aliases = {}
+        self.regions = RegionIndex()
+        self.compression = None
+        self.blocks = None
+        self._load_or_build()
+
+    def _current_signature(self):
+        stat = os.stat(self.gff_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _load_or_build(self):
+        signature = self._current_signature()
+        try:
+            with open(self.index_path, mode='r') as inp:
+                data = json.load(inp)
+            if data.get('version') == INDEX_VERSION and data.get('signature') == signature:
+                self.signature = signature
+                self.spans = data['spans']
+                self.aliases = data['aliases']
+                self.regions = RegionIndex.from_json(data['regions'])
+                self.compression = data['compression']
+                self.blocks = data['blocks']
+                return
+        except (OSError, ValueError, KeyError):
+            pass
+        self.build(signature)
+
+    def build(self, signature=None):
+        signature = signature or self._current_signature()
+        spans = {}
+        extents = []
+        offset = 0
+        compression, blocks = None, None
+        if is_bgzf(self.gff_path):
+            compression, blocks = 'bgzf', list(scan_blocks(self.gff_path))
+        elif is_gzipped(self.gff_path):
+            compression = 'gzip'
+            logger.warning(f'"{self.gff_path}" is plain gzip, so every lookup decompresses it from the start; '
+                           'recompress it with bgzip for random access.')
+        opener = gzip.open if compression else open
+        with opener(self.gff_path, mode='rb') as inp:
+            for line_no, raw in enumerate(inp):
+                length = len(raw)
+                if not raw.startswith(b'#'):
+                    fields = raw.decode('utf-8').rstrip('\r\n').split('\t')
+                    if len(fields) == 9:
+                        keys = row_keys(fields)
+                        if fields[2].lower() in TRANSCRIPT_TYPES:
+                            extents.extend((fields[0], int(fields[3]), int(fields[4]), key) for key in keys)
+                        for key in keys:
+                            key_spans = spans.setdefault(key, [])
+                            last = key_spans[-1] if key_spans else None
+                            if last is not None and last[0] + last[1] == offset:
+                                last[1] += length
+                                last[3] += 1
+                            else:
+                                key_spans.append([offset, length, line_no, 1])
+                offset += length
+
+        aliases = {}
+        for key in spans:
+            alias = strip_prefix(key)
+            if alias and alias not in spans:
+                aliases[alias] = key
+
+        self.signature = signature
+        self.spans = spans
+        self.aliases = aliases
+        self.regions = RegionIndex(extents)
+        self.compression = compression
+        self.blocks = blocks
+        try:
+            with open(self.index_path, mode='w') as out:
+                json.dump({'version': INDEX_VERSION, 'signature': signature,
+                           'spans': spans, 'aliases': aliases, 'regions': self.regions.to_json(),
+                           'compression': compression, 'blocks': blocks}, out)
+        except OSError as e:
+            logger.warning(f'Could not write GFF index "{self.index_path}": {e}')
+
+    def _open(self):
+        """Binary file seekable by uncompressed offset."""
+        if self.compression == 'bgzf':
+            return BgzfReader(self.gff_path, self.blocks)
+        if self.compression == 'gzip':
+            return gzip.open(self.gff_path, mode='rb')
+        return open(self.gff_path, mode='rb')
+
+    def refresh(self):
+        """Rebuild the index if the GFF changed since it was built."""
+        if self._current_signature() != self.signature:
+            self.build()
+
+    def resolve(self, transcript_id):
+        if transcript_id in self.spans:
+            return transcript_id
+        return self.aliases.get(transcript_id)
+
+    def __contains__(self, transcript_id):
+        return self.resolve(transcript_id) is not None
+
+    def records(self, transcript_id):
+        """Return the split rows of ``transcript_id`` and its children, in file order."""
+        self.refresh()
+        key = self.resolve(transcript_id)
+        if key is None:
+            return []
+
+        rows = []
+        with self._open() as inp:
+            for offset, length, _, _ in self.spans[key]:
+                inp.seek(offset)
+                for raw in inp.read(length).splitlines():
+                    fields = raw.decode('utf-8').split('\t')
+                    if key in row_keys(fields):
+                        rows.append(fields)
+        return rows
+
+    def structure(self, transcript_id):
+        """Return the ``GeneStructureInfo``-shaped record of ``transcript_id``, or None."""
+        rows = self.records(transcript_id)
+        return next(iter_transcripts('\t'.join(fields) for fields in rows), None)
+
+    def region(self, seq_id, start, end):
+        """Return the records of every transcript overlapping ``seq_id:start-end``, in start order."""
+        self.refresh()
+        structures = (self.structure(key) for key in self.regions.query(seq_id, start, end))
+        return [structure for structure in structures if structure is not None]
@@ -0,0 +1,135 @@
+import gzip
+import os
+import random
+import shutil
+
+import pytest
+
+from api import bgzf
+from api.gff import GffIndex, RegionIndex, iter_transcripts, open_gff, parse_attributes, parse_region
+
+
+UTILS_DIR = os.path.join(os.path.dirname(__file__), '..', 'app', 'utils')
+RICE_GFF = os.path.join(UTILS_DIR, 'transcripts.gff')
+SORGHUM_GFF = os.path.join(UTILS_DIR, 'Sorghum_bicolor.Sorghum_bicolor_NCBIv3.51.gff3')
+
+
+@pytest.fixture
+def rice_gff(tmp_path):
+    path = tmp_path / 'transcripts.gff'
+    shutil.copy(RICE_GFF, path)
+    return str(path)
+
+
+def test_parse_attributes():
+    attributes = parse_attributes('ID=a;Parent=b,c;Note=x%3By')
+    assert attributes == {'ID': ['a'], 'Parent': ['b', 'c'], 'Note': ['x;y']}
+
+
+def test_index_returns_exact_transcript_rows(rice_gff):
+    index = GffIndex(rice_gff)
+    rows = index.records('Os01t0100100-01')
+    assert [row[2] for row in rows].count('mRNA') == 1
+    assert len(rows) == 15
+    assert index.records('Os01t0100100') == []
+    assert os.path.exists(rice_gff + '.gsidx')
+
+
+def test_index_resolves_ensembl_prefix(tmp_path):
+    path = tmp_path / 'sorghum.gff3'
+    shutil.copy(SORGHUM_GFF, path)
+    index = GffIndex(str(path))
+    assert index.resolve('EER90453') == 'transcript:EER90453'
+    assert [row[2] for row in index.records('EER90453')] == ['mRNA', 'exon', 'CDS', 'exon', 'CDS']
+
+
+def test_index_rebuilds_when_gff_changes(rice_gff):
+    index = GffIndex(rice_gff)
+    assert 'Os99t0000000-01' not in index
+    with open(rice_gff, 'a') as out:
+        out.write('chr99\tsrc\tmRNA\t1\t100\t.\t+\t.\tID=Os99t0000000-01\n')
+        out.write('chr99\tsrc\tCDS\t1\t100\t.\t+\t0\tParent=Os99t0000000-01\n')
+    assert len(index.records('Os99t0000000-01')) == 2
+    assert 'Os99t0000000-01' in GffIndex(rice_gff)
+
+
+def test_iter_transcripts_reads_every_transcript():
+    with open(RICE_GFF) as inp:
+        transcripts = {t['transcript_id']: t for t in iter_transcripts(inp)}
+    assert len(transcripts) == 15
+    first = transcripts['Os01t0100100-01']
+    assert (first['start'], first['end'], first['strand']) == (2983, 10815, '+')
+    assert len(first['cds']) == 10
+    assert len(first['five_prime_utrs']) == 2
+    assert first['three_prime_utrs'][-1] == {'start': 10504, 'end': 10815}
+
+
+def test_iter_transcripts_yields_each_transcript_when_its_block_ends():
+    lines = [
+        'chr1\tsrc\tmRNA\t1\t100\t.\t+\t.\tID=t1\n',
+        'chr1\tsrc\tCDS\t1\t100\t.\t+\t0\tParent=t1\n',
+        'chr1\tsrc\tmRNA\t200\t300\t.\t-\t.\tID=t2\n',
+        'chr1\tsrc\texon\t200\t300\t.\t-\t.\tParent=t2\n',
+    ]
+    consumed = []
+
+    def tracked():
+        for line in lines:
+            consumed.append(line)
+            yield line
+
+    transcripts = iter_transcripts(tracked())
+    assert next(transcripts)['transcript_id'] == 't1'
+    assert len(consumed) == 3
+    assert next(transcripts)['exons'] == [{'start': 200, 'end': 300}]
+
+
+def test_parse_region():
+    assert parse_region('chr01:1,000-2,000') == ('chr01', 1000, 2000)
+    assert parse_region('scaffold_1:5..10') == ('scaffold_1', 5, 10)
+    with pytest.raises(ValueError):
+        parse_region('chr01:2000-1000')
+    with pytest.raises(ValueError):
+        parse_region('chr01')
+
+
+def test_region_index_matches_linear_scan():
+    rng = random.Random(1)
+    entries = []
+    for i in range(2000):
+        start = rng.randrange(1, 100000)
+        # a few long entries so that short ones nest inside them
+        entries.append(('chr1', start, start + rng.choice([50, 500, 20000]), i))
+    index = RegionIndex(entries)
+    for _ in range(200):
+        start = rng.randrange(1, 100000)
+        end = start + rng.randrange(0, 5000)
+        expected = {i for _, s, e, i in entries if s <= end and e >= start}
+        assert set(index.query('chr1', start, end)) == expected
+    assert index.query('chr2', 1, 100) == []
+
+
+def test_index_returns_transcripts_in_region(rice_gff):
+    structures = GffIndex(rice_gff).region('chr01', 12000, 13000)
+    assert [s['transcript_id'] for s in structures] == [
+        'Os01t0100200-01', 'Os01t0100300-00', 'Os01t0100400-01', 'Os01t0100466-00']
+    # the region index is stored with the spans and reloaded
+    assert len(GffIndex(rice_gff).regions) == 15
+
+
+@pytest.mark.parametrize('compress', [bgzf.compress, gzip.compress])
+def test_index_reads_compressed_gff(tmp_path, compress):
+    with open(RICE_GFF, 'rb') as inp:
+        data = inp.read()
+    path = tmp_path / 'transcripts.gff.gz'
+    path.write_bytes(compress(data))
+    index = GffIndex(str(path))
+    assert index.compression == ('bgzf' if compress is bgzf.compress else 'gzip')
+    with open(RICE_GFF) as inp:
+        expected = list(iter_transcripts(inp))
+    with open_gff(str(path)) as inp:
+        assert list(iter_transcripts(inp)) == expected
+    for record in expected:
+        assert index.structure(record['transcript_id']) == record
+    # a reloaded index keeps the block table
+    assert GffIndex(str(path)).blocks == index.blocks
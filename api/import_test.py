@@ -0,0 +1,57 @@
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+HEAVY_MODULES = ('numpy', 'svgwrite', 'reportlab', 'PIL', 'multiprocessing')
+# api.index の import にかかる時間 (fastapi / pydantic の import を除く) の上限
+IMPORT_BUDGET_S = float(os.environ.get('IMPORT_BUDGET_S', 0.25))
+
+COLD_START = """
+import json, sys, time
+import fastapi, pydantic
+started = time.perf_counter()
+import api.index
+seconds = time.perf_counter() - started
+heavy = {heavy!r}
+loaded = {{'import': [m for m in heavy if m in sys.modules]}}
+
+from fastapi.testclient import TestClient
+client = TestClient(api.index.app)
+client.get('/api/py/')
+client.get('/api/py/render-cache')
+body = open({gff!r}, 'rb').read()
+annotation_id = client.post('/api/py/annotations', content=body).json()['annotation_id']
+client.get(f'/api/py/annotations/{{annotation_id}}/transcripts')
+loaded['light'] = [m for m in heavy if m in sys.modules]
+
+client.post('/api/py/generate-gene-structure-svg', json={{
+    'draw_settings': {{'mode': 'gene', 'utr_color': '#d3d3d3', 'exon_color': '#0077cc',
+                      'line_color': '#000000', 'intron_shape': 'straight'}},
+    'annotation_id': annotation_id,
+    'transcript_id': 'Os01t0100100-01',
+}})
+loaded['svg'] = [m for m in heavy if m in sys.modules]
+print(json.dumps({{'seconds': seconds, 'loaded': loaded}}))
+"""
+
+
+def cold_start():
+    code = COLD_START.format(heavy=HEAVY_MODULES, gff=os.path.join(ROOT, 'app', 'utils', 'transcripts.gff'))
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_light_endpoints_import_nothing_heavy():
+    loaded = cold_start()['loaded']
+    assert loaded['import'] == []
+    assert loaded['light'] == []
+    # SVG の描画で初めて numpy と svgwrite が読み込まれ、PNG/PDF 用のモジュールは読み込まれない
+    assert 'numpy' in loaded['svg'] and 'svgwrite' in loaded['svg']
+    assert 'reportlab' not in loaded['svg'] and 'PIL' not in loaded['svg']
+
+
+def test_import_time_budget():
+    seconds = min(cold_start()['seconds'] for _ in range(3))
+    assert seconds < IMPORT_BUDGET_S, f'import api.index took {seconds * 1000:.0f} ms'
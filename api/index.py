@@ -1,23 +1,49 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
-from fastapi.responses import FileResponse, Response
-from fastapi.middleware.cors import CORSMiddleware
+from fastapi import FastAPI, HTTPException, Request, Header
+from fastapi.responses import FileResponse, Response, StreamingResponse
+import asyncio
 import os
-from reportlab.pdfgen import canvas
-import numpy as np
+import time
 from pydantic import BaseModel
 from typing import Optional, List
-import io
-import svgwrite
-import colorsys
+import itertools
+import json
+import re
+import tempfile
+import uuid
+import zlib
+from collections import OrderedDict
+
+from api.cache import RenderCache, content_key
+from api.executor import RenderQueue, Saturated
+from api.gff import LineDecoder, RegionIndex, TranscriptParser, parse_region
+from api import metrics
+
+# サーバーレス関数のコールドスタートを速くするため、numpy / svgwrite / reportlab / Pillow を
+# 使うモジュール (api.render, api.raster, api.variants) は最初に使うエンドポイントの中で import する。
+# ヘルスチェックやアノテーションの一覧はこれらを読み込まない (api/import_test.py で確認している)
 
 
 ### Create FastAPI instance with custom docs and openapi url
 app = FastAPI(docs_url="/api/py/docs", openapi_url="/api/py/openapi.json")
+if metrics.ENABLED:
+    app.add_middleware(metrics.ReceiveTimer)
 
 class Position(BaseModel):
     start: int
     end: int
 
+# VCF から読み込んだ変異 (start/end は欠失・置換された塩基の範囲、insertion は挿入直前の塩基)
+class Variant(BaseModel):
+    start: int
+    end: int
+    kind: str
+    ref: Optional[str] = None
+    alt: Optional[str] = None
+    id: Optional[str] = None
+    context: Optional[str] = None
+    cdna: Optional[int] = None
+    protein: Optional[int] = None
+
 # 遺伝子構造情報のモデルを追加
 class GeneStructureInfo(BaseModel):
     transcript_id: str
@@ -29,6 +55,16 @@ class GeneStructureInfo(BaseModel):
     three_prime_utrs: List[Position]
     start: int
     end: int
+    variants: List[Variant] = []
+
+# タンパク質ドメイン (start/end はアミノ酸の位置、1 始まりで両端を含む)
+# transcript_id を省くと全転写産物に描く。color を省くと name ごとに既定の色を割り当てる
+class Domain(BaseModel):
+    start: int
+    end: int
+    transcript_id: Optional[str] = None
+    name: Optional[str] = None
+    color: Optional[str] = None
 
 class DrawSettings(BaseModel):
     mode: str
@@ -39,448 +75,659 @@ class DrawSettings(BaseModel):
     gene_h: int = 20
     margin_x: int = 50
     margin_y: int = 100
-    domains: Optional[List[dict]] = None
+    deletion_shape: str = "zigzag"
+    variant_color: str = "#d62728"
+    # LOD レイアウト: width (px) に収まる縮尺で描き、イントロンを圧縮する (linear|fixed|log|capped)
+    width: Optional[int] = None
+    intron_mode: str = "linear"
+    intron_length: int = 100
+    # True なら同じスタイルの要素を1つの <path> にまとめた軽量な SVG を返す
+    merge_paths: bool = False
+    # mode が "domain" のとき描くドメイン
+    domains: Optional[List[Domain]] = None
 
 # リクエストモデルの定義を更新
+# gene_structure を送る代わりに、アップロード済みアノテーションの
+# annotation_id と transcript_id だけを指定してもよい
 class GeneStructureRequest(BaseModel):
     draw_settings: DrawSettings
-    gene_structure: GeneStructureInfo
-
-def cDNA_pos2gDNA_pos(cDNA_exon_pos, domain_cDNA_pos, cumsum_intron_len):
-    x2 = np.sort(np.append(cDNA_exon_pos, domain_cDNA_pos))
-    index = int(np.where(x2 == domain_cDNA_pos)[0])
-    gDNA_pos = domain_cDNA_pos + cumsum_intron_len[index-1]
-    return gDNA_pos
-
-def color_convert(color16):
-    color = color16.lstrip('#')
-    color = list(color)
-
-    lib = {'A':10, 'B':11, 'C':12, 'D':13, 'E':14, 'F':15,
-            'a':10, 'b':11, 'c':12, 'd':13, 'e':14, 'f':15}
-
-    for i,j in lib.items():
-        for k,l in enumerate(color):
-            if l == i:
-                color[k] = j
-
-    color = np.array([int(i) for i in color]).reshape(-1,2)
-    RGB_255 = color @ np.array([16**1, 16**0]).T
-    RGB_1 = RGB_255/255
-
-    return RGB_1
+    gene_structure: Optional[GeneStructureInfo] = None
+    annotation_id: Optional[str] = None
+    transcript_id: Optional[str] = None
+
+# PNG / PDF 出力のリクエスト (描画内容は GeneStructureRequest と同じ)
+class ExportRequest(GeneStructureRequest):
+    format: str = "png"
+    dpi: int = 300
+    background: str = "white"
+
+# 複数の転写産物を1枚の SVG にまとめて描画するリクエスト
+class BatchGeneStructureRequest(BaseModel):
+    draw_settings: DrawSettings
+    gene_structures: List[GeneStructureInfo] = []
+    annotation_id: Optional[str] = None
+    transcript_ids: List[str] = []
+    # chr:start-end。アップロード済みアノテーションのうち、この範囲に重なる転写産物をすべて描く
+    region: Optional[str] = None
+
+# アップロードされたアノテーション (annotation_id -> {transcript_id: structure})
+MAX_ANNOTATIONS = 8
+annotations = OrderedDict()
+# annotation_id -> RegionIndex (region 指定のリクエストが来たときに作る)
+region_indexes = {}
+# annotation_id -> api.search.SearchIndex (最初の検索で作る)
+search_indexes = {}
+MAX_SEARCH_RESULTS = 100
+
+# SNAPSHOT_DIR の <名前>.gssnap (python -m api.snapshot で作る) は annotation_id に名前を指定して使える
+# mmap で開くのでアップロードも GFF のパースも要らず、使った転写産物だけがメモリに載る
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR")
+SNAPSHOT_NAME = re.compile(r"^[A-Za-z0-9_-][A-Za-z0-9._-]*$")
+snapshots = {}
+
+def get_snapshot(annotation_id):
+    if not SNAPSHOT_DIR or not SNAPSHOT_NAME.match(annotation_id):
+        return None
+    transcripts = snapshots.get(annotation_id)
+    if transcripts is None:
+        path = os.path.join(SNAPSHOT_DIR, annotation_id + ".gssnap")
+        if not os.path.isfile(path):
+            return None
+        from api.snapshot import Snapshot, SnapshotTranscripts
+
+        transcripts = snapshots[annotation_id] = SnapshotTranscripts(Snapshot(path))
+    return transcripts
+
+def get_annotation(annotation_id):
+    transcripts = annotations.get(annotation_id)
+    if transcripts is None:
+        transcripts = get_snapshot(annotation_id)
+        if transcripts is None:
+            raise HTTPException(status_code=404, detail=f"Annotation {annotation_id} not found.")
+        return transcripts
+    annotations.move_to_end(annotation_id)
+    return transcripts
+
+def resolve_gene_structure(request):
+    if request.gene_structure is not None:
+        return request.gene_structure
+    if request.annotation_id is None or request.transcript_id is None:
+        raise HTTPException(status_code=400, detail="Provide gene_structure or annotation_id and transcript_id.")
+    structure = get_annotation(request.annotation_id).get(request.transcript_id)
+    if structure is None:
+        raise HTTPException(status_code=404, detail=f"Transcript {request.transcript_id} not found.")
+    return GeneStructureInfo(**structure)
+
+def get_region_index(annotation_id):
+    transcripts = get_annotation(annotation_id)
+    # スナップショットは自前の区間索引を持つ
+    if hasattr(transcripts, "query"):
+        return transcripts
+    index = region_indexes.get(annotation_id)
+    if index is None:
+        index = region_indexes[annotation_id] = RegionIndex(
+            (s["seq_id"], s["start"], s["end"], s["transcript_id"]) for s in transcripts.values())
+    return index
+
+def get_search_index(annotation_id):
+    from api.search import SearchIndex, structure_entries
+
+    transcripts = get_annotation(annotation_id)
+    index = search_indexes.get(annotation_id)
+    if index is None:
+        # スナップショットはレコードを作らずに列から直接読む
+        if hasattr(transcripts, "search_entries"):
+            entries = transcripts.search_entries()
+        else:
+            entries = structure_entries(transcripts.values())
+        index = search_indexes[annotation_id] = SearchIndex(entries)
+    return index
+
+def requested_transcript_ids(request):
+    """transcript_ids に、region と重なる転写産物の ID を開始位置順に加える"""
+    transcript_ids = list(request.transcript_ids)
+    if request.region:
+        if request.annotation_id is None:
+            raise HTTPException(status_code=400, detail="region requires annotation_id.")
+        try:
+            seq_id, start, end = parse_region(request.region)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        transcripts = get_annotation(request.annotation_id)
+        # CDS のない転写産物 (ncRNA など) は描画できないので region からは除く
+        in_region = [
+            transcript_id for transcript_id in get_region_index(request.annotation_id).query(seq_id, start, end)
+            if transcripts[transcript_id]["cds"]
+        ]
+        if not in_region:
+            raise HTTPException(status_code=404, detail=f"No transcripts in {request.region}.")
+        transcript_ids.extend(in_region)
+    return transcript_ids
+
+def resolve_gene_structures(request):
+    gene_structures = list(request.gene_structures)
+    transcript_ids = requested_transcript_ids(request)
+    if transcript_ids:
+        if request.annotation_id is None:
+            raise HTTPException(status_code=400, detail="transcript_ids require annotation_id.")
+        transcripts = get_annotation(request.annotation_id)
+        for transcript_id in transcript_ids:
+            structure = transcripts.get(transcript_id)
+            if structure is None:
+                raise HTTPException(status_code=404, detail=f"Transcript {transcript_id} not found.")
+            gene_structures.append(GeneStructureInfo(**structure))
+    if not gene_structures:
+        raise HTTPException(status_code=400, detail="No gene structures provided.")
+    return gene_structures
+
+def iter_batch_items(request):
+    """バッチの各要素を (transcript_id, GeneStructureInfo or None) として1件ずつ返す"""
+    for gene_structure in request.gene_structures:
+        yield gene_structure.transcript_id, gene_structure
+    transcript_ids = requested_transcript_ids(request)
+    if transcript_ids:
+        transcripts = get_annotation(request.annotation_id)
+        for transcript_id in transcript_ids:
+            structure = transcripts.get(transcript_id)
+            yield transcript_id, None if structure is None else GeneStructureInfo(**structure)
+
+def transcript_summary(structure):
+    return {
+        "transcript_id": structure["transcript_id"],
+        "seq_id": structure["seq_id"],
+        "strand": structure["strand"],
+        "start": structure["start"],
+        "end": structure["end"],
+        "parent": structure["attributes"].get("Parent", [None])[0],
+    }
+
+def transcript_page(annotation_id, transcripts, offset, limit):
+    # スナップショットの全転写産物を作らないよう、必要な範囲だけを取り出す
+    start = max(offset, 0)
+    transcript_ids = itertools.islice(transcripts, start, max(start + limit, start))
+    structures = [transcripts[transcript_id] for transcript_id in transcript_ids]
+    return {
+        "annotation_id": annotation_id,
+        "total": len(transcripts),
+        "offset": offset,
+        "limit": limit,
+        "transcripts": [transcript_summary(s) for s in structures],
+    }
 
 @app.get("/api/py/")
 def health_check():
     return {"message": "Hello from FastAPI"}
 
-def lighten_color(hex_color, factor):
-    hex_color = hex_color.lstrip('#')
-    r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-    h, l, s = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
-    l = min(1.0, l + factor * (1.0 - l))
-    r_new, g_new, b_new = colorsys.hls_to_rgb(h, l, s)
-    return '#{:02x}{:02x}{:02x}'.format(int(r_new * 255), int(g_new * 255), int(b_new * 255))
-
+@app.post("/api/py/annotations")
+async def upload_annotation(request: Request, limit: int = 100):
+    """GFF3 (gzip 可) をリクエストボディとしてストリーミングで受け取り、逐次パースする"""
+    decoder = LineDecoder()
+    parser = TranscriptParser()
+    transcripts = {}
+    try:
+        async for chunk in request.stream():
+            for line in decoder.feed(chunk):
+                for structure in parser.feed(line):
+                    transcripts[structure["transcript_id"]] = structure
+        for line in decoder.close():
+            for structure in parser.feed(line):
+                transcripts[structure["transcript_id"]] = structure
+        for structure in parser.close():
+            transcripts[structure["transcript_id"]] = structure
+    except (zlib.error, UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse GFF: {e}")
+
+    if not transcripts:
+        raise HTTPException(status_code=400, detail="No mRNA features found.")
+
+    annotation_id = uuid.uuid4().hex
+    annotations[annotation_id] = transcripts
+    while len(annotations) > MAX_ANNOTATIONS:
+        evicted, _ = annotations.popitem(last=False)
+        region_indexes.pop(evicted, None)
+        search_indexes.pop(evicted, None)
+
+    return transcript_page(annotation_id, transcripts, 0, limit)
+
+@app.post("/api/py/annotations/{annotation_id}/variants")
+async def upload_variants(annotation_id: str, request: Request):
+    """VCF (gzip 可) を受け取り、アップロード済みの転写産物に変異を割り当てる
+
+    変異と転写産物をそれぞれ座標順に並べて1回の走査で重なりを求めるので、
+    変異ごとに全転写産物を調べることはない。前回の割り当ては置き換える。
+    """
+    from api.variants import annotate_variants, assign_variants, iter_vcf
+
+    transcripts = get_annotation(annotation_id)
+    decoder = LineDecoder()
+    variants = []
+    try:
+        async for chunk in request.stream():
+            variants.extend(iter_vcf(decoder.feed(chunk)))
+        variants.extend(iter_vcf(decoder.close()))
+    except (zlib.error, UnicodeDecodeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Could not parse VCF: {e}")
+
+    if hasattr(transcripts, "set_variants"):
+        # スナップショットは変異と重なる転写産物のレコードだけを作る
+        structures = {s["transcript_id"]: s for s in transcripts.overlapping(variants)}
+        assigned = assign_variants(structures.values(), variants)
+        transcripts.set_variants({
+            transcript_id: annotate_variants(structures[transcript_id], v) for transcript_id, v in assigned.items()
+        })
+    else:
+        assigned = assign_variants(transcripts.values(), variants)
+        for transcript_id, structure in transcripts.items():
+            structure["variants"] = annotate_variants(structure, assigned.get(transcript_id, []))
+
+    return {
+        "annotation_id": annotation_id,
+        "variants": len(variants),
+        "transcripts": {transcript_id: len(v) for transcript_id, v in assigned.items()},
+    }
+
+@app.get("/api/py/annotations/{annotation_id}/transcripts")
+def list_transcripts(annotation_id: str, offset: int = 0, limit: int = 100):
+    return transcript_page(annotation_id, get_annotation(annotation_id), offset, limit)
+
+@app.get("/api/py/annotations/{annotation_id}/search")
+def search_transcripts(annotation_id: str, q: str = "", limit: int = 20):
+    """転写産物 ID・Name・Locus_id・Parent を完全一致、前方一致、あいまい (3-gram) 一致の順に検索する"""
+    limit = min(max(limit, 1), MAX_SEARCH_RESULTS)
+    return {
+        "annotation_id": annotation_id,
+        "query": q,
+        "results": get_search_index(annotation_id).search(q, limit),
+    }
+
+# 描画結果のキャッシュ (描画設定 + 遺伝子構造のハッシュがキー)
+render_cache = RenderCache(int(os.environ.get("RENDER_CACHE_BYTES", 64 * 1024 * 1024)))
+
+def etag_matches(if_none_match, etag):
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+def svg_cache_key(gene_structures, draw_settings):
+    return content_key({
+        "draw_settings": draw_settings.model_dump(mode="json"),
+        "gene_structures": [gs.model_dump(mode="json") for gs in gene_structures],
+    })
+
+# SVG の描画は CPU を使うので、イベントループの外 (スレッドまたはプロセス) で行う
+# 同時に描画するのは RENDER_WORKERS 件まで、待ちは RENDER_QUEUE 件までで、それを超えたら 503 を返す
+RENDER_EXECUTOR = os.environ.get("RENDER_EXECUTOR", "thread")
+RENDER_WORKERS = int(os.environ.get("RENDER_WORKERS", min(4, os.cpu_count() or 1)))
+RENDER_QUEUE = int(os.environ.get("RENDER_QUEUE", RENDER_WORKERS * 4))
+render_queue = RenderQueue(RENDER_EXECUTOR, RENDER_WORKERS, RENDER_QUEUE)
+
+def render_svg_job(gene_structures, draw_settings, timed):
+    """ワーカーで描画し、(SVG, 段階ごとの時間, 値) を返す (プロセスにも渡せるよう計測は戻り値で返す)"""
+    from api.render import render_gene_structures_svg
+
+    timings = metrics.Timings() if timed else metrics.NULL_TIMINGS
+    content = render_gene_structures_svg(gene_structures, draw_settings, timings=timings).encode("utf-8")
+    if not timed:
+        return content, {}, {}
+    return content, timings.durations, timings.values
+
+async def cached_svg(key, gene_structures, draw_settings, timings=metrics.NULL_TIMINGS, shed=True):
+    async def compute():
+        wait, (content, durations, values) = await render_queue.run(
+            render_svg_job, gene_structures, draw_settings, timings.enabled, shed=shed)
+        timings.add("queue", wait)
+        for name, seconds in durations.items():
+            timings.add(name, seconds)
+        for name, value in values.items():
+            timings.set(name, value)
+        if timings.enabled:
+            metrics.QUEUE_WAIT_SECONDS.observe(wait)
+        return content
+
+    return await render_cache.get_or_compute(key, compute)
+
+def request_timings(http_request):
+    """ReceiveTimer が記録した受信時刻から計測を始め、ここまでの時間を "parse" とする"""
+    received = getattr(http_request.state, "received", None)
+    timings = metrics.new_timings(received)
+    if received is not None:
+        timings.add("parse", time.perf_counter() - received)
+    return timings
+
+async def cached_svg_response(gene_structures, draw_settings, if_none_match, timings=metrics.NULL_TIMINGS, endpoint="svg", key=None):
+    if key is None:
+        with timings.stage("key"):
+            key = svg_cache_key(gene_structures, draw_settings)
+    # 同じ入力からは常に同じ SVG が生成されるので、キーをそのまま strong ETag にする
+    headers = {"ETag": f'"{key}"', "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        response = Response(status_code=304, headers=headers)
+    else:
+        try:
+            svg_content = await cached_svg(key, gene_structures, draw_settings, timings)
+        except Saturated as e:
+            metrics.record(endpoint, timings, "rejected")
+            raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+        timings.set("bytes", len(svg_content))
+        response = Response(
+            content=svg_content,
+            media_type="image/svg+xml",
+            headers=headers,
+        )
+    if timings.enabled:
+        # 描画した場合だけ要素数が記録される
+        if response.status_code == 304:
+            cache = "not_modified"
+        else:
+            cache = "miss" if "elements" in timings.values else "hit"
+        response.headers["Server-Timing"] = timings.server_timing(cache=cache)
+        metrics.record(endpoint, timings, cache)
+    return response
+
+
+# PNG / PDF の描画は CPU を使うので、イベントループを塞がないよう上限付きのプロセスプールで行う
+# EXPORT_WORKERS=0 ならプロセスを作らずスレッドで描画する (プロセスを起動できない環境向け)
+EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", min(4, os.cpu_count() or 1)))
+MAX_EXPORT_DPI = 1200
+MAX_EXPORT_PIXELS = int(os.environ.get("MAX_EXPORT_PIXELS", 50_000_000))
+export_pool = None
+
+def get_export_pool():
+    global export_pool
+    if export_pool is None and EXPORT_WORKERS > 0:
+        from concurrent.futures import ProcessPoolExecutor
+
+        export_pool = ProcessPoolExecutor(max_workers=EXPORT_WORKERS)
+    return export_pool
+
+def check_export(request, gene_structures):
+    from api.raster import BACKGROUNDS, FORMATS, image_size
+
+    if request.format not in FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown format: {request.format}")
+    if request.background not in BACKGROUNDS:
+        raise HTTPException(status_code=400, detail=f"Unknown background: {request.background}")
+    if not 1 <= request.dpi <= MAX_EXPORT_DPI:
+        raise HTTPException(status_code=400, detail=f"dpi must be between 1 and {MAX_EXPORT_DPI}.")
+    width, height = image_size(gene_structures, request.draw_settings, request.format, request.dpi)
+    if request.format == "png" and width * height > MAX_EXPORT_PIXELS:
+        raise HTTPException(status_code=400, detail=f"Image of {width}x{height} pixels is too large; lower the dpi.")
+
+async def cached_image_response(gene_structures, request, if_none_match):
+    from api.raster import FORMATS, render_image_job
+
+    key = content_key({
+        "format": request.format,
+        "dpi": request.dpi if request.format == "png" else None,
+        "background": request.background,
+        "draw_settings": request.draw_settings.model_dump(mode="json"),
+        "gene_structures": [gs.model_dump(mode="json") for gs in gene_structures],
+    })
+    headers = {"ETag": f'"{key}"', "Cache-Control": "no-cache"}
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    args = (
+        [gs.model_dump(mode="json") for gs in gene_structures],
+        request.draw_settings.model_dump(mode="json"),
+        request.format,
+        request.dpi,
+        request.background,
+    )
+
+    async def compute():
+        pool = get_export_pool()
+        if pool is None:
+            return await asyncio.to_thread(render_image_job, *args)
+        return await asyncio.get_running_loop().run_in_executor(pool, render_image_job, *args)
+
+    content = await render_cache.get_or_compute(key, compute)
+    return Response(content=content, media_type=FORMATS[request.format], headers=headers)
+
+
+# 大きなバッチは非同期ジョブとして受け付け、リクエストとは独立にワーカープールで描画する
+# ジョブの状態は JOBS_DIR の SQLite、結果は同じディレクトリの NDJSON に保存する
+JOBS_DIR = os.environ.get("JOBS_DIR", os.path.join(tempfile.gettempdir(), "genestructure-jobs"))
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", os.cpu_count() or 1))
+job_pool = None
+job_runner = None
+
+def get_job_pool():
+    global job_pool
+    if job_pool is None and JOB_WORKERS > 0:
+        from concurrent.futures import ProcessPoolExecutor
+
+        job_pool = ProcessPoolExecutor(max_workers=JOB_WORKERS)
+    return job_pool
+
+def get_job_runner():
+    global job_runner
+    if job_runner is None:
+        from api.jobs import JobRunner, JobStore
+
+        job_runner = JobRunner(JobStore(JOBS_DIR), get_job_pool, window=max(JOB_WORKERS, 1) * 2)
+    return job_runner
+
+def job_status(job):
+    status = {name: job[name] for name in ("status", "total", "done", "failed", "error", "created", "updated")}
+    status["job_id"] = job["id"]
+    status["result_url"] = f"/api/py/jobs/{job['id']}/result" if job["status"] == "done" else None
+    return status
+
+@app.post("/api/py/jobs", status_code=202)
+async def submit_job(request: BatchGeneStructureRequest):
+    """転写産物ごとの SVG を描画するジョブを登録する (同じ入力なら既存のジョブを返す)"""
+    gene_structures = resolve_gene_structures(request)
+    job = get_job_runner().submit(
+        [gs.model_dump(mode="json") for gs in gene_structures],
+        request.draw_settings.model_dump(mode="json"),
+    )
+    return job_status(job)
+
+def get_job(job_id):
+    job = get_job_runner().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} not found.")
+    return job
+
+@app.get("/api/py/jobs/{job_id}")
+def get_job_status(job_id: str):
+    return job_status(get_job(job_id))
+
+@app.get("/api/py/jobs/{job_id}/result")
+def get_job_result(job_id: str):
+    """完了したジョブの結果を NDJSON (1行1転写産物、ストリーミング出力と同じ形式) で返す"""
+    job = get_job(job_id)
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Job {job_id} is {job['status']}.")
+    path = get_job_runner().store.result_path(job["key"])
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail=f"The result of job {job_id} is no longer available.")
+    return FileResponse(path, media_type="application/x-ndjson", filename=f"{job_id}.ndjson")
+
+
+@app.get("/api/py/render-cache")
+def render_cache_stats():
+    return render_cache.stats()
+
+
+@app.get("/api/py/render-queue")
+def render_queue_stats():
+    return render_queue.stats()
+
+
+@app.get("/api/py/metrics")
+def metrics_endpoint():
+    """Prometheus のテキスト形式で描画のメトリクスを返す"""
+    if not metrics.ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics are disabled.")
+    stats = render_cache.stats()
+    extra = []
+    for name in ("entries", "bytes", "hits", "misses", "coalesced"):
+        extra.extend(metrics.gauge_lines(f"genestructure_render_cache_{name}", f"Render cache {name}.", stats[name]))
+    stats = render_queue.stats()
+    for name in ("in_flight", "queued", "rejected"):
+        extra.extend(metrics.gauge_lines(f"genestructure_render_queue_{name}", f"Render queue {name}.", stats[name]))
+    return Response(content=metrics.render_metrics(extra), media_type="text/plain; version=0.0.4")
 
-def get_or_create_gradient(dwg, base_color, grad_dict):
-    if base_color in grad_dict:
-        return grad_dict[base_color]
 
-    grad_id = f'grad_{len(grad_dict)}'
-    light_color = lighten_color(base_color, 0.4)
-    lighter_color = lighten_color(base_color, 0.7)
+@app.post("/api/py/generate-gene-structure-svg")
+async def generate_gene_structure_svg(request: GeneStructureRequest, http_request: Request, if_none_match: Optional[str] = Header(None)):
+    timings = request_timings(http_request)
+    try:
+        gene_structure = resolve_gene_structure(request)
 
-    grad = dwg.linearGradient(start=('0%', '100%'), end=('0%', '0%'), id=grad_id)
-    grad.add_stop_color(offset='0.0', color=base_color)
-    grad.add_stop_color(offset='0.5', color=light_color)
-    grad.add_stop_color(offset='1.0', color=lighter_color)
-    dwg.defs.add(grad)
+        # SVG内容をレスポンスとして返却
+        return await cached_svg_response([gene_structure], request.draw_settings, if_none_match, timings, "svg")
 
-    grad_dict[base_color] = grad_id
-    return grad_id
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"SVG遺伝子構造の生成中にエラーが発生しました: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-# deletion の両端が exon 内に含まれていなければ exon_pos に追加
-def is_position_in_exon(exon_pos, pos):
-    print("exon_pos", len(exon_pos))
-    for i in range(0, len(exon_pos), 2):
-        if exon_pos[i] <= pos <= exon_pos[i+1]:
-            return True
-    return False
 
-# def update_exon_positions_with_deletion(exon_pos, del_pos, cds_pos):
-#     del_pos = del_pos + np.min(cds_pos)
-#     del_start, del_end = del_pos[0], del_pos[1]
+@app.post("/api/py/generate-gene-structures-svg")
+async def generate_gene_structures_svg(request: BatchGeneStructureRequest, http_request: Request, if_none_match: Optional[str] = Header(None)):
+    timings = request_timings(http_request)
+    try:
+        gene_structures = resolve_gene_structures(request)
+        return await cached_svg_response(gene_structures, request.draw_settings, if_none_match, timings, "svgs")
 
-#     is_del_end_in_exon = True
-#     is_del_start_in_exon = True
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"SVG遺伝子構造の生成中にエラーが発生しました: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-#     if not is_position_in_exon(exon_pos, del_end):
-#         exon_pos = np.append(exon_pos, del_end)
-#         is_del_end_in_exon = False
 
-#     if not is_position_in_exon(exon_pos, del_start):
-#         exon_pos = np.append(exon_pos, del_start)
-#         is_del_start_in_exon = False
+@app.post("/api/py/generate-gene-structures-columnar")
+async def generate_gene_structures_columnar(http_request: Request, if_none_match: Optional[str] = Header(None)):
+    """generate-gene-structures-svg と同じ SVG を、列指向 (starts[] / ends[]) のリクエストから描画する
 
-#     # deletion の開始・終了点も exon_pos に追加
-#     exon_pos = np.append(exon_pos, del_pos)
+    JSON・MessagePack・バイナリの形式は api/columnar.py を参照。
+    feature ごとの pydantic モデルを作らず、NumPy 配列へ直接デコードする。
+    """
+    from api.columnar import UnsupportedEncoding, decode_request, request_key
 
-#     # ソートして deletion 範囲内の部分を除去
-#     exon_pos.sort()
-#     updated_exon_pos = exon_pos[(exon_pos <= del_start) | (exon_pos >= del_end)]
+    timings = request_timings(http_request)
+    content_type = http_request.headers.get("content-type")
+    try:
+        body = await http_request.body()
+        with timings.stage("decode"):
+            draw_settings, gene_structures = decode_request(body, content_type)
+            draw_settings = DrawSettings(**draw_settings)
+        key = request_key(body, content_type)
+        return await cached_svg_response(gene_structures, draw_settings, if_none_match, timings, "columnar", key)
+
+    except HTTPException:
+        raise
+    except UnsupportedEncoding as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"SVG遺伝子構造の生成中にエラーが発生しました: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-#     return updated_exon_pos, is_del_start_in_exon, is_del_end_in_exon
-    
 
-@app.post("/api/py/generate-gene-structure-svg")
-async def generate_gene_structure_svg(request: GeneStructureRequest):
+@app.post("/api/py/export-gene-structure")
+async def export_gene_structure(request: ExportRequest, if_none_match: Optional[str] = Header(None)):
+    """SVG と同じレイアウトを PNG (dpi 指定) または PDF としてサーバー側で描画する"""
     try:
-        if not request.gene_structure.exons and not request.gene_structure.cds:
-            raise HTTPException(status_code=400, detail="No exons or cds positions provided.")
-        if not request.gene_structure.cds:
-            raise HTTPException(status_code=400, detail="Not implemented")
-
-        min_pos = min(request.gene_structure.start, request.gene_structure.end)
-        if request.gene_structure.strand == '+':
-            exon_pos = [Position(start=pos.start - min_pos, end=pos.end - min_pos) for pos in request.gene_structure.exons]
-            cds_pos = [Position(start=pos.start - min_pos, end=pos.end - min_pos) for pos in request.gene_structure.cds]
-            five_prime_UTR = [Position(start=pos.start - min_pos, end=pos.end - min_pos) for pos in request.gene_structure.five_prime_utrs]
-            three_prime_UTR = [Position(start=pos.start - min_pos, end=pos.end - min_pos) for pos in request.gene_structure.three_prime_utrs]
-        else:
-            exon_pos = [Position(start=pos.end - min_pos, end=pos.start - min_pos) for pos in request.gene_structure.exons]
-            cds_pos = [Position(start=pos.end - min_pos, end=pos.start - min_pos) for pos in request.gene_structure.cds]
-            five_prime_UTR = [Position(start=pos.end - min_pos, end=pos.start - min_pos) for pos in request.gene_structure.five_prime_utrs]
-            three_prime_UTR = [Position(start=pos.end - min_pos, end=pos.start - min_pos) for pos in request.gene_structure.three_prime_utrs]
-        # start < endになっているか確認
-        assert all(pos.start < pos.end for pos in exon_pos), "Exon positions must have start < end"
-        assert all(pos.start < pos.end for pos in cds_pos), "CDS positions must have start < end"
-        assert all(pos.start < pos.end for pos in five_prime_UTR), "5' UTR positions must have start < end"
-        assert all(pos.start < pos.end for pos in three_prime_UTR), "3' UTR positions must have start < end"
-
-        # exon_pos, is_del_start_in_exon, is_del_end_in_exon = update_exon_positions_with_deletion(exon_pos, del_pos, exon_pos)
-        is_del_start_in_exon = False
-        is_del_end_in_exon = False
-
-        # SVGの作成
-        margin_x = 50
-        margin_y = 100
-        gene_h = 20
-        center_line_y = margin_y + gene_h / 2
-        utr_gradation = "on"
-        exon_gradation = "on"
-        # exon_color = "#0077cc"
-        # utr_color = "#d3d3d3"
-        # line_color = "#000000"
-        deletion_shape = "zigzag"
-
-        dwg = svgwrite.Drawing(
-            size=(request.gene_structure.total_length/10 + margin_x * 2, gene_h + margin_y * 2),
-            profile='tiny',
-        )
-        
-        grad_dict = {}
+        gene_structure = resolve_gene_structure(request)
+        check_export(request, [gene_structure])
+        return await cached_image_response([gene_structure], request, if_none_match)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print(f"画像の出力中にエラーが発生しました: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
 
-        if utr_gradation == "on":
-            utr_color = f'url(#{get_or_create_gradient(dwg, request.draw_settings.utr_color, grad_dict)})'
-        else:
-            utr_color = request.draw_settings.utr_color
 
-        if exon_gradation == "on":
-            exon_color = f'url(#{get_or_create_gradient(dwg, request.draw_settings.exon_color, grad_dict)})'
-        else:
-            exon_color = request.draw_settings.exon_color
-
-        stroke_width = 1
-        stroke = "on"
-
-        # deletion_flag = del_pos[0]/10 + 50
-
-        ######################################
-        # Exon の描画
-        ######################################
-
-        for pos in cds_pos:
-            dwg.add(dwg.rect(
-                insert=(pos.start/10 + margin_x, margin_y),
-                size=(np.abs(pos.end-pos.start+1) / 10, gene_h),
-                fill=exon_color,
-                stroke="none" if stroke == "off" else request.draw_settings.line_color,
-                stroke_width=stroke_width,
-            ))
-
-        # for i in range(0, len(x), 2):
-        #     dwg.add(
-        #         dwg.rect(
-        #             insert=(x[i], margin_y),
-        #             size=(exon_intron_length[i], gene_h),
-        #             fill=exon_color,
-        #             stroke="none" if stroke == "off" else line_color,
-        #             stroke_width=stroke_width
-        #         )
-        #     )
-
-        ######################################
-        # UTR の描画
-        ######################################
-
-        for pos in five_prime_UTR:
-            dwg.add(dwg.rect(
-                insert=(pos.start/10 + margin_x, margin_y),
-                size=(np.abs(pos.end-pos.start+1) / 10, gene_h),
-                fill=utr_color,
-                stroke="none" if stroke == "off" else request.draw_settings.line_color,
-                stroke_width=stroke_width
-            ))
-        
-        for pos in three_prime_UTR:
-            dwg.add(dwg.rect(
-                insert=(pos.start/10 + margin_x, margin_y),
-                size=(np.abs(pos.end-pos.start+1) / 10, gene_h),
-                fill=utr_color,
-                stroke="none" if stroke == "off" else request.draw_settings.line_color,
-                stroke_width=stroke_width
-            ))
-
-        # # five_prime_UTR = x[x < np.min(cds_pos)]
-
-        # for i in range(0, len(five_prime_UTR), 2):
-        #     dwg.add(dwg.rect(
-        #         insert=(five_prime_UTR[i], margin_y),
-        #         size=(exon_intron_length[i], gene_h),
-        #         fill=utr_color,
-        #         stroke="none" if stroke == "off" else line_color,
-        #         stroke_width=stroke_width
-        #     ))
-
-        # # three_prime_UTR = x[x > np.max(cds_pos)]
-        # three_prime_UTR_length = np.asarray([(three_prime_UTR[i+1] - three_prime_UTR[i]) for i in range(len(three_prime_UTR)-1)])
-
-
-        # for i in range(0, len(three_prime_UTR), 2):
-        #     if i == len(three_prime_UTR) - 2:
-        #         x0 = three_prime_UTR[i]       # 左端
-        #         x1 = three_prime_UTR[i+1]     # 右端
-        #         x2 = x1 + 10               # 矢印先端
-
-        #         y0 = margin_y                 # 上端
-        #         y1 = margin_y + gene_h        # 下端
-
-        #         # 順序: 左上→左下→右下→右上→矢印先端（中央）
-        #         dwg.add(dwg.polygon(
-        #             points=[
-        #                 (x0, y0),
-        #                 (x0, y1),
-        #                 (x1, y1),
-        #                 (x2, center_line_y),
-        #                 (x1, y0)
-        #             ],
-        #             fill=utr_color,
-        #             stroke="none" if stroke == "off" else line_color,
-        #             stroke_width=stroke_width
-        #         ))
-
-        #     else:
-        #         dwg.add(dwg.rect(
-        #             insert=(three_prime_UTR[i], margin_y),
-        #             size=(three_prime_UTR_length[i], gene_h),
-        #             fill=utr_color,
-        #             # fill=exon_fill,
-        #             stroke="none" if stroke == "off" else line_color,
-        #             stroke_width=stroke_width
-        #         ))
-
-        ######################################
-        # Intron の描画
-        ######################################
-
-        all_positions = cds_pos + five_prime_UTR + three_prime_UTR
-        all_positions.sort(key=lambda pos: pos.end)
-        for i in range(0, len(all_positions) - 1):
-            pos1 = all_positions[i]
-            pos2 = all_positions[i + 1]
-            dwg.add(dwg.line(
-                start=(pos1.end/10 + margin_x, center_line_y),
-                end=(pos2.start/10 + margin_x, center_line_y),
-                stroke=request.draw_settings.line_color,
-                stroke_width=stroke_width,
-            ))
-
-
-        ######################################
-        # 最後を矢印状にする
-        ######################################
-
-
-        # ######################################
-        # # Deletionの描画
-        # ######################################
-
-
-        # for i in range(1, len(x) - 1, 2):
-        #     if x[i] == deletion_flag:
-        #         if deletion_shape == 'zigzag':
-
-        #             y1 = center_line_y
-        #             y2 = margin_y
-        #             y3 = center_line_y
-
-        #             if is_del_start_in_exon:
-        #                 y1 = center_line_y - gene_h/2
-        #                 y2 = margin_y - gene_h/2
-
-        #             if is_del_end_in_exon:
-        #                 y3 = center_line_y - gene_h/2
-        #                 y2 = margin_y - gene_h/2
-
-        #             points = [
-        #                 (x[i], y1),
-        #                 ((x[i+1]+x[i])/2, y2),
-        #                 (x[i + 1], y3)
-        #             ]
-        #             dwg.add(dwg.polyline(
-        #                 points=points,
-        #                 stroke=line_color,
-        #                 stroke_width=stroke_width,
-        #                 fill="none"
-        #             ))
-
-        #         if deletion_shape == 'dashed':
-        #             dwg.add(dwg.line(
-        #                 start=(x[i], center_line_y),
-        #                 end=(x[i + 1], center_line_y),
-        #                 stroke=line_color,
-        #                 stroke_width=stroke_width,
-        #                 style='stroke-dasharray:5,1'
-        #             ))
-
-        # ######################################
-        # # Insertionの描画
-        # ######################################
-
-        # ins_pos = np.array([2000, 6])
-        # ins_pos_x = int(ins_pos[0]/10 + 50)
-
-        # add_len = 10
-        # triangle_w = 30
-        # triangle_h = 10
-        # line_upper_y = int(margin_y - add_len)
-        # line_lower_y = int(margin_y + gene_h + add_len)
-
-        # dwg.add(
-        #     dwg.line(
-        #         start=(ins_pos_x, line_upper_y),
-        #         end=(ins_pos_x, line_lower_y),
-        #         stroke=line_color,
-        #         stroke_width=stroke_width
-        #     )
-        # )
-
-        # points = [
-        #     (ins_pos_x, line_upper_y),
-        #     (ins_pos_x - triangle_w/2, line_upper_y - triangle_h),
-        #     (ins_pos_x + triangle_w/2, line_upper_y - triangle_h)
-        # ]
-
-        # triangle = dwg.polygon(
-        #     points=points,
-        #     fill='black',
-        #     stroke='black',
-        #     stroke_width=2
-        # )
-
-        # dwg.add(triangle)
-
-
-
-
-        # ###########################################
-        # # Domain mode
-        # ###########################################
-
-        # if mode == 'domain':
-
-        #     n_domain = 1 # int(inifile.get('domain_settings', 'number_of_domains'))
-
-        #     for i in range(n_domain):
-
-        #         AA_start = 1 # int(inifile.get('domain_settings', f'domain{i+1}_AA_start'))
-        #         AA_end = 50 # int(inifile.get('domain_settings', f'domain{i+1}_AA_end'))
-        #         color = "#FAE53F" # inifile.get('color_settings', f'domain{i+1}_color')
-
-        #         if exon_gradation == "on":
-        #             color = f'url(#{get_or_create_gradient(dwg, color, grad_dict)})'
-
-        #         cDNA_start = (AA_start * 3)/10 + 50
-        #         cDNA_end = (AA_end * 3)/10 + 50
-
-        #         print('cDNA_start:', cDNA_start)
-        #         print('cDNA_end:', cDNA_end)
-
-        #         gDNA_start = cDNA_pos2gDNA_pos(cDNA_exon_pos, cDNA_start) 
-        #         gDNA_end = cDNA_pos2gDNA_pos(cDNA_exon_pos, cDNA_end) 
-
-
-
-        #         if gDNA_end > x[-1]:
-        #             print(f'The end position of domain{i+1} is out of range.') 
-        #         # Even in this case, the end point of the domain is as same as that of codeing region.
-
-        #         gDNA_start = 100 
-        #         gDNA_end = 200
-        #         print('511_x:', x)
-        #         print('gDNA_start:', gDNA_start)
-        #         print('gDNA_end:', gDNA_end)
-        #         domain_pos = x[(gDNA_start <= x) & (x <= gDNA_end)]
-        #         print('517_domain_pos:', domain_pos)
-
-        #         print('518', is_position_in_exon(x, gDNA_start), is_position_in_exon(x, gDNA_end))
-        #         if is_position_in_exon(x, gDNA_start) and is_position_in_exon(x, gDNA_end):
-        #             domain_pos = np.sort(np.append([gDNA_start, gDNA_end], domain_pos))
-
-        #         if not is_position_in_exon(x, gDNA_start) and is_position_in_exon(x, gDNA_end):
-        #             domain_pos = np.sort(np.append([gDNA_end], domain_pos))
-                
-        #         if is_position_in_exon(x, gDNA_start) and not is_position_in_exon(x, gDNA_end):
-        #             domain_pos = np.sort(np.append([gDNA_start], domain_pos))
-                
-        #         if not is_position_in_exon(x, gDNA_start) and not is_position_in_exon(x, gDNA_end):
-        #             pass
-                    
-
-        #         domain_len = np.asarray([(domain_pos[i+1] - domain_pos[i]) for i in range(len(domain_pos)-1)])
-        #         print('domain_pos:', domain_pos)
-        #         print('domain_len:', domain_len)
-
-        #         for j in range(0,len(domain_len),2):
-        #             dwg.add(dwg.rect(
-        #                 insert=(domain_pos[j], margin_y),
-        #                 size=(domain_len[j], gene_h),
-        #                 fill=color,
-        #                 # fill=exon_fill,
-        #                 stroke="none" if stroke == "off" else line_color,
-        #                 stroke_width=stroke_width
-        #             ))
-
-        # dwg.add(
-        #     dwg.text(
-        #         "transcript_id",
-        #         insert=(-150, center_line_y),  # ← 右端を x=50、ベースラインを y=80 に合わせたい
-        #         text_anchor="end",  # ← 右寄せにする
-        #         style="dominant-baseline:middle", 
-        #         font_size="14px"
-        #     )
-        # )
+@app.post("/api/py/gene-structure-layout")
+def gene_structure_layout(request: BatchGeneStructureRequest):
+    """SVG に描かれる各矩形のピクセル位置と、それがまとめている正確なゲノム座標を返す"""
+    from api.render import layout_metadata
 
+    try:
+        return layout_metadata(resolve_gene_structures(request), request.draw_settings)
+
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+async def render_batch_items(request):
+    """転写産物を1件ずつ描画し、(index, transcript_id, svg or None, error or None) を順に返す
+
+    StreamingResponse が次の要素を要求するまで描画しないので、
+    サーバーが保持するのは常に1転写産物分だけになる。
+    """
+    for index, (transcript_id, gene_structure) in enumerate(iter_batch_items(request)):
+        if gene_structure is None:
+            yield index, transcript_id, None, f"Transcript {transcript_id} not found."
+            continue
+        try:
+            key = svg_cache_key([gene_structure], request.draw_settings)
+            # ストリームは途中で打ち切らず、空きが出るまで待つ
+            svg_content = await cached_svg(key, [gene_structure], request.draw_settings, shed=False)
+            yield index, transcript_id, svg_content.decode("utf-8"), None
+        except Exception as e:
+            yield index, transcript_id, None, str(e)
+        # 描画の合間にイベントループへ制御を返す
+        await asyncio.sleep(0)
+
+async def ndjson_lines(items):
+    async for index, transcript_id, svg_content, error in items:
+        line = {"index": index, "transcript_id": transcript_id}
+        if error is None:
+            line["svg"] = svg_content
+        else:
+            line["error"] = error
+        yield json.dumps(line, ensure_ascii=False) + "\n"
 
-        svg_content = dwg.tostring()
-        
-        # SVG内容をレスポンスとして返却
-        return Response(
-            content=svg_content,
-            media_type="image/svg+xml"
+async def multipart_parts(items, boundary):
+    async for index, transcript_id, svg_content, error in items:
+        if error is None:
+            content_type, body = "image/svg+xml", svg_content
+        else:
+            content_type, body = "application/json", json.dumps({"error": error}, ensure_ascii=False)
+        # ヘッダーに改行が混ざらないようにする
+        transcript_id = transcript_id.replace("\r", "").replace("\n", "")
+        yield (
+            f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-ID: <{index}>\r\n"
+            f"X-Transcript-Id: {transcript_id}\r\n\r\n"
+            f"{body}\r\n"
         )
-        
-    except Exception as e:
-        print(f"SVG遺伝子構造の生成中にエラーが発生しました: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+    yield f"--{boundary}--\r\n"
+
+
+@app.post("/api/py/generate-gene-structures-stream")
+async def generate_gene_structures_stream(request: BatchGeneStructureRequest, format: str = "ndjson"):
+    """転写産物ごとの SVG (またはエラー) を描画でき次第 NDJSON / multipart で返す"""
+    if request.transcript_ids or request.region:
+        if request.annotation_id is None:
+            raise HTTPException(status_code=400, detail="transcript_ids require annotation_id.")
+        # ストリームを開始する前に annotation_id の存在と region を確認する
+        get_annotation(request.annotation_id)
+        requested_transcript_ids(request)
+
+    items = render_batch_items(request)
+    if format == "ndjson":
+        return StreamingResponse(ndjson_lines(items), media_type="application/x-ndjson")
+    if format == "multipart":
+        boundary = uuid.uuid4().hex
+        return StreamingResponse(multipart_parts(items, boundary), media_type=f"multipart/mixed; boundary={boundary}")
+    raise HTTPException(status_code=400, detail=f"Unknown format: {format}")
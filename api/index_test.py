@@ -0,0 +1,421 @@
+import gzip
+import json
+import os
+import time
+
+from fastapi.testclient import TestClient
+
+from api.index import app
+
+
+UTILS_DIR = os.path.join(os.path.dirname(__file__), '..', 'app', 'utils')
+RICE_GFF = os.path.join(UTILS_DIR, 'transcripts.gff')
+
+DRAW_SETTINGS = {
+    'mode': 'gene',
+    'utr_color': '#d3d3d3',
+    'exon_color': '#0077cc',
+    'line_color': '#000000',
+    'intron_shape': 'straight',
+}
+
+client = TestClient(app)
+
+
+def upload(content, **params):
+    response = client.post('/api/py/annotations', content=content, params=params)
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def test_upload_annotation_lists_transcripts():
+    with open(RICE_GFF, 'rb') as inp:
+        body = upload(inp.read(), limit=5)
+    assert body['total'] == 15
+    assert len(body['transcripts']) == 5
+
+    page = client.get(
+        f"/api/py/annotations/{body['annotation_id']}/transcripts",
+        params={'offset': 10, 'limit': 10},
+    ).json()
+    assert len(page['transcripts']) == 5
+
+
+def test_upload_annotation_accepts_gzip():
+    with open(RICE_GFF, 'rb') as inp:
+        body = upload(gzip.compress(inp.read()))
+    assert body['total'] == 15
+
+
+def test_render_by_transcript_id():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    response = client.post('/api/py/generate-gene-structure-svg', json={
+        'draw_settings': DRAW_SETTINGS,
+        'annotation_id': annotation_id,
+        'transcript_id': 'Os01t0100100-01',
+    })
+    assert response.status_code == 200
+    assert response.headers['content-type'] == 'image/svg+xml'
+    assert response.text.count('<rect') == 14
+
+    missing = client.post('/api/py/generate-gene-structure-svg', json={
+        'draw_settings': DRAW_SETTINGS,
+        'annotation_id': annotation_id,
+        'transcript_id': 'Os01t0100100',
+    })
+    assert missing.status_code == 404
+
+
+def test_batch_render_stacks_rows_with_shared_gradients():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    response = client.post('/api/py/generate-gene-structures-svg', json={
+        'draw_settings': DRAW_SETTINGS,
+        'annotation_id': annotation_id,
+        'transcript_ids': ['Os01t0100100-01', 'Os01t0100200-01', 'Os01t0100400-01'],
+    })
+    assert response.status_code == 200
+    svg = response.text
+    assert svg.count('<linearGradient') == 2
+    assert svg.count('<rect') == 14 + 4 + 7
+    assert 'height="300"' in svg
+
+
+def test_render_sets_etag_and_honours_if_none_match():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    request = {
+        'draw_settings': DRAW_SETTINGS,
+        'annotation_id': annotation_id,
+        'transcript_id': 'Os01t0100200-01',
+    }
+    first = client.post('/api/py/generate-gene-structure-svg', json=request)
+    etag = first.headers['etag']
+    assert etag.startswith('"')
+
+    revalidated = client.post('/api/py/generate-gene-structure-svg', json=request,
+                              headers={'If-None-Match': etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers['etag'] == etag
+
+
+def test_stream_yields_one_line_per_transcript():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    request = {
+        'draw_settings': DRAW_SETTINGS,
+        'annotation_id': annotation_id,
+        'transcript_ids': ['Os01t0100100-01', 'missing', 'Os01t0101175-00', 'Os01t0100200-01'],
+    }
+    with client.stream('POST', '/api/py/generate-gene-structures-stream', json=request) as response:
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        lines = [json.loads(line) for line in response.iter_lines() if line]
+    assert [line['transcript_id'] for line in lines] == request['transcript_ids']
+    assert lines[0]['svg'].startswith('<svg')
+    assert 'not found' in lines[1]['error']
+    assert lines[2]['error'] == 'Not implemented'
+    assert 'svg' in lines[3]
+
+    multipart = client.post('/api/py/generate-gene-structures-stream', json=request,
+                            params={'format': 'multipart'})
+    boundary = multipart.headers['content-type'].split('boundary=')[1]
+    assert multipart.text.count(f'--{boundary}\r\n') == 4
+    assert multipart.text.endswith(f'--{boundary}--\r\n')
+
+
+def test_variants_are_assigned_and_drawn():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    vcf = (
+        '#CHROM\tPOS\tID\tREF\tALT\n'
+        'chr01\t3500\t.\tA\tG\n'
+        'chr01\t4000\t.\tACGT\tA\n'
+        'chr01\t5000\t.\tA\tAT\n'
+        'chr02\t5000\t.\tA\tT\n'
+    )
+    response = client.post(f'/api/py/annotations/{annotation_id}/variants', content=gzip.compress(vcf.encode()))
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert body['variants'] == 4
+    assert body['transcripts']['Os01t0100100-01'] == 3
+
+    svg = client.post('/api/py/generate-gene-structure-svg', json={
+        'draw_settings': DRAW_SETTINGS,
+        'annotation_id': annotation_id,
+        'transcript_id': 'Os01t0100100-01',
+    }).text
+    assert svg.count('<circle') == 1
+    assert svg.count('<polyline') == 1
+    assert svg.count('<polygon') == 1
+
+
+def test_export_png_and_pdf():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    request = {
+        'draw_settings': DRAW_SETTINGS,
+        'annotation_id': annotation_id,
+        'transcript_id': 'Os01t0100100-01',
+        'format': 'png',
+        'dpi': 192,
+    }
+    png = client.post('/api/py/export-gene-structure', json=request)
+    assert png.status_code == 200, png.text
+    assert png.headers['content-type'] == 'image/png'
+    assert png.content.startswith(b'\x89PNG')
+
+    cached = client.post('/api/py/export-gene-structure', json=request,
+                         headers={'If-None-Match': png.headers['etag']})
+    assert cached.status_code == 304
+
+    pdf = client.post('/api/py/export-gene-structure', json=dict(request, format='pdf'))
+    assert pdf.headers['content-type'] == 'application/pdf'
+    assert pdf.content.startswith(b'%PDF')
+
+    too_large = client.post('/api/py/export-gene-structure', json=dict(request, dpi=5000))
+    assert too_large.status_code == 400
+
+
+def test_server_timing_and_metrics():
+    request = {
+        'draw_settings': dict(DRAW_SETTINGS, gene_h=21),
+        'gene_structure': {
+            'transcript_id': 't1', 'strand': '+', 'total_length': 300, 'start': 1000, 'end': 1300,
+            'exons': [], 'five_prime_utrs': [], 'three_prime_utrs': [],
+            'cds': [{'start': 1000, 'end': 1100}, {'start': 1200, 'end': 1300}],
+        },
+    }
+    first = client.post('/api/py/generate-gene-structure-svg', json=request)
+    timing = first.headers['server-timing']
+    for stage in ('parse', 'key', 'layout', 'gradients', 'draw', 'serialize', 'total'):
+        assert f'{stage};dur=' in timing
+    assert 'cache;desc="miss"' in timing
+
+    second = client.post('/api/py/generate-gene-structure-svg', json=request)
+    assert 'cache;desc="hit"' in second.headers['server-timing']
+    assert 'layout;dur=' not in second.headers['server-timing']
+
+    text = client.get('/api/py/metrics').text
+    assert 'genestructure_render_requests_total{endpoint="svg",cache="hit"}' in text
+    assert 'genestructure_render_stage_seconds_bucket{endpoint="svg",stage="serialize",le="+Inf"}' in text
+    assert 'genestructure_render_elements_count{endpoint="svg"}' in text
+    assert 'genestructure_render_cache_entries' in text
+
+
+def test_lod_layout_bounds_svg_size_and_reports_exact_coordinates():
+    starts = [1000 + i * 20000 for i in range(2000)]
+    structure = {
+        'transcript_id': 'huge.1',
+        'strand': '+',
+        'start': starts[0],
+        'end': starts[-1] + 99,
+        'total_length': starts[-1] + 99 - starts[0],
+        'exons': [],
+        'cds': [{'start': s, 'end': s + 99} for s in starts],
+        'five_prime_utrs': [],
+        'three_prime_utrs': [],
+    }
+    draw_settings = dict(DRAW_SETTINGS, width=800)
+    response = client.post('/api/py/generate-gene-structures-svg', json={
+        'draw_settings': draw_settings, 'gene_structures': [structure]})
+    assert response.status_code == 200, response.text
+    assert 'width="900.0"' in response.text
+    assert response.text.count('<rect') <= 800
+
+    compressed = client.post('/api/py/generate-gene-structures-svg', json={
+        'draw_settings': dict(draw_settings, intron_mode='fixed', intron_length=100), 'gene_structures': [structure]})
+    assert compressed.status_code == 200
+    # with 100 bp introns the 2000 exons no longer fit apart, so they still merge
+    assert compressed.text.count('<rect') <= 800
+
+    layout = client.post('/api/py/gene-structure-layout', json={
+        'draw_settings': draw_settings, 'gene_structures': [structure]}).json()
+    assert layout['width'] == 900.0
+    assert layout['lod'] is True
+    glyphs = layout['transcripts'][0]['glyphs']
+    assert sum(g['features'] for g in glyphs) == 2000
+    assert glyphs[0]['start'] == 1000
+    assert glyphs[-1]['end'] == structure['end']
+
+    bad = client.post('/api/py/gene-structure-layout', json={
+        'draw_settings': dict(draw_settings, intron_mode='squash'), 'gene_structures': [structure]})
+    assert bad.status_code == 400
+    for intron_length in (0, -100):
+        bad = client.post('/api/py/gene-structure-layout', json={
+            'draw_settings': dict(draw_settings, intron_mode='log', intron_length=intron_length),
+            'gene_structures': [structure]})
+        assert bad.status_code == 400
+        assert 'intron_length' in bad.json()['detail']
+
+
+def test_render_region_stacks_overlapping_transcripts():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    request = {'draw_settings': DRAW_SETTINGS, 'annotation_id': annotation_id, 'region': 'chr01:12,000-13,000'}
+    response = client.post('/api/py/generate-gene-structures-svg', json=request)
+    assert response.status_code == 200, response.text
+    layout = client.post('/api/py/gene-structure-layout', json=request).json()
+    assert [t['transcript_id'] for t in layout['transcripts']] == [
+        'Os01t0100200-01', 'Os01t0100300-00', 'Os01t0100400-01', 'Os01t0100466-00']
+
+    # Os01t0101175-00 has no CDS and is left out rather than failing the render
+    request['region'] = 'chr01:60000-61000'
+    layout = client.post('/api/py/gene-structure-layout', json=request).json()
+    assert [t['transcript_id'] for t in layout['transcripts']] == ['Os01t0101150-00']
+
+    request['region'] = 'chr09:1-100'
+    assert client.post('/api/py/generate-gene-structures-svg', json=request).status_code == 404
+    request['region'] = 'chr01'
+    assert client.post('/api/py/generate-gene-structures-svg', json=request).status_code == 400
+
+
+def test_jobs_render_in_background_and_deduplicate(tmp_path, monkeypatch):
+    from api import index
+    from api.jobs import JobRunner, JobStore
+
+    monkeypatch.setattr(index, 'job_runner', JobRunner(JobStore(str(tmp_path)), lambda: None))
+    with open(RICE_GFF, 'rb') as inp:
+        body = upload(inp.read())
+    transcript_ids = [t['transcript_id'] for t in body['transcripts']]
+    request = {'draw_settings': DRAW_SETTINGS, 'annotation_id': body['annotation_id'],
+               'transcript_ids': transcript_ids}
+
+    with TestClient(app) as jobs_client:
+        submitted = jobs_client.post('/api/py/jobs', json=request)
+        assert submitted.status_code == 202, submitted.text
+        job_id = submitted.json()['job_id']
+        for _ in range(200):
+            status = jobs_client.get(f'/api/py/jobs/{job_id}').json()
+            if status['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        assert status['status'] == 'done', status
+        # Os01t0101175-00 has no CDS
+        assert (status['total'], status['done'], status['failed']) == (15, 14, 1)
+
+        result = jobs_client.get(status['result_url'])
+        lines = [json.loads(line) for line in result.text.splitlines()]
+        assert [line['transcript_id'] for line in lines] == transcript_ids
+        assert sum('svg' in line for line in lines) == 14
+
+        again = jobs_client.post('/api/py/jobs', json=request).json()
+        assert again['job_id'] == job_id
+        assert again['status'] == 'done'
+
+    assert client.get('/api/py/jobs/missing').status_code == 404
+
+
+def test_job_store_only_interrupts_jobs_of_gone_processes(tmp_path):
+    import sqlite3
+
+    from api.jobs import JobStore
+
+    # a database from before jobs had an owner
+    db = sqlite3.connect(str(tmp_path / 'jobs.sqlite3'))
+    db.execute('CREATE TABLE jobs (id TEXT PRIMARY KEY, key TEXT NOT NULL, status TEXT NOT NULL, '
+               'total INTEGER NOT NULL, done INTEGER NOT NULL DEFAULT 0, failed INTEGER NOT NULL DEFAULT 0, '
+               'error TEXT, created REAL NOT NULL, updated REAL NOT NULL)')
+    db.execute("INSERT INTO jobs VALUES ('legacy', 'k0', 'running', 1, 0, 0, NULL, 0, 0)")
+    db.commit()
+    db.close()
+
+    first = JobStore(str(tmp_path))
+    assert first.get('legacy')['status'] == 'failed'
+    live = first.create('k1', 1)
+    dead = first.create('k2', 1)
+    first.update(dead['id'], owner='another-boot:1:1', status='running')
+
+    # another worker sharing the directory leaves the live process's job alone
+    second = JobStore(str(tmp_path))
+    assert second.get(live['id'])['status'] == 'queued'
+    assert second.find('k1')['id'] == live['id']
+    assert second.get(dead['id'])['status'] == 'failed'
+    assert second.find('k2') is None
+    first.close()
+    second.close()
+
+
+def test_render_fails_fast_when_the_render_queue_is_full(monkeypatch):
+    from api import index
+    from api.executor import RenderQueue
+
+    full = RenderQueue('thread', workers=1, max_queued=0)
+    full.in_flight = 1
+    monkeypatch.setattr(index, 'render_queue', full)
+    structure = {
+        'transcript_id': 'busy.1', 'strand': '+', 'start': 1, 'end': 100, 'total_length': 99,
+        'exons': [], 'cds': [{'start': 1, 'end': 100}], 'five_prime_utrs': [], 'three_prime_utrs': [],
+    }
+    response = client.post('/api/py/generate-gene-structure-svg',
+                           json={'draw_settings': DRAW_SETTINGS, 'gene_structure': structure})
+    assert response.status_code == 503
+    assert int(response.headers['Retry-After']) >= 1
+    assert client.get('/api/py/render-queue').json()['rejected'] == 1
+
+    full.in_flight = 0
+    response = client.post('/api/py/generate-gene-structure-svg',
+                           json={'draw_settings': DRAW_SETTINGS, 'gene_structure': structure})
+    assert response.status_code == 200
+    assert 'queue;dur=' in response.headers['Server-Timing']
+
+
+def test_render_from_snapshot_dir(tmp_path, monkeypatch):
+    from api import index
+    from api.snapshot import build_snapshot
+
+    build_snapshot(RICE_GFF, str(tmp_path / 'irgsp.gssnap'))
+    monkeypatch.setattr(index, 'SNAPSHOT_DIR', str(tmp_path))
+    monkeypatch.setattr(index, 'snapshots', {})
+
+    page = client.get('/api/py/annotations/irgsp/transcripts', params={'offset': 10, 'limit': 10}).json()
+    assert page['total'] == 15
+    assert len(page['transcripts']) == 5
+    response = client.post('/api/py/generate-gene-structure-svg', json={
+        'draw_settings': DRAW_SETTINGS, 'annotation_id': 'irgsp', 'transcript_id': 'Os01t0100100-01'})
+    assert response.status_code == 200
+    assert response.text.count('<rect') == 14
+    layout = client.post('/api/py/gene-structure-layout', json={
+        'draw_settings': DRAW_SETTINGS, 'annotation_id': 'irgsp', 'region': 'chr01:12,000-13,000'}).json()
+    assert len(layout['transcripts']) == 4
+    assert client.get('/api/py/annotations/..%2Firgsp/transcripts').status_code == 404
+
+    vcf = '#CHROM\tPOS\tID\tREF\tALT\nchr01\t3500\t.\tA\tG\nchr01\t5000\t.\tA\tAT\n'
+    body = client.post('/api/py/annotations/irgsp/variants', content=vcf.encode()).json()
+    assert body['transcripts'] == {'Os01t0100100-01': 2}
+    svg = client.post('/api/py/generate-gene-structure-svg', json={
+        'draw_settings': DRAW_SETTINGS, 'annotation_id': 'irgsp', 'transcript_id': 'Os01t0100100-01'}).text
+    assert svg.count('<circle') == 1
+    assert svg.count('<polygon') == 1
+
+
+def test_search_transcripts():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    body = client.get(f'/api/py/annotations/{annotation_id}/search', params={'q': 'os01t01001', 'limit': 2}).json()
+    assert len(body['results']) == 2
+    assert body['results'][0]['transcript_id'] == 'Os01t0100100-01'
+    assert body['results'][0]['match'] == 'prefix'
+    assert client.get('/api/py/annotations/missing/search', params={'q': 'x'}).status_code == 404
+
+
+def test_domain_mode_draws_domains_across_exons():
+    with open(RICE_GFF, 'rb') as inp:
+        annotation_id = upload(inp.read())['annotation_id']
+    request = {
+        'draw_settings': dict(DRAW_SETTINGS, mode='domain', domains=[
+            {'start': 1, 'end': 150, 'color': '#FAE53F'},
+            {'start': 10, 'end': 20, 'name': 'PF00566', 'transcript_id': 'Os01t0100100-01'},
+        ]),
+        'annotation_id': annotation_id,
+        'transcript_id': 'Os01t0100100-01',
+    }
+    response = client.post('/api/py/generate-gene-structure-svg', json=request)
+    assert response.status_code == 200
+    # 14 feature rects, the first domain split over 4 CDS exons and the second in one
+    assert response.text.count('<rect') == 14 + 4 + 1
+
+    request['draw_settings']['mode'] = 'gene'
+    assert client.post('/api/py/generate-gene-structure-svg', json=request).text.count('<rect') == 14
+    request['draw_settings'].update(mode='domain', domains=[{'start': 5, 'end': 1}])
+    assert client.post('/api/py/generate-gene-structure-svg', json=request).status_code == 400
@@ -0,0 +1,251 @@
+"""Background render jobs for batches too large for a single HTTP request.
+
+A job renders one SVG per transcript, like the streaming endpoint, but runs
+in the app's event loop independently of the request that submitted it. The
+transcripts are split into chunks rendered on a worker pool, and the results
+are appended in order to an NDJSON file. Job state lives in a SQLite database
+next to the results, so it can be polled from any request without an external
+broker. Jobs are keyed by the content hash of their input: submitting the same
+batch again returns the queued, running or finished job instead of rendering
+it twice.
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import time
+import uuid
+from collections import deque
+from types import SimpleNamespace
+
+from api.cache import content_key
+
+
+CHUNK_SIZE = 50
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    key TEXT NOT NULL,
+    status TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    done INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    created REAL NOT NULL,
+    updated REAL NOT NULL,
+    owner TEXT
+);
+CREATE INDEX IF NOT EXISTS jobs_key ON jobs (key);
+"""
+COLUMNS = ('id', 'key', 'status', 'total', 'done', 'failed', 'error', 'created', 'updated', 'owner')
+PENDING = ('queued', 'running')
+
+
+def boot_id():
+    try:
+        with open('/proc/sys/kernel/random/boot_id') as inp:
+            return inp.read().strip()
+    except OSError:
+        return ''
+
+
+def process_start(pid):
+    """Start time of process ``pid`` in clock ticks since boot, '' if unknown, None if it is gone."""
+    try:
+        with open(f'/proc/{pid}/stat') as inp:
+            # the fields after the parenthesised command name start at field 3; starttime is field 22
+            return inp.read().rsplit(')', 1)[1].split()[19]
+    except FileNotFoundError:
+        return None if os.path.isdir('/proc/self') else ''
+    except OSError:
+        return ''
+
+
+def process_owner(pid=None):
+    """``boot_id:pid:start`` of a process, unique across restarts even if the pid is reused."""
+    pid = os.getpid() if pid is None else pid
+    return f'{boot_id()}:{pid}:{process_start(pid) or ""}'
+
+
+def owner_alive(owner):
+    if not owner:
+        return False
+    boot, pid, start = owner.split(':')
+    if boot != boot_id():
+        return False
+    if start:
+        return process_start(int(pid)) == start
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def render_chunk(gene_structures, draw_settings):
+    """Worker entry point: ``[(svg, None) or (None, error)]`` for each transcript.
+
+    Takes plain dicts so arguments pickle cheaply, like ``raster.render_image_job``.
+    """
+    from api.render import render_gene_structures_svg
+
+    draw_settings = SimpleNamespace(**draw_settings)
+    results = []
+    for gene_structure in gene_structures:
+        try:
+            results.append((render_gene_structures_svg([gene_structure], draw_settings), None))
+        except Exception as e:
+            results.append((None, str(e)))
+    return results
+
+
+class JobStore:
+    """Job rows in ``<directory>/jobs.sqlite3`` and results in ``<directory>/<key>.ndjson``.
+
+    Results are named by content key, so a finished result is shared by every
+    job with the same input. Several app processes may share the directory, so
+    each job records the process running it (``process_owner``). Queued or
+    running jobs whose owner is gone are marked failed, both when the store is
+    opened and when such a job is looked up.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.owner = process_owner()
+        os.makedirs(directory, exist_ok=True)
+        self.db = sqlite3.connect(os.path.join(directory, 'jobs.sqlite3'), check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        if 'owner' not in {row[1] for row in self.db.execute("PRAGMA table_info(jobs)")}:
+            with self.db:
+                self.db.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+        cursor = self.db.execute(
+            f"SELECT id, owner FROM jobs WHERE status IN ({', '.join('?' * len(PENDING))})", PENDING)
+        for job_id, owner in cursor.fetchall():
+            if not owner_alive(owner):
+                self.interrupt(job_id)
+
+    def interrupt(self, job_id):
+        with self.db:
+            self.db.execute(
+                f"UPDATE jobs SET status = 'failed', error = 'interrupted', updated = ? "
+                f"WHERE id = ? AND status IN ({', '.join('?' * len(PENDING))})", (time.time(), job_id, *PENDING))
+
+    def result_path(self, key):
+        return os.path.join(self.directory, f'{key}.ndjson')
+
+    def _row(self, row):
+        if row is None:
+            return None
+        job = dict(zip(COLUMNS, row))
+        if job['status'] in PENDING and job['owner'] != self.owner and not owner_alive(job['owner']):
+            self.interrupt(job['id'])
+            job.update(status='failed', error='interrupted')
+        return job
+
+    def get(self, job_id):
+        cursor = self.db.execute(f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE id = ?", (job_id,))
+        return self._row(cursor.fetchone())
+
+    def find(self, key):
+        """The newest job for ``key`` that is pending or has its result on disk, or None."""
+        cursor = self.db.execute(
+            f"SELECT {', '.join(COLUMNS)} FROM jobs WHERE key = ? AND status != 'failed' "
+            "ORDER BY created DESC LIMIT 1", (key,))
+        job = self._row(cursor.fetchone())
+        if job is None or job['status'] == 'failed':
+            return None
+        if job['status'] == 'done' and not os.path.exists(self.result_path(key)):
+            return None
+        return job
+
+    def create(self, key, total):
+        now = time.time()
+        job = dict(id=uuid.uuid4().hex, key=key, status='queued', total=total, done=0, failed=0,
+                   error=None, created=now, updated=now, owner=self.owner)
+        with self.db:
+            self.db.execute(
+                f"INSERT INTO jobs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                [job[c] for c in COLUMNS])
+        return job
+
+    def update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        with self.db:
+            self.db.execute(
+                f"UPDATE jobs SET {', '.join(f'{name} = ?' for name in fields)} WHERE id = ?",
+                [*fields.values(), job_id])
+
+    def close(self):
+        self.db.close()
+
+
+class JobRunner:
+    """Runs jobs from a ``JobStore`` on the pool returned by ``get_pool``.
+
+    ``get_pool()`` returns an executor, or None to render in a thread. Up to
+    ``window`` chunks of a job are in flight at once, so a job keeps every
+    worker busy while holding only a bounded number of results in memory.
+    """
+
+    def __init__(self, store, get_pool, window=8):
+        self.store = store
+        self.get_pool = get_pool
+        self.window = window
+        self.tasks = {}
+
+    def submit(self, gene_structures, draw_settings):
+        """Start a job for plain-dict inputs and return its row (an existing one for the same input)."""
+        key = content_key({'gene_structures': gene_structures, 'draw_settings': draw_settings})
+        job = self.store.find(key)
+        if job is not None:
+            return job
+        job = self.store.create(key, len(gene_structures))
+        task = asyncio.get_running_loop().create_task(self.run(job, gene_structures, draw_settings))
+        self.tasks[job['id']] = task
+        task.add_done_callback(lambda _: self.tasks.pop(job['id'], None))
+        return job
+
+    async def render(self, chunk, draw_settings):
+        pool = self.get_pool()
+        if pool is None:
+            return await asyncio.to_thread(render_chunk, chunk, draw_settings)
+        return await asyncio.get_running_loop().run_in_executor(pool, render_chunk, chunk, draw_settings)
+
+    async def run(self, job, gene_structures, draw_settings):
+        job_id = job['id']
+        path = self.store.result_path(job['key'])
+        partial = f'{path}.{job_id}.part'
+        self.store.update(job_id, status='running')
+        chunks = [gene_structures[i:i + CHUNK_SIZE] for i in range(0, len(gene_structures), CHUNK_SIZE)]
+        pending = deque()
+        submitted = index = done = failed = 0
+        try:
+            with open(partial, mode='w', encoding='utf-8') as out:
+                for chunk in chunks:
+                    while submitted < len(chunks) and len(pending) < self.window:
+                        pending.append(asyncio.ensure_future(self.render(chunks[submitted], draw_settings)))
+                        submitted += 1
+                    # results are written in input order, so wait for the oldest chunk
+                    results = await pending.popleft()
+                    for gene_structure, (svg_content, error) in zip(chunk, results):
+                        line = {'index': index, 'transcript_id': gene_structure['transcript_id']}
+                        if error is None:
+                            line['svg'] = svg_content
+                            done += 1
+                        else:
+                            line['error'] = error
+                            failed += 1
+                        out.write(json.dumps(line, ensure_ascii=False) + '\n')
+                        index += 1
+                    self.store.update(job_id, done=done, failed=failed)
+            os.replace(partial, path)
+            self.store.update(job_id, status='done')
+        except Exception as e:
+            for future in pending:
+                future.cancel()
+            if os.path.exists(partial):
+                os.remove(partial)
+            self.store.update(job_id, status='failed', error=str(e))
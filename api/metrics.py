@@ -0,0 +1,217 @@
+"""Per-request stage timings and Prometheus-format metrics for the render endpoints.
+
+A request gets a ``Timings`` from ``new_timings()`` and wraps each stage in
+``with timings.stage(name):``. When metrics are off (``METRICS=off``) it gets
+the shared ``NULL_TIMINGS`` instead, whose stages are a constant no-op context
+manager, so the instrumented hot path costs one attribute lookup and call per
+stage.
+"""
+import bisect
+import os
+import time
+
+
+ENABLED = os.environ.get("METRICS", "on").lower() not in ("off", "0", "false")
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+ELEMENT_BUCKETS = (10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+BYTES_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Stage:
+    __slots__ = ("timings", "name", "started")
+
+    def __init__(self, timings, name):
+        self.timings = timings
+        self.name = name
+
+    def __enter__(self):
+        self.timings.children.append(0.0)
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        children = self.timings.children
+        # nested stages are reported on their own, so the outer one only keeps its exclusive time
+        self.timings.add(self.name, elapsed - children.pop())
+        if children:
+            children[-1] += elapsed
+        return False
+
+
+class Timings:
+    """Exclusive stage durations (accumulated when a stage repeats) and values for one request."""
+
+    enabled = True
+
+    def __init__(self, started=None):
+        self.started = time.perf_counter() if started is None else started
+        self.durations = {}
+        self.values = {}
+        self.children = []
+
+    def stage(self, name):
+        return Stage(self, name)
+
+    def add(self, name, seconds):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def set(self, name, value):
+        self.values[name] = value
+
+    def server_timing(self, **descriptions):
+        """``Server-Timing`` header value, durations in milliseconds."""
+        parts = [f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.durations.items()]
+        parts.extend(f'{name};desc="{desc}"' for name, desc in descriptions.items())
+        parts.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.3f}")
+        return ", ".join(parts)
+
+
+class NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class NullTimings:
+    enabled = False
+    _stage = NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def add(self, name, seconds):
+        pass
+
+    def set(self, name, value):
+        pass
+
+
+NULL_TIMINGS = NullTimings()
+
+
+def new_timings(started=None):
+    return Timings(started) if ENABLED else NULL_TIMINGS
+
+
+class ReceiveTimer:
+    """ASGI middleware that stamps ``request.state.received`` when a request arrives.
+
+    Handlers use it as the start of their ``Timings`` so the time FastAPI spends
+    reading and validating the body shows up as the ``parse`` stage.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            scope.setdefault("state", {})["received"] = time.perf_counter()
+        await self.app(scope, receive, send)
+
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Histogram:
+
+    def __init__(self, name, help, buckets, labels=()):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        # label values -> [per-bucket counts (+Inf last), sum, count]
+        self.series = {}
+
+    def observe(self, value, *label_values):
+        series = self.series.get(label_values)
+        if series is None:
+            series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label_values, (counts, total, count) in sorted(self.series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                le = bound if bound == "+Inf" else format_value(bound)
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, label_values, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, label_values)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, label_values)} {count}")
+        return lines
+
+
+class Counter:
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.series = {}
+
+    def inc(self, *label_values, amount=1):
+        self.series[label_values] = self.series.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{format_labels(self.labels, label_values)} {format_value(value)}")
+        return lines
+
+
+def gauge_lines(name, help, value):
+    return [f"# HELP {name} {help}", f"# TYPE {name} gauge", f"{name} {format_value(value)}"]
+
+
+STAGE_SECONDS = Histogram(
+    "genestructure_render_stage_seconds", "Time spent in each render stage.", SECONDS_BUCKETS, ("endpoint", "stage"))
+REQUEST_SECONDS = Histogram(
+    "genestructure_render_request_seconds", "Render request time from receipt to response.", SECONDS_BUCKETS,
+    ("endpoint", "cache"))
+ELEMENTS = Histogram(
+    "genestructure_render_elements", "SVG elements drawn per render.", ELEMENT_BUCKETS, ("endpoint",))
+OUTPUT_BYTES = Histogram(
+    "genestructure_render_output_bytes", "Size of the rendered output.", BYTES_BUCKETS, ("endpoint",))
+QUEUE_WAIT_SECONDS = Histogram(
+    "genestructure_render_queue_wait_seconds", "Time renders waited for a free executor worker.", SECONDS_BUCKETS)
+REQUESTS = Counter(
+    "genestructure_render_requests_total", "Render requests by cache outcome.", ("endpoint", "cache"))
+METRICS = (STAGE_SECONDS, REQUEST_SECONDS, QUEUE_WAIT_SECONDS, ELEMENTS, OUTPUT_BYTES, REQUESTS)
+
+
+def record(endpoint, timings, cache):
+    """Fold one request's timings into the process-wide metrics."""
+    if not timings.enabled:
+        return
+    for stage, seconds in timings.durations.items():
+        STAGE_SECONDS.observe(seconds, endpoint, stage)
+    REQUEST_SECONDS.observe(time.perf_counter() - timings.started, endpoint, cache)
+    REQUESTS.inc(endpoint, cache)
+    if "elements" in timings.values:
+        ELEMENTS.observe(timings.values["elements"], endpoint)
+    if "bytes" in timings.values:
+        OUTPUT_BYTES.observe(timings.values["bytes"], endpoint)
+
+
+def render_metrics(extra_lines=()):
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    lines.extend(extra_lines)
+    return "\n".join(lines) + "\n"
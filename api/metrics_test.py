@@ -0,0 +1,44 @@
+import time
+
+from api.metrics import NULL_TIMINGS, Counter, Histogram, Timings
+
+
+def test_nested_stages_report_exclusive_time():
+    timings = Timings()
+    with timings.stage('draw'):
+        with timings.stage('layout'):
+            time.sleep(0.02)
+        with timings.stage('layout'):
+            time.sleep(0.02)
+    assert timings.durations['layout'] >= 0.04
+    assert timings.durations['draw'] < 0.02
+
+    header = timings.server_timing(cache='miss')
+    assert header.startswith('layout;dur=')
+    assert 'cache;desc="miss"' in header
+    assert 'total;dur=' in header
+
+
+def test_null_timings_record_nothing():
+    with NULL_TIMINGS.stage('draw'):
+        NULL_TIMINGS.set('elements', 3)
+    assert not NULL_TIMINGS.enabled
+    assert not hasattr(NULL_TIMINGS, 'durations')
+
+
+def test_histogram_and_counter_render_prometheus_text():
+    histogram = Histogram('t_seconds', 'Test.', (0.1, 1.0), ('stage',))
+    histogram.observe(0.05, 'draw')
+    histogram.observe(0.5, 'draw')
+    histogram.observe(5, 'draw')
+    lines = histogram.render()
+    assert '# TYPE t_seconds histogram' in lines
+    assert 't_seconds_bucket{stage="draw",le="0.1"} 1' in lines
+    assert 't_seconds_bucket{stage="draw",le="1.0"} 2' in lines
+    assert 't_seconds_bucket{stage="draw",le="+Inf"} 3' in lines
+    assert 't_seconds_count{stage="draw"} 3' in lines
+
+    counter = Counter('t_total', 'Test.', ('cache',))
+    counter.inc('hit')
+    counter.inc('hit')
+    assert counter.render()[-1] == 't_total{cache="hit"} 2'
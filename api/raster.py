@@ -0,0 +1,342 @@
+"""PNG and PDF output for gene figures.
+
+``PngDrawing`` and ``PdfDrawing`` accept the same svgwrite-style calls as
+``SvgBuffer`` (rect, line, polygon, polyline, circle and gradients in defs),
+so ``render.draw_gene_structures`` lays a figure out once for every format.
+Coordinates stay in SVG user units (CSS px, 96 per inch): PNG scales them by
+``dpi / 96`` and PDF maps them to points. PNG is drawn with Pillow, which
+reportlab already depends on; PDF with the reportlab canvas.
+"""
+import io
+import math
+from types import SimpleNamespace
+
+import numpy as np
+from PIL import Image, ImageColor, ImageDraw
+from reportlab.lib.colors import Color
+from reportlab.pdfgen import canvas
+
+from api.render import check_gene_structure, draw_gene_structures, drawing_size, plan_layout
+
+
+FORMATS = {'png': 'image/png', 'pdf': 'application/pdf'}
+BACKGROUNDS = ('white', 'transparent')
+CSS_DPI = 96
+PT_PER_PX = 72 / CSS_DPI
+
+
+def fraction(value):
+    value = str(value)
+    return float(value[:-1]) / 100 if value.endswith('%') else float(value)
+
+
+def rgb(color):
+    return None if color in (None, 'none') else ImageColor.getrgb(color)[:3]
+
+
+class Gradient:
+
+    def __init__(self, start, end, id):
+        self.id = id
+        self.start = (fraction(start[0]), fraction(start[1]))
+        self.end = (fraction(end[0]), fraction(end[1]))
+        self.offsets = []
+        self.colors = []
+
+    def add_stop_color(self, offset, color):
+        self.offsets.append(fraction(offset))
+        self.colors.append(rgb(color))
+        return self
+
+    def points(self, x, y, width, height):
+        """Gradient end points in user units for the box ``(x, y, width, height)``."""
+        return (
+            (x + self.start[0] * width, y + self.start[1] * height),
+            (x + self.end[0] * width, y + self.end[1] * height),
+        )
+
+
+class Defs:
+
+    def __init__(self):
+        self.gradients = {}
+
+    def add(self, element):
+        self.gradients[element.id] = element
+        return element
+
+
+class Drawing:
+    """Records svgwrite-style calls and replays them onto a raster or PDF target."""
+
+    def __init__(self, size, background='white'):
+        if background not in BACKGROUNDS:
+            raise ValueError(f"Unknown background: {background}")
+        self.width, self.height = size
+        self.background = background
+        self.defs = Defs()
+        self.elements = []
+
+    def add(self, element):
+        self.elements.append(element)
+        return element
+
+    def linearGradient(self, start, end, id):
+        return Gradient(start, end, id)
+
+    def rect(self, insert, size, **attribs):
+        return ('rect', (insert[0], insert[1], size[0], size[1]), attribs)
+
+    def line(self, start, end, **attribs):
+        return ('line', [start, end], attribs)
+
+    def polygon(self, points, **attribs):
+        return ('polygon', list(points), attribs)
+
+    def polyline(self, points, **attribs):
+        return ('polyline', list(points), attribs)
+
+    def circle(self, center, r, **attribs):
+        return ('circle', (center[0], center[1], r), attribs)
+
+    def paint(self, value):
+        """A fill or stroke value as an RGB tuple, a Gradient or None."""
+        if value is None or value == 'none':
+            return None
+        if value.startswith('url(#'):
+            return self.defs.gradients[value[5:-1]]
+        return rgb(value)
+
+    def tobytes(self):
+        for name, geometry, attribs in self.elements:
+            getattr(self, f'draw_{name}')(geometry, attribs)
+        return self.finish()
+
+
+def dash_segments(start, end, pattern):
+    """Split the line ``start -> end`` into the "on" segments of a dash pattern."""
+    (x1, y1), (x2, y2) = start, end
+    length = math.hypot(x2 - x1, y2 - y1)
+    if length == 0 or not pattern or sum(pattern) <= 0:
+        return [(start, end)]
+    segments = []
+    position, index = 0.0, 0
+    while position < length:
+        step = pattern[index % len(pattern)]
+        if index % 2 == 0:
+            a, b = position / length, min(position + step, length) / length
+            segments.append(((x1 + (x2 - x1) * a, y1 + (y2 - y1) * a), (x1 + (x2 - x1) * b, y1 + (y2 - y1) * b)))
+        position += step
+        index += 1
+    return segments
+
+
+def dash_pattern(attribs):
+    value = attribs.get('stroke_dasharray')
+    return [float(v) for v in value.replace(',', ' ').split()] if value else None
+
+
+class PngDrawing(Drawing):
+
+    def __init__(self, size, dpi=300, background='white'):
+        super().__init__(size, background)
+        self.scale = dpi / CSS_DPI
+        self.image = Image.new(
+            'RGBA',
+            (max(1, math.ceil(self.width * self.scale)), max(1, math.ceil(self.height * self.scale))),
+            (255, 255, 255, 255) if background == 'white' else (0, 0, 0, 0),
+        )
+        self.draw = ImageDraw.Draw(self.image)
+
+    def px(self, points):
+        return [(x * self.scale, y * self.scale) for x, y in points]
+
+    def stroke(self, attribs):
+        color = self.paint(attribs.get('stroke'))
+        if isinstance(color, Gradient):
+            color = color.colors[-1]
+        width = max(1, round(float(attribs.get('stroke_width', 1)) * self.scale))
+        return color, width
+
+    def fill_gradient(self, gradient, box):
+        x0, y0, x1, y1 = (round(v) for v in box)
+        if x1 <= x0 or y1 <= y0:
+            return
+        (gx1, gy1), (gx2, gy2) = gradient.points(x0, y0, x1 - x0, y1 - y0)
+        dx, dy = gx2 - gx1, gy2 - gy1
+        ys, xs = np.mgrid[y0:y1, x0:x1] + 0.5
+        t = np.clip(((xs - gx1) * dx + (ys - gy1) * dy) / (dx * dx + dy * dy or 1), 0, 1)
+        colors = np.array(gradient.colors, dtype=float)
+        pixels = np.empty(t.shape + (4,), dtype=np.uint8)
+        for channel in range(3):
+            pixels[..., channel] = np.interp(t, gradient.offsets, colors[:, channel]).round()
+        pixels[..., 3] = 255
+        self.image.paste(Image.fromarray(pixels, 'RGBA'), (x0, y0))
+
+    def draw_rect(self, geometry, attribs):
+        x, y, width, height = geometry
+        box = (x * self.scale, y * self.scale, (x + width) * self.scale, (y + height) * self.scale)
+        fill = self.paint(attribs.get('fill'))
+        if isinstance(fill, Gradient):
+            self.fill_gradient(fill, box)
+        elif fill is not None:
+            self.draw.rectangle([round(v) for v in box], fill=fill)
+        color, stroke_width = self.stroke(attribs)
+        if color is not None:
+            self.draw.rectangle([round(v) for v in box], outline=color, width=stroke_width)
+
+    def draw_line(self, geometry, attribs):
+        color, stroke_width = self.stroke(attribs)
+        if color is None:
+            return
+        start, end = self.px(geometry)
+        pattern = dash_pattern(attribs)
+        pattern = [v * self.scale for v in pattern] if pattern else None
+        for a, b in dash_segments(start, end, pattern):
+            self.draw.line([a, b], fill=color, width=stroke_width)
+
+    def draw_polygon(self, geometry, attribs):
+        fill = self.paint(attribs.get('fill'))
+        if isinstance(fill, Gradient):
+            fill = fill.colors[0]
+        color, stroke_width = self.stroke(attribs)
+        self.draw.polygon(self.px(geometry), fill=fill, outline=color, width=stroke_width)
+
+    def draw_polyline(self, geometry, attribs):
+        color, stroke_width = self.stroke(attribs)
+        if color is not None:
+            self.draw.line(self.px(geometry), fill=color, width=stroke_width, joint='curve')
+
+    def draw_circle(self, geometry, attribs):
+        cx, cy, r = (v * self.scale for v in geometry)
+        fill = self.paint(attribs.get('fill'))
+        if isinstance(fill, Gradient):
+            fill = fill.colors[0]
+        color, stroke_width = self.stroke(attribs)
+        self.draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=fill, outline=color, width=stroke_width)
+
+    def finish(self):
+        out = io.BytesIO()
+        self.image.save(out, format='PNG', dpi=(self.scale * CSS_DPI,) * 2)
+        return out.getvalue()
+
+
+def pdf_color(color):
+    return Color(*(c / 255 for c in color))
+
+
+class PdfDrawing(Drawing):
+
+    def __init__(self, size, background='white'):
+        super().__init__(size, background)
+        self.out = io.BytesIO()
+        # invariant=1 で作成日時などを埋め込まず、同じ入力から同じ PDF を作る
+        self.canvas = canvas.Canvas(self.out, pagesize=(self.width * PT_PER_PX, self.height * PT_PER_PX), invariant=1)
+        # SVG と同じく左上を原点に、y 軸を下向きにする
+        self.canvas.translate(0, self.height * PT_PER_PX)
+        self.canvas.scale(PT_PER_PX, -PT_PER_PX)
+        if background == 'white':
+            self.canvas.setFillColor(pdf_color((255, 255, 255)))
+            self.canvas.rect(0, 0, self.width, self.height, stroke=0, fill=1)
+
+    def set_paint(self, attribs):
+        """Set stroke/fill state and return ``(stroke, fill)`` flags for drawPath."""
+        c = self.canvas
+        fill = self.paint(attribs.get('fill'))
+        if isinstance(fill, Gradient):
+            fill = fill.colors[0]
+        stroke = self.paint(attribs.get('stroke'))
+        if isinstance(stroke, Gradient):
+            stroke = stroke.colors[-1]
+        if fill is not None:
+            c.setFillColor(pdf_color(fill))
+        if stroke is not None:
+            c.setStrokeColor(pdf_color(stroke))
+            c.setLineWidth(float(attribs.get('stroke_width', 1)))
+        c.setDash(dash_pattern(attribs) or [])
+        return int(stroke is not None), int(fill is not None)
+
+    def path(self, points, close):
+        path = self.canvas.beginPath()
+        path.moveTo(*points[0])
+        for point in points[1:]:
+            path.lineTo(*point)
+        if close:
+            path.close()
+        return path
+
+    def draw_rect(self, geometry, attribs):
+        c = self.canvas
+        x, y, width, height = geometry
+        fill = self.paint(attribs.get('fill'))
+        if isinstance(fill, Gradient):
+            c.saveState()
+            clip = c.beginPath()
+            clip.rect(x, y, width, height)
+            c.clipPath(clip, stroke=0, fill=0)
+            (x1, y1), (x2, y2) = fill.points(x, y, width, height)
+            c.linearGradient(x1, y1, x2, y2, [pdf_color(color) for color in fill.colors], fill.offsets, extend=True)
+            c.restoreState()
+            attribs = dict(attribs, fill='none')
+        c.saveState()
+        stroke, fill = self.set_paint(attribs)
+        c.rect(x, y, width, height, stroke=stroke, fill=fill)
+        c.restoreState()
+
+    def draw_path(self, points, attribs, close):
+        c = self.canvas
+        c.saveState()
+        stroke, fill = self.set_paint(attribs)
+        c.drawPath(self.path(points, close), stroke=stroke, fill=fill if close else 0)
+        c.restoreState()
+
+    def draw_line(self, geometry, attribs):
+        self.draw_path(geometry, attribs, close=False)
+
+    def draw_polygon(self, geometry, attribs):
+        self.draw_path(geometry, attribs, close=True)
+
+    def draw_polyline(self, geometry, attribs):
+        self.draw_path(geometry, attribs, close=False)
+
+    def draw_circle(self, geometry, attribs):
+        c = self.canvas
+        c.saveState()
+        stroke, fill = self.set_paint(attribs)
+        c.circle(*geometry, stroke=stroke, fill=fill)
+        c.restoreState()
+
+    def finish(self):
+        self.canvas.showPage()
+        self.canvas.save()
+        return self.out.getvalue()
+
+
+def new_image_drawing(size, format, dpi=300, background='white'):
+    if format == 'png':
+        return PngDrawing(size, dpi=dpi, background=background)
+    if format == 'pdf':
+        return PdfDrawing(size, background=background)
+    raise ValueError(f"Unknown format: {format}")
+
+
+def image_size(gene_structures, draw_settings, format, dpi=300):
+    """Output size in pixels (PNG) or points (PDF), for limit checks before rendering."""
+    width, height = drawing_size(gene_structures, draw_settings)
+    scale = dpi / CSS_DPI if format == 'png' else PT_PER_PX
+    return math.ceil(width * scale), math.ceil(height * scale)
+
+
+def render_gene_structures_image(gene_structures, draw_settings, format, dpi=300, background='white'):
+    """Render stacked transcripts to PNG or PDF bytes, with the same layout as the SVG."""
+    for gene_structure in gene_structures:
+        check_gene_structure(gene_structure)
+    layout = plan_layout(gene_structures, draw_settings)
+    dwg = new_image_drawing(drawing_size(gene_structures, draw_settings, layout), format, dpi, background)
+    draw_gene_structures(dwg, gene_structures, draw_settings, layout=layout)
+    return dwg.tobytes()
+
+
+def render_image_job(gene_structures, draw_settings, format, dpi=300, background='white'):
+    """Process-pool entry point: takes plain dicts so arguments pickle cheaply."""
+    return render_gene_structures_image(gene_structures, SimpleNamespace(**draw_settings), format, dpi, background)
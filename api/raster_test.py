@@ -0,0 +1,56 @@
+import io
+
+from PIL import Image
+
+from api.geometry_test import make_structure
+from api.raster import PdfDrawing, PngDrawing, dash_segments, render_image_job
+
+
+DRAW_SETTINGS = {
+    'mode': 'gene',
+    'utr_color': '#d3d3d3',
+    'exon_color': '#0077cc',
+    'line_color': '#000000',
+    'intron_shape': 'straight',
+    'gene_h': 20,
+    'margin_x': 50,
+    'margin_y': 100,
+    'deletion_shape': 'zigzag',
+    'variant_color': '#d62728',
+}
+
+
+def test_png_is_scaled_by_dpi():
+    structure = make_structure(3)
+    png = render_image_job([structure], DRAW_SETTINGS, 'png', dpi=192)
+    image = Image.open(io.BytesIO(png))
+    # 399 bp / 10 + 2 * 50 margin = 139.9 px and 20 + 2 * 100 = 220 px at 96 dpi
+    assert image.size == (280, 440)
+
+
+def test_png_gradient_and_background():
+    for background, corner in (('white', (255, 255, 255, 255)), ('transparent', (0, 0, 0, 0))):
+        dwg = PngDrawing((10, 10), dpi=96, background=background)
+        grad = dwg.linearGradient(start=('0%', '100%'), end=('0%', '0%'), id='grad_0')
+        grad.add_stop_color(offset='0.0', color='#000000')
+        grad.add_stop_color(offset='1.0', color='#ffffff')
+        dwg.defs.add(grad)
+        dwg.add(dwg.rect(insert=(2, 2), size=(6, 6), fill='url(#grad_0)', stroke='none', stroke_width=1))
+        image = Image.open(io.BytesIO(dwg.tobytes()))
+        assert image.getpixel((0, 0)) == corner
+        # the gradient runs from black at the bottom to white at the top
+        assert image.getpixel((4, 7))[0] < image.getpixel((4, 2))[0]
+
+
+def test_pdf_is_deterministic():
+    def render():
+        dwg = PdfDrawing((100, 50))
+        dwg.add(dwg.circle(center=(10, 10), r=5, fill='#d62728', stroke='#000000', stroke_width=1))
+        return dwg.tobytes()
+
+    assert render() == render()
+    assert render().startswith(b'%PDF')
+
+
+def test_dash_segments():
+    assert dash_segments((0, 0), (12, 0), [5, 1]) == [((0, 0), (5, 0)), ((6, 0), (11, 0))]
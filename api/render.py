@@ -0,0 +1,457 @@
+"""SVG rendering of gene structures, shared by the FastAPI app and the GeneSTRUCTURE CLI.
+
+``draw_settings`` only needs the attributes of ``DrawSettings`` in ``api/index.py``
+and gene structures may be ``GeneStructureInfo`` models or plain dicts of the
+same shape.
+"""
+import colorsys
+import os
+from collections import namedtuple
+
+import svgwrite
+
+from api.geometry import (
+    CDS, FIVE_PRIME_UTR, THREE_PRIME_UTR, IntronMap, domain_layout, domain_segments, field, get_axis,
+    lod_layout, transcript_layout, variant_layout,
+)
+from api.metrics import NULL_TIMINGS
+from api.svg import PathBuffer, SvgBuffer
+
+
+def lighten_color(hex_color, factor):
+    hex_color = hex_color.lstrip('#')
+    r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+    h, l, s = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
+    l = min(1.0, l + factor * (1.0 - l))
+    r_new, g_new, b_new = colorsys.hls_to_rgb(h, l, s)
+    return '#{:02x}{:02x}{:02x}'.format(int(r_new * 255), int(g_new * 255), int(b_new * 255))
+
+
+def get_or_create_gradient(dwg, base_color, grad_dict):
+    if base_color in grad_dict:
+        return grad_dict[base_color]
+
+    grad_id = f'grad_{len(grad_dict)}'
+    light_color = lighten_color(base_color, 0.4)
+    lighter_color = lighten_color(base_color, 0.7)
+
+    grad = dwg.linearGradient(start=('0%', '100%'), end=('0%', '0%'), id=grad_id)
+    grad.add_stop_color(offset='0.0', color=base_color)
+    grad.add_stop_color(offset='0.5', color=light_color)
+    grad.add_stop_color(offset='1.0', color=lighter_color)
+    dwg.defs.add(grad)
+
+    grad_dict[base_color] = grad_id
+    return grad_id
+
+def check_gene_structure(gene_structure):
+    if not field(gene_structure, 'exons') and not field(gene_structure, 'cds'):
+        raise ValueError("No exons or cds positions provided.")
+    if not field(gene_structure, 'cds'):
+        raise ValueError("Not implemented")
+
+def draw_variants(dwg, variants, draw_settings, axis, margin_y, stroke_width=1, scale=10, dedupe=False):
+    """変異を転写産物の上に重ねて描く
+
+    deletion は欠失範囲の上にジグザグ (または破線)、insertion は縦線と三角形、
+    substitution は先端に丸の付いた縦線で示す。
+    ``dedupe`` のときは同じピクセルに重なる同種の変異を1つだけ描く。
+    """
+    x1s, x2s = variant_layout(variants, axis, draw_settings.margin_x, scale)
+    gene_h = draw_settings.gene_h
+    line_color = draw_settings.line_color
+    # 隣の行 (row_h = gene_h * 2) に重ならない大きさにする
+    add_len = gene_h / 4
+    triangle_w = gene_h / 2
+    triangle_h = gene_h / 4
+    line_upper_y = margin_y - add_len
+    line_lower_y = margin_y + gene_h + add_len
+
+    drawn = set()
+    for variant, x1, x2 in zip(variants, x1s, x2s):
+        kind = field(variant, 'kind')
+        if dedupe:
+            key = (kind, round(x1), round(x2))
+            if key in drawn:
+                continue
+            drawn.add(key)
+        if kind == 'deletion':
+            if draw_settings.deletion_shape == 'dashed':
+                dwg.add(dwg.line(
+                    start=(x1, line_upper_y),
+                    end=(x2, line_upper_y),
+                    stroke=line_color,
+                    stroke_width=stroke_width,
+                    stroke_dasharray='5,1',
+                ))
+            else:
+                dwg.add(dwg.polyline(
+                    points=[(x1, margin_y), ((x1 + x2) / 2, margin_y - gene_h / 2), (x2, margin_y)],
+                    stroke=line_color,
+                    stroke_width=stroke_width,
+                    fill="none",
+                ))
+
+        elif kind == 'insertion':
+            dwg.add(dwg.line(
+                start=(x1, line_upper_y),
+                end=(x1, line_lower_y),
+                stroke=line_color,
+                stroke_width=stroke_width,
+            ))
+            dwg.add(dwg.polygon(
+                points=[
+                    (x1, line_upper_y),
+                    (x1 - triangle_w / 2, line_upper_y - triangle_h),
+                    (x1 + triangle_w / 2, line_upper_y - triangle_h),
+                ],
+                fill=line_color,
+                stroke=line_color,
+                stroke_width=stroke_width,
+            ))
+
+        else:
+            x = (x1 + x2) / 2
+            dwg.add(dwg.line(
+                start=(x, margin_y),
+                end=(x, line_upper_y - triangle_h),
+                stroke=line_color,
+                stroke_width=stroke_width,
+            ))
+            dwg.add(dwg.circle(
+                center=(x, line_upper_y - triangle_h),
+                r=gene_h / 8,
+                fill=draw_settings.variant_color,
+                stroke=line_color,
+                stroke_width=stroke_width,
+            ))
+
+def draw_gene_structure(dwg, gene_structure, draw_settings, grad_dict, axis, margin_y, timings=NULL_TIMINGS,
+                        scale=10, lod=False, domains=()):
+    # 座標のシフト・鎖の反転・検証・ピクセルへの変換は geometry でまとめて行う
+    # lod のときは1ピクセル未満の隙間しかない feature を1つの矩形にまとめる
+    with timings.stage("layout"):
+        if lod:
+            rects, introns = lod_layout(gene_structure, axis, draw_settings.margin_x, scale)
+        else:
+            rects, introns = transcript_layout(gene_structure, axis, draw_settings.margin_x, scale)
+
+    # SVGの作成
+    gene_h = draw_settings.gene_h
+    center_line_y = margin_y + gene_h / 2
+    utr_gradation = "on"
+    exon_gradation = "on"
+    # exon_color = "#0077cc"
+    # utr_color = "#d3d3d3"
+    # line_color = "#000000"
+
+    with timings.stage("gradients"):
+        if utr_gradation == "on":
+            utr_color = f'url(#{get_or_create_gradient(dwg, draw_settings.utr_color, grad_dict)})'
+        else:
+            utr_color = draw_settings.utr_color
+
+        if exon_gradation == "on":
+            exon_color = f'url(#{get_or_create_gradient(dwg, draw_settings.exon_color, grad_dict)})'
+        else:
+            exon_color = draw_settings.exon_color
+
+    stroke_width = 1
+    stroke = "on"
+
+    ######################################
+    # Exon の描画
+    ######################################
+
+    for x, width in zip(*rects[CDS]):
+        dwg.add(dwg.rect(
+            insert=(x, margin_y),
+            size=(width, gene_h),
+            fill=exon_color,
+            stroke="none" if stroke == "off" else draw_settings.line_color,
+            stroke_width=stroke_width,
+        ))
+
+    # for i in range(0, len(x), 2):
+    #     dwg.add(
+    #         dwg.rect(
+    #             insert=(x[i], margin_y),
+    #             size=(exon_intron_length[i], gene_h),
+    #             fill=exon_color,
+    #             stroke="none" if stroke == "off" else line_color,
+    #             stroke_width=stroke_width
+    #         )
+    #     )
+
+    ######################################
+    # UTR の描画
+    ######################################
+
+    for x, width in zip(*rects[FIVE_PRIME_UTR]):
+        dwg.add(dwg.rect(
+            insert=(x, margin_y),
+            size=(width, gene_h),
+            fill=utr_color,
+            stroke="none" if stroke == "off" else draw_settings.line_color,
+            stroke_width=stroke_width
+        ))
+
+    for x, width in zip(*rects[THREE_PRIME_UTR]):
+        dwg.add(dwg.rect(
+            insert=(x, margin_y),
+            size=(width, gene_h),
+            fill=utr_color,
+            stroke="none" if stroke == "off" else draw_settings.line_color,
+            stroke_width=stroke_width
+        ))
+
+    # # five_prime_UTR = x[x < np.min(cds_pos)]
+
+    # for i in range(0, len(five_prime_UTR), 2):
+    #     dwg.add(dwg.rect(
+    #         insert=(five_prime_UTR[i], margin_y),
+    #         size=(exon_intron_length[i], gene_h),
+    #         fill=utr_color,
+    #         stroke="none" if stroke == "off" else line_color,
+    #         stroke_width=stroke_width
+    #     ))
+
+    # # three_prime_UTR = x[x > np.max(cds_pos)]
+    # three_prime_UTR_length = np.asarray([(three_prime_UTR[i+1] - three_prime_UTR[i]) for i in range(len(three_prime_UTR)-1)])
+
+
+    # for i in range(0, len(three_prime_UTR), 2):
+    #     if i == len(three_prime_UTR) - 2:
+    #         x0 = three_prime_UTR[i]       # 左端
+    #         x1 = three_prime_UTR[i+1]     # 右端
+    #         x2 = x1 + 10               # 矢印先端
+
+    #         y0 = margin_y                 # 上端
+    #         y1 = margin_y + gene_h        # 下端
+
+    #         # 順序: 左上→左下→右下→右上→矢印先端（中央）
+    #         dwg.add(dwg.polygon(
+    #             points=[
+    #                 (x0, y0),
+    #                 (x0, y1),
+    #                 (x1, y1),
+    #                 (x2, center_line_y),
+    #                 (x1, y0)
+    #             ],
+    #             fill=utr_color,
+    #             stroke="none" if stroke == "off" else line_color,
+    #             stroke_width=stroke_width
+    #         ))
+
+    #     else:
+    #         dwg.add(dwg.rect(
+    #             insert=(three_prime_UTR[i], margin_y),
+    #             size=(three_prime_UTR_length[i], gene_h),
+    #             fill=utr_color,
+    #             # fill=exon_fill,
+    #             stroke="none" if stroke == "off" else line_color,
+    #             stroke_width=stroke_width
+    #         ))
+
+    ######################################
+    # Domain の描画 (CDS の上に重ね、イントロンをまたぐものはエキソンごとに分かれる)
+    ######################################
+
+    for x, width, color in domains:
+        dwg.add(dwg.rect(
+            insert=(x, margin_y),
+            size=(width, gene_h),
+            fill=f'url(#{get_or_create_gradient(dwg, color, grad_dict)})' if exon_gradation == "on" else color,
+            stroke="none" if stroke == "off" else draw_settings.line_color,
+            stroke_width=stroke_width,
+        ))
+
+    ######################################
+    # Intron の描画
+    ######################################
+
+    for x1, x2 in zip(*introns):
+        dwg.add(dwg.line(
+            start=(x1, center_line_y),
+            end=(x2, center_line_y),
+            stroke=draw_settings.line_color,
+            stroke_width=stroke_width,
+        ))
+
+
+    ######################################
+    # 最後を矢印状にする
+    ######################################
+
+
+    ######################################
+    # 変異 (VCF 由来の deletion / insertion / substitution) の描画
+    ######################################
+
+    variants = field(gene_structure, 'variants', [])
+    if variants:
+        draw_variants(dwg, variants, draw_settings, axis, margin_y, stroke_width, scale, dedupe=lod)
+
+
+    # dwg.add(
+    #     dwg.text(
+    #         "transcript_id",
+    #         insert=(-150, center_line_y),  # ← 右端を x=50、ベースラインを y=80 に合わせたい
+    #         text_anchor="end",  # ← 右寄せにする
+    #         style="dominant-baseline:middle", 
+    #         font_size="14px"
+    #     )
+    # )
+
+
+# SVG の出力方式: "fast" は SvgBuffer で直接文字列を組み立て、"svgwrite" は svgwrite で検証しながら描画する
+# "paths" は同じスタイルの要素を1つの <path> にまとめる (draw_settings.merge_paths でも選べる)
+SVG_BACKEND = os.environ.get("SVG_BACKEND", "fast")
+
+def new_drawing(size, backend=None):
+    backend = backend or SVG_BACKEND
+    if backend == "svgwrite":
+        return svgwrite.Drawing(size=size, profile='tiny')
+    if backend == "paths":
+        return PathBuffer(size=size)
+    return SvgBuffer(size=size)
+
+# structures: 描画する転写産物 (イントロン圧縮後の座標)、scale: 1ピクセルあたりの bp
+Layout = namedtuple("Layout", "structures axis scale lod")
+
+def plan_layout(gene_structures, draw_settings):
+    """座標軸と縮尺を決める
+
+    既定では 1px = 10bp。``width`` を指定すると描画幅がそのピクセル数になるよう縮尺を決め、
+    ``intron_mode`` が linear 以外ならイントロンを圧縮した座標で描く。
+    どちらかを指定したときは LOD (level of detail) モードで、1ピクセル未満の feature をまとめる。
+    """
+    width = getattr(draw_settings, "width", None)
+    intron_mode = getattr(draw_settings, "intron_mode", "linear")
+    structures = gene_structures
+    if intron_mode != "linear":
+        intron_map = IntronMap(gene_structures, intron_mode, getattr(draw_settings, "intron_length", 100))
+        structures = [intron_map.structure(gene_structure) for gene_structure in gene_structures]
+    axis = get_axis(structures)
+    scale = 10
+    if width is not None and width < 1:
+        raise ValueError(f"width must be at least 1 pixel: {width}")
+    if width:
+        scale = max(axis[1] - axis[0], 1) / width
+    return Layout(structures, axis, scale, bool(width) or intron_mode != "linear")
+
+def drawing_size(gene_structures, draw_settings, layout=None):
+    """全転写産物を縦に積み重ねたときの (width, height)"""
+    if layout is None:
+        layout = plan_layout(gene_structures, draw_settings)
+    origin, axis_end, _ = layout.axis
+    gene_h = draw_settings.gene_h
+    row_h = gene_h * 2
+    return (
+        (axis_end - origin)/layout.scale + draw_settings.margin_x * 2,
+        gene_h + row_h * (len(gene_structures) - 1) + draw_settings.margin_y * 2,
+    )
+
+# domain に color がなければ、名前 (なければ順番) ごとにこの色を順に使う
+DOMAIN_COLORS = ("#FAE53F", "#ffb6c1", "#98fb98", "#87cefa", "#ffa07a", "#dda0dd", "#f0e68c", "#b0c4de")
+
+def domain_colors(domains):
+    palette = {}
+    colors = []
+    for i, domain in enumerate(domains):
+        color = field(domain, 'color', None)
+        if color is None:
+            key = field(domain, 'name', None) or i
+            color = palette.setdefault(key, DOMAIN_COLORS[len(palette) % len(DOMAIN_COLORS)])
+        colors.append(color)
+    return colors
+
+def layout_domains(layout, draw_settings):
+    """domain モードのとき、各行に描く domain の (x, width, color) のリストを返す
+
+    全転写産物の全 domain のアミノ酸座標をまとめて1回でゲノム上の区間に変換する。
+    イントロン圧縮後の座標でもエキソン長は変わらないので、layout.structures のまま変換できる。
+    """
+    domains = getattr(draw_settings, "domains", None)
+    rows = [[] for _ in layout.structures]
+    if getattr(draw_settings, "mode", None) != "domain" or not domains:
+        return rows
+    segment_rows, domain_index, starts, ends = domain_segments(layout.structures, domains)
+    xs, widths = domain_layout(starts, ends, layout.axis, draw_settings.margin_x, layout.scale)
+    colors = domain_colors(domains)
+    for row, i, x, width in zip(segment_rows.tolist(), domain_index.tolist(), xs, widths):
+        rows[row].append((x, width, colors[i]))
+    return rows
+
+def draw_gene_structures(dwg, gene_structures, draw_settings, timings=NULL_TIMINGS, layout=None):
+    """転写産物を共通の座標軸上に縦に積み重ねて ``dwg`` に描く"""
+    if layout is None:
+        layout = plan_layout(gene_structures, draw_settings)
+    margin_y = draw_settings.margin_y
+    row_h = draw_settings.gene_h * 2
+    with timings.stage("layout"):
+        domains = layout_domains(layout, draw_settings)
+
+    # グラデーションは全転写産物で共有し、<defs> には1回だけ出力する
+    grad_dict = {}
+    for i, gene_structure in enumerate(layout.structures):
+        # PathBuffer は行ごとにパスをまとめるので、描画順が行をまたいで入れ替わらない
+        if isinstance(dwg, PathBuffer):
+            dwg.row = i
+        # layout と gradients を除いた要素の組み立て時間が "draw" になる
+        with timings.stage("draw"):
+            draw_gene_structure(dwg, gene_structure, draw_settings, grad_dict, layout.axis, margin_y + row_h * i,
+                                timings, layout.scale, layout.lod, domains[i])
+
+def render_gene_structures_svg(gene_structures, draw_settings, backend=None, timings=NULL_TIMINGS):
+    """転写産物を共通の座標軸上に縦に積み重ねた SVG を返す"""
+    for gene_structure in gene_structures:
+        check_gene_structure(gene_structure)
+
+    if getattr(draw_settings, "merge_paths", False):
+        backend = "paths"
+    with timings.stage("layout"):
+        layout = plan_layout(gene_structures, draw_settings)
+    dwg = new_drawing(size=drawing_size(gene_structures, draw_settings, layout), backend=backend)
+    draw_gene_structures(dwg, gene_structures, draw_settings, timings, layout)
+    timings.set("elements", len(dwg.elements))
+    with timings.stage("serialize"):
+        return dwg.tostring()
+
+
+def layout_metadata(gene_structures, draw_settings):
+    """SVG と同じレイアウトで、描画される各矩形のピクセル位置と正確なゲノム座標を返す
+
+    LOD モードでまとめられた矩形は、含まれる feature の数と範囲 (start..end) を持つ。
+    """
+    for gene_structure in gene_structures:
+        check_gene_structure(gene_structure)
+
+    layout = plan_layout(gene_structures, draw_settings)
+    width, height = drawing_size(gene_structures, draw_settings, layout)
+    transcripts = []
+    for original, gene_structure in zip(gene_structures, layout.structures):
+        _, _, glyphs = lod_layout(gene_structure, layout.axis, draw_settings.margin_x, layout.scale,
+                                  merge_px=1.0 if layout.lod else 0.0, original=original)
+        transcripts.append({
+            "transcript_id": field(original, 'transcript_id'),
+            "start": field(original, 'start'),
+            "end": field(original, 'end'),
+            "glyphs": glyphs,
+        })
+    return {
+        "width": width,
+        "height": height,
+        "bp_per_px": layout.scale,
+        "intron_mode": getattr(draw_settings, "intron_mode", "linear"),
+        "lod": layout.lod,
+        "transcripts": transcripts,
+    }
+
+
+def render_svg_file(gene_structure, draw_settings, path, backend=None):
+    """1本の転写産物を描画して ``path`` に保存する (CLI のバッチモード用)"""
+    svg_content = render_gene_structures_svg([gene_structure], draw_settings, backend=backend)
+    with open(path, mode='w', encoding='utf-8') as out:
+        out.write(svg_content)
+    return path
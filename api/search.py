@@ -0,0 +1,135 @@
+"""Transcript search for uploaded annotations (autocomplete in the ID box).
+
+``SearchIndex`` is built once per annotation from ``(transcript_id, field,
+key)`` entries: each transcript's ID plus its ``Name``, ``Locus_id`` and
+``Parent`` attributes, and Ensembl-style keys without their ``type:`` prefix.
+Keys are matched case-insensitively by three lookups, best first:
+
+* exact: a dict from key to entries;
+* prefix: bisection over the keys in sorted order;
+* fuzzy: a trigram index. Each trigram of the query selects its posting
+  array, ``np.bincount`` over them counts shared trigrams for every entry
+  at once, and entries are ranked by the Jaccard similarity of the two
+  trigram sets.
+
+Each transcript is returned once, under its best match.
+"""
+import bisect
+from collections import defaultdict
+
+import numpy as np
+
+from api.gff import strip_prefix
+
+
+FIELDS = ('Name', 'Locus_id', 'Parent')
+NGRAM = 3
+MIN_SCORE = 0.3
+# the highest code point, so every key starting with the query sorts before query + MAX_CHAR
+MAX_CHAR = '\U0010ffff'
+
+
+def ngrams(key):
+    return {key[i:i + NGRAM] for i in range(len(key) - NGRAM + 1)}
+
+
+def keys_of(value):
+    alias = strip_prefix(value)
+    return (value, alias) if alias else (value,)
+
+
+def attribute_entries(transcript_id, attributes):
+    for key in keys_of(transcript_id):
+        yield transcript_id, 'ID', key
+    for field in FIELDS:
+        for value in attributes.get(field, []):
+            for key in keys_of(value):
+                yield transcript_id, field, key
+
+
+def structure_entries(structures):
+    """Search entries of ``GeneStructureInfo``-shaped records with GFF ``attributes``."""
+    for structure in structures:
+        yield from attribute_entries(structure['transcript_id'], structure.get('attributes', {}))
+
+
+class SearchIndex:
+
+    def __init__(self, entries):
+        self.transcript_ids = []
+        self.fields = []
+        self.keys = []
+        self.exact = defaultdict(list)
+        postings = defaultdict(list)
+        gram_counts = []
+        lowered_keys = []
+        for transcript_id, field, key in entries:
+            i = len(self.keys)
+            lowered = key.lower()
+            self.transcript_ids.append(transcript_id)
+            self.fields.append(field)
+            self.keys.append(key)
+            lowered_keys.append(lowered)
+            self.exact[lowered].append(i)
+            grams = ngrams(lowered)
+            for gram in grams:
+                postings[gram].append(i)
+            gram_counts.append(len(grams))
+        self.order = sorted(range(len(lowered_keys)), key=lowered_keys.__getitem__)
+        self.sorted_keys = [lowered_keys[i] for i in self.order]
+        self.postings = {gram: np.array(entries, dtype=np.int32) for gram, entries in postings.items()}
+        self.gram_counts = np.array(gram_counts, dtype=np.int32)
+        self.key_lengths = np.array([len(key) for key in lowered_keys], dtype=np.int32)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def fuzzy(self, query, limit):
+        """Entries sharing trigrams with ``query``, best first, as ``(entry, score)``."""
+        grams = ngrams(query)
+        postings = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not postings:
+            return []
+        shared = np.bincount(np.concatenate(postings), minlength=len(self.keys))
+        scores = shared / (len(grams) + self.gram_counts - shared)
+        candidates = np.flatnonzero(scores >= MIN_SCORE)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        # trigram sets ignore repeats, so among equal scores prefer keys closest in length
+        length_gap = np.abs(self.key_lengths[candidates] - len(query))
+        candidates = candidates[np.lexsort((length_gap, -scores[candidates]))]
+        return list(zip(candidates.tolist(), scores[candidates].tolist()))
+
+    def search(self, query, limit=20):
+        """Up to ``limit`` ``{transcript_id, field, key, match, score}`` results for ``query``."""
+        query = query.strip().lower()
+        results = {}
+
+        def add(i, match, score):
+            transcript_id = self.transcript_ids[i]
+            if transcript_id not in results:
+                results[transcript_id] = {
+                    'transcript_id': transcript_id,
+                    'field': self.fields[i],
+                    'key': self.keys[i],
+                    'match': match,
+                    'score': round(score, 3),
+                }
+            return len(results) >= limit
+
+        if not query or limit < 1:
+            return []
+        for i in self.exact.get(query, []):
+            if add(i, 'exact', 1.0):
+                return list(results.values())
+        lo = bisect.bisect_left(self.sorted_keys, query)
+        hi = bisect.bisect_left(self.sorted_keys, query + MAX_CHAR, lo)
+        for j in range(lo, hi):
+            if add(self.order[j], 'prefix', len(query) / len(self.sorted_keys[j])):
+                return list(results.values())
+        if len(query) >= NGRAM:
+            # a transcript can hold several of the top entries, so ask for extra
+            for i, score in self.fuzzy(query, limit * (len(FIELDS) + 1) * 2):
+                if add(i, 'fuzzy', score):
+                    break
+        return list(results.values())
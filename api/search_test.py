@@ -0,0 +1,50 @@
+import os
+
+from api.gff import iter_transcripts
+from api.search import SearchIndex, structure_entries
+
+
+UTILS_DIR = os.path.join(os.path.dirname(__file__), '..', 'app', 'utils')
+RICE_GFF = os.path.join(UTILS_DIR, 'transcripts.gff')
+SORGHUM_GFF = os.path.join(UTILS_DIR, 'Sorghum_bicolor.Sorghum_bicolor_NCBIv3.51.gff3')
+
+
+def build(path):
+    with open(path) as inp:
+        return SearchIndex(structure_entries(iter_transcripts(inp)))
+
+
+def ids(results):
+    return [result['transcript_id'] for result in results]
+
+
+def test_exact_then_prefix_matches():
+    index = build(RICE_GFF)
+    results = index.search('os01t0100100-01')
+    assert results[0] == {'transcript_id': 'Os01t0100100-01', 'field': 'ID', 'key': 'Os01t0100100-01',
+                          'match': 'exact', 'score': 1.0}
+    prefixed = index.search('Os01t01004', limit=5)
+    assert ids(prefixed[:2]) == ['Os01t0100400-01', 'Os01t0100466-00']
+    # fewer prefix matches than the limit are topped up with fuzzy ones
+    assert [result['match'] for result in prefixed] == ['prefix', 'prefix', 'fuzzy', 'fuzzy', 'fuzzy']
+    assert len(index.search('Os01t', limit=3)) == 3
+
+
+def test_fuzzy_matches_tolerate_typos():
+    index = build(RICE_GFF)
+    results = index.search('Os01t010010001', limit=3)
+    assert results[0]['transcript_id'] == 'Os01t0100100-01'
+    assert results[0]['match'] == 'fuzzy'
+    assert index.search('zzzzzz') == []
+    assert index.search('  ') == []
+
+
+def test_locus_and_unprefixed_ensembl_keys():
+    rice = build(RICE_GFF)
+    with open(RICE_GFF) as inp:
+        record = next(iter_transcripts(inp))
+    locus = record['attributes']['Locus_id'][0]
+    assert record['transcript_id'] in ids(rice.search(locus))
+
+    sorghum = build(SORGHUM_GFF)
+    assert ids(sorghum.search('EER90453')) == ['transcript:EER90453']
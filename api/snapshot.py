@@ -0,0 +1,384 @@
+"""Compact columnar snapshots of a GFF3 annotation, loaded with ``mmap``.
+
+Reference annotations such as IRGSP-1.0 never change, so parsing their GFF
+text on every CLI run or cold start is wasted work. ``build_snapshot`` converts
+one into a single file of typed arrays:
+
+* transcripts, sorted by seqid then start: seqid, start, end, strand, ID,
+  Parent and Locus_id (strings interned in one UTF-8 string table), plus the
+  running maximum end per seqid for region queries;
+* features: kind (``geometry`` kind codes), start and end, grouped per
+  transcript and kind by CSR offsets, so one transcript's CDS are
+  ``features[offsets[4 * row]:offsets[4 * row + 1]]``;
+* a lookup table of transcript IDs (and Ensembl-style unprefixed aliases)
+  sorted by their UTF-8 bytes, searched by bisection.
+
+The file is ``MAGIC``, the length of a JSON header as a little-endian uint64,
+the header (array names, dtypes, offsets and lengths), then the arrays, each
+8-byte aligned. ``Snapshot`` maps it read-only and views the arrays in place:
+opening costs one header parse and a lookup touches only the pages it reads.
+
+Build one with ``python -m api.snapshot annotation.gff3 annotation.gssnap``.
+"""
+import bisect
+import json
+import mmap
+import os
+import struct
+import sys
+from collections.abc import Mapping
+
+import numpy as np
+
+from api.geometry import KIND_FIELDS, Positions
+from api.gff import iter_transcripts, open_gff, strip_prefix
+
+
+MAGIC = b'GSSNAP1\n'
+SNAPSHOT_SUFFIX = '.gssnap'
+SNAPSHOT_VERSION = 1
+N_KINDS = len(KIND_FIELDS)
+STRANDS = {'+': 1, '-': -1}
+STRAND_NAMES = {1: '+', -1: '-', 0: '.'}
+
+
+class StringTable:
+
+    def __init__(self):
+        self.index = {}
+        self.strings = []
+
+    def intern(self, value):
+        if value is None:
+            return -1
+        i = self.index.get(value)
+        if i is None:
+            i = self.index[value] = len(self.strings)
+            self.strings.append(value)
+        return i
+
+    def arrays(self):
+        encoded = [s.encode('utf-8') for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets
+
+
+def build_snapshot(gff_path, path):
+    """Convert ``gff_path`` to a snapshot at ``path``; returns the number of transcripts."""
+    with open_gff(gff_path) as inp:
+        transcripts = list(iter_transcripts(inp))
+    strings = StringTable()
+    seq_rank = {}
+    for t in transcripts:
+        seq_rank.setdefault(t['seq_id'], len(seq_rank))
+    transcripts.sort(key=lambda t: (seq_rank[t['seq_id']], t['start'], t['end']))
+
+    n = len(transcripts)
+    columns = {
+        'seq': np.empty(n, dtype=np.int32),
+        'start': np.empty(n, dtype=np.int64),
+        'end': np.empty(n, dtype=np.int64),
+        'strand': np.empty(n, dtype=np.int8),
+        'id': np.empty(n, dtype=np.int32),
+        'parent': np.empty(n, dtype=np.int32),
+        'locus': np.empty(n, dtype=np.int32),
+    }
+    counts = np.zeros(n * N_KINDS, dtype=np.int64)
+    kinds, starts, ends = [], [], []
+    for row, t in enumerate(transcripts):
+        columns['seq'][row] = strings.intern(t['seq_id'])
+        columns['start'][row] = t['start']
+        columns['end'][row] = t['end']
+        columns['strand'][row] = STRANDS.get(t['strand'], 0)
+        columns['id'][row] = strings.intern(t['transcript_id'])
+        columns['parent'][row] = strings.intern(t['attributes'].get('Parent', [None])[0])
+        columns['locus'][row] = strings.intern(t['attributes'].get('Locus_id', [None])[0])
+        for k, (kind, name, _) in enumerate(KIND_FIELDS):
+            positions = t[name]
+            counts[row * N_KINDS + k] = len(positions)
+            kinds.extend([kind] * len(positions))
+            starts.extend(pos['start'] for pos in positions)
+            ends.extend(pos['end'] for pos in positions)
+
+    # running maximum end within each seqid (rows are sorted by seqid, then start)
+    max_end = columns['end'].copy()
+    seq_bounds = np.flatnonzero(np.diff(columns['seq'])) + 1
+    for segment in np.split(np.arange(n), seq_bounds):
+        if len(segment):
+            max_end[segment] = np.maximum.accumulate(columns['end'][segment])
+
+    # ID lookup: exact IDs plus "transcript:X" -> "X" aliases that do not collide
+    keys = {t['transcript_id']: row for row, t in enumerate(transcripts)}
+    for row, t in enumerate(transcripts):
+        alias = strip_prefix(t['transcript_id'])
+        if alias and alias not in keys:
+            keys[alias] = row
+    lookup = sorted(((key.encode('utf-8'), strings.intern(key), row) for key, row in keys.items()))
+
+    string_blob, string_offsets = strings.arrays()
+    arrays = {
+        **{f'transcript_{name}': values for name, values in columns.items()},
+        'transcript_max_end': max_end,
+        'feature_offsets': np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+        'feature_kind': np.array(kinds, dtype=np.int8),
+        'feature_start': coordinates(starts),
+        'feature_end': coordinates(ends),
+        'lookup_key': np.array([k for _, k, _ in lookup], dtype=np.int32),
+        'lookup_row': np.array([r for _, _, r in lookup], dtype=np.int32),
+        'string_blob': string_blob,
+        'string_offsets': string_offsets,
+    }
+    write_arrays(path, arrays, {'version': SNAPSHOT_VERSION, 'source': os.path.basename(gff_path)})
+    return n
+
+
+def coordinates(values):
+    # int32 holds every coordinate of real assemblies and halves the file
+    values = np.array(values, dtype=np.int64)
+    if not len(values) or values.max() < 2 ** 31:
+        return values.astype(np.int32)
+    return values
+
+
+def align(offset):
+    return (offset + 7) // 8 * 8
+
+
+def write_arrays(path, arrays, meta):
+    layout = {}
+    offset = 0
+    for name, values in arrays.items():
+        layout[name] = [values.dtype.str, offset, len(values)]
+        offset = align(offset + values.nbytes)
+    header = json.dumps(dict(meta, arrays=layout)).encode('utf-8')
+    data_start = align(len(MAGIC) + 8 + len(header))
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, mode='wb') as out:
+        out.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        out.write(b'\0' * (data_start - out.tell()))
+        for name, values in arrays.items():
+            out.seek(data_start + layout[name][1])
+            out.write(values.astype(values.dtype.newbyteorder('<'), copy=False).tobytes())
+    os.replace(tmp_path, path)
+
+
+class Snapshot:
+    """Read-only, memory-mapped view of a snapshot file."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, mode='rb') as inp:
+            self.buffer = mmap.mmap(inp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.buffer[:len(MAGIC)] != MAGIC:
+            raise ValueError(f'"{path}" is not a gene structure snapshot.')
+        (header_length,) = struct.unpack_from('<Q', self.buffer, len(MAGIC))
+        header_start = len(MAGIC) + 8
+        self.header = json.loads(self.buffer[header_start:header_start + header_length])
+        if self.header.get('version') != SNAPSHOT_VERSION:
+            raise ValueError(f'"{path}" has snapshot version {self.header.get("version")}, '
+                             f'expected {SNAPSHOT_VERSION}; rebuild it.')
+        data_start = align(header_start + header_length)
+        for name, (dtype, offset, length) in self.header['arrays'].items():
+            values = np.frombuffer(self.buffer, dtype=dtype, count=length, offset=data_start + offset)
+            setattr(self, name, values)
+        self._blob_start = data_start + self.header['arrays']['string_blob'][1]
+        self._seq_rows = None
+
+    def __len__(self):
+        return len(self.transcript_id)
+
+    def string_bytes(self, i):
+        start, end = self.string_offsets[i], self.string_offsets[i + 1]
+        return self.buffer[self._blob_start + start:self._blob_start + end]
+
+    def string(self, i):
+        return None if i < 0 else self.string_bytes(i).decode('utf-8')
+
+    def find(self, transcript_id):
+        """Row of ``transcript_id`` (or its unprefixed alias), or None."""
+        key = transcript_id.encode('utf-8')
+        keys = _LookupKeys(self)
+        i = bisect.bisect_left(keys, key)
+        if i < len(keys) and keys[i] == key:
+            return int(self.lookup_row[i])
+        return None
+
+    def __contains__(self, transcript_id):
+        return self.find(transcript_id) is not None
+
+    def attributes(self, row):
+        attributes = {}
+        for key, column in (('Parent', self.transcript_parent), ('Locus_id', self.transcript_locus)):
+            if column[row] >= 0:
+                attributes[key] = [self.string(column[row])]
+        return attributes
+
+    def record(self, row, columns=False):
+        """``GeneStructureInfo``-shaped dict for ``row``.
+
+        Feature kinds are lists of ``{start, end}`` dicts, or with ``columns``
+        ``Positions`` over the mapped arrays (what ``structure_arrays`` and the
+        renderers read fastest).
+        """
+        start, end = int(self.transcript_start[row]), int(self.transcript_end[row])
+        record = {
+            'transcript_id': self.string(self.transcript_id[row]),
+            'seq_id': self.string(self.transcript_seq[row]),
+            'strand': STRAND_NAMES[int(self.transcript_strand[row])],
+            'total_length': end - start,
+            'start': start,
+            'end': end,
+            'attributes': self.attributes(row),
+        }
+        offsets = self.feature_offsets[row * N_KINDS:(row + 1) * N_KINDS + 1].tolist()
+        for k, (_, name, _) in enumerate(KIND_FIELDS):
+            starts = self.feature_start[offsets[k]:offsets[k + 1]]
+            ends = self.feature_end[offsets[k]:offsets[k + 1]]
+            if columns:
+                record[name] = Positions(starts.astype(np.int64), ends.astype(np.int64))
+            else:
+                record[name] = [{'start': s, 'end': e} for s, e in zip(starts.tolist(), ends.tolist())]
+        return record
+
+    def structure(self, transcript_id, columns=False):
+        """Same contract as ``GffIndex.structure``: the record of ``transcript_id``, or None."""
+        row = self.find(transcript_id)
+        return None if row is None else self.record(row, columns)
+
+    def records(self, columns=False):
+        for row in range(len(self)):
+            yield self.record(row, columns)
+
+    def _seq_range(self, seq_id):
+        if self._seq_rows is None:
+            seqs = self.transcript_seq
+            bounds = np.flatnonzero(np.diff(seqs)) + 1
+            firsts = np.concatenate(([0], bounds)).tolist()
+            lasts = np.concatenate((bounds, [len(seqs)])).tolist()
+            self._seq_rows = {self.string(seqs[lo]): (lo, hi) for lo, hi in zip(firsts, lasts) if hi > lo}
+        return self._seq_rows.get(seq_id)
+
+    def region_rows(self, seq_id, start, end):
+        """Rows overlapping ``seq_id:start-end``, in start order (see ``gff.RegionIndex``)."""
+        rows = self._seq_range(seq_id)
+        if rows is None:
+            return []
+        lo, hi = rows
+        first = lo + int(np.searchsorted(self.transcript_max_end[lo:hi], start, side='left'))
+        last = lo + int(np.searchsorted(self.transcript_start[lo:hi], end, side='right'))
+        candidates = np.arange(first, last)
+        return candidates[self.transcript_end[first:last] >= start].tolist()
+
+    def overlapping_rows(self, seq_id, starts, ends):
+        """Rows on ``seq_id`` overlapping any of the intervals ``starts[i]..ends[i]``, in start order.
+
+        With the intervals sorted by start and the running maximum of their
+        ends, a transcript overlaps one iff the intervals starting at or before
+        its end reach its start, so every row is tested with one bisection.
+        """
+        rows = self._seq_range(seq_id)
+        if rows is None or not len(starts):
+            return []
+        lo, hi = rows
+        order = np.argsort(starts, kind='stable')
+        starts = np.asarray(starts)[order]
+        reach = np.maximum.accumulate(np.asarray(ends)[order])
+        k = np.searchsorted(starts, self.transcript_end[lo:hi], side='right')
+        hit = k > 0
+        hit[hit] = reach[k[hit] - 1] >= self.transcript_start[lo:hi][hit]
+        return (lo + np.flatnonzero(hit)).tolist()
+
+    def region(self, seq_id, start, end, columns=False):
+        return [self.record(row, columns) for row in self.region_rows(seq_id, start, end)]
+
+    def close(self):
+        for name in self.header['arrays']:
+            delattr(self, name)
+        self.buffer.close()
+
+
+class _LookupKeys:
+    """Sorted lookup keys as a sequence of bytes, decoded only where bisect looks."""
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def __len__(self):
+        return len(self.snapshot.lookup_key)
+
+    def __getitem__(self, i):
+        return self.snapshot.string_bytes(self.snapshot.lookup_key[i])
+
+
+class SnapshotTranscripts(Mapping):
+    """``{transcript_id: record}`` view of a snapshot, for the API's annotation store.
+
+    Records are built on every access and not kept; only assigned variants
+    (``set_variants``) are stored, so memory grows with the transcripts that
+    have variants rather than with those that were read.
+    """
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.variants = {}
+
+    def __getitem__(self, transcript_id):
+        row = self.snapshot.find(transcript_id)
+        if row is None or self.snapshot.string(self.snapshot.transcript_id[row]) != transcript_id:
+            raise KeyError(transcript_id)
+        record = self.snapshot.record(row, columns=False)
+        if transcript_id in self.variants:
+            record['variants'] = self.variants[transcript_id]
+        return record
+
+    def __iter__(self):
+        for i in self.snapshot.transcript_id:
+            yield self.snapshot.string(i)
+
+    def __len__(self):
+        return len(self.snapshot)
+
+    def search_entries(self):
+        """``api.search`` entries read straight from the columns, without building records."""
+        from api.search import attribute_entries
+
+        snapshot = self.snapshot
+        for row in range(len(snapshot)):
+            yield from attribute_entries(snapshot.string(snapshot.transcript_id[row]), snapshot.attributes(row))
+
+    def overlapping(self, variants):
+        """Records of the transcripts overlapping any of ``variants`` (dicts with seq_id, start, end)."""
+        by_seq = {}
+        for variant in variants:
+            spans = by_seq.setdefault(variant['seq_id'], ([], []))
+            spans[0].append(variant['start'])
+            spans[1].append(variant['end'])
+        return [self.snapshot.record(row, columns=False)
+                for seq_id, (starts, ends) in by_seq.items()
+                for row in self.snapshot.overlapping_rows(seq_id, starts, ends)]
+
+    def set_variants(self, variants):
+        """Replace all assigned variants with ``{transcript_id: [variant, ...]}``."""
+        self.variants = dict(variants)
+
+    def query(self, seq_id, start, end):
+        """IDs overlapping ``seq_id:start-end``, like ``gff.RegionIndex.query``."""
+        return [self.snapshot.string(self.snapshot.transcript_id[row])
+                for row in self.snapshot.region_rows(seq_id, start, end)]
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) not in (1, 2):
+        print(f'usage: python -m api.snapshot annotation.gff3 [annotation{SNAPSHOT_SUFFIX}]', file=sys.stderr)
+        return 2
+    gff_path = argv[0]
+    path = argv[1] if len(argv) == 2 else os.path.splitext(gff_path)[0] + SNAPSHOT_SUFFIX
+    n = build_snapshot(gff_path, path)
+    print(f'{n} transcripts -> {path} ({os.path.getsize(path)} bytes)', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
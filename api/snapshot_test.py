@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pytest
+
+from api.geometry import Positions, structure_arrays
+from api.gff import GffIndex, iter_transcripts
+from api.snapshot import Snapshot, SnapshotTranscripts, build_snapshot, main
+
+
+UTILS_DIR = os.path.join(os.path.dirname(__file__), '..', 'app', 'utils')
+RICE_GFF = os.path.join(UTILS_DIR, 'transcripts.gff')
+SORGHUM_GFF = os.path.join(UTILS_DIR, 'Sorghum_bicolor.Sorghum_bicolor_NCBIv3.51.gff3')
+
+
+@pytest.fixture
+def rice_snapshot(tmp_path):
+    path = str(tmp_path / 'rice.gssnap')
+    assert build_snapshot(RICE_GFF, path) == 15
+    snapshot = Snapshot(path)
+    yield snapshot
+    snapshot.close()
+
+
+def test_snapshot_records_match_the_gff(rice_snapshot):
+    with open(RICE_GFF) as inp:
+        expected = list(iter_transcripts(inp))
+    for record in expected:
+        structure = rice_snapshot.structure(record['transcript_id'])
+        for key in ('transcript_id', 'seq_id', 'strand', 'start', 'end', 'total_length',
+                    'cds', 'exons', 'five_prime_utrs', 'three_prime_utrs'):
+            assert structure[key] == record[key], (record['transcript_id'], key)
+        assert structure['attributes'].get('Locus_id') == record['attributes'].get('Locus_id')
+    assert rice_snapshot.structure('Os01t0100100') is None
+    assert len(rice_snapshot) == len(expected)
+
+
+def test_snapshot_columns_feed_structure_arrays(rice_snapshot):
+    columns = rice_snapshot.structure('Os01t0100100-01', columns=True)
+    assert isinstance(columns['cds'], Positions)
+    for got, expected in zip(structure_arrays(columns),
+                             structure_arrays(rice_snapshot.structure('Os01t0100100-01'))):
+        np.testing.assert_array_equal(got, expected)
+
+
+def test_snapshot_region_matches_the_gff_index(rice_snapshot, tmp_path):
+    index = GffIndex(RICE_GFF, str(tmp_path / 'rice.gsidx'))
+    for seq_id, start, end in [('chr01', 12000, 13000), ('chr01', 1, 10 ** 9), ('chr01', 60000, 61000),
+                               ('chr09', 1, 100)]:
+        expected = index.regions.query(seq_id, start, end)
+        assert [s['transcript_id'] for s in rice_snapshot.region(seq_id, start, end)] == expected
+
+
+def test_snapshot_resolves_ensembl_prefix(tmp_path):
+    path = str(tmp_path / 'sorghum.gssnap')
+    assert main([SORGHUM_GFF, path]) == 0
+    snapshot = Snapshot(path)
+    assert snapshot.structure('EER90453')['transcript_id'] == 'transcript:EER90453'
+
+
+def test_snapshot_overlapping_rows_match_region_queries(rice_snapshot):
+    starts = [12000, 3500, 60000, 40000]
+    ends = [13000, 3500, 61000, 40000]
+    expected = sorted({row for start, end in zip(starts, ends)
+                       for row in rice_snapshot.region_rows('chr01', start, end)})
+    assert rice_snapshot.overlapping_rows('chr01', starts, ends) == expected
+    assert rice_snapshot.overlapping_rows('chr09', starts, ends) == []
+
+
+def test_snapshot_transcripts_keep_variants(rice_snapshot):
+    transcripts = SnapshotTranscripts(rice_snapshot)
+    assert list(transcripts)[:2] == ['Os01t0100100-01', 'Os01t0100200-01']
+    overlapping = transcripts.overlapping([{'seq_id': 'chr01', 'start': 3500, 'end': 3500}])
+    assert [record['transcript_id'] for record in overlapping] == ['Os01t0100100-01']
+    transcripts.set_variants({'Os01t0100100-01': ['x']})
+    assert transcripts['Os01t0100100-01']['variants'] == ['x']
+    assert 'variants' not in transcripts['Os01t0100200-01']
+    assert transcripts.get('Os01t0100100') is None
+    assert transcripts.query('chr01', 12000, 13000)[0] == 'Os01t0100200-01'
+
+
+def test_snapshot_rejects_other_files(tmp_path):
+    path = tmp_path / 'not.gssnap'
+    path.write_bytes(b'##gff-version 3\n')
+    with pytest.raises(ValueError):
+        Snapshot(str(path))
@@ -0,0 +1,275 @@
+"""Lightweight SVG writer with the subset of the svgwrite API used for gene figures.
+
+``SvgBuffer`` formats elements straight into a list of strings instead of
+building and validating an svgwrite element tree. Attribute order, number
+rounding and escaping follow svgwrite's ``profile='tiny'`` output, so for valid
+input ``SvgBuffer(...).tostring()`` is byte-identical to
+``svgwrite.Drawing(..., profile='tiny').tostring()``.
+"""
+
+SVG_OPEN = (
+    '<svg baseProfile="tiny" height="{}" version="1.2" width="{}" '
+    'xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" '
+    'xmlns:xlink="http://www.w3.org/1999/xlink">'
+)
+RECT = '<rect fill="{}" height="{}" stroke="{}" stroke-width="{}" width="{}" x="{}" y="{}" />'
+LINE = '<line stroke="{}" stroke-width="{}" x1="{}" x2="{}" y1="{}" y2="{}" />'
+RECT_KEYS = frozenset(('fill', 'stroke', 'stroke_width'))
+LINE_KEYS = frozenset(('stroke', 'stroke_width'))
+
+
+def fmt(value):
+    # svgwrite (tiny profile) rounds floats to 4 digits and str()s everything else
+    if isinstance(value, float):
+        value = round(value, 4)
+    return str(value)
+
+
+def escape(value):
+    value = str(value)
+    if '&' in value:
+        value = value.replace('&', '&amp;')
+    if '<' in value:
+        value = value.replace('<', '&lt;')
+    if '>' in value:
+        value = value.replace('>', '&gt;')
+    if '"' in value:
+        value = value.replace('"', '&quot;')
+    if '\n' in value:
+        value = value.replace('\n', '&#10;')
+    return value
+
+
+def fmt_points(points):
+    return ' '.join(f'{fmt(x)},{fmt(y)}' for x, y in points)
+
+
+def element(name, attribs, text=None):
+    """Serialise an element with svgwrite's sorted, hyphenated attribute names."""
+    parts = [f'<{name}']
+    for key, value in sorted((k.replace('_', '-'), v) for k, v in attribs.items()):
+        if value is None:
+            continue
+        value = fmt(value)
+        if value:
+            parts.append(f' {key}="{escape(value)}"')
+    if text is None:
+        parts.append(' />')
+    else:
+        text = str(text).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        parts.append(f'>{text}</{name}>')
+    return ''.join(parts)
+
+
+class LinearGradient:
+
+    def __init__(self, start, end, id):
+        self.attribs = {'id': id, 'x1': start[0], 'y1': start[1], 'x2': end[0], 'y2': end[1]}
+        self.stops = []
+
+    def add_stop_color(self, offset, color):
+        self.stops.append(element('stop', {'offset': offset, 'stop_color': color}))
+        return self
+
+    def tostring(self):
+        head = element('linearGradient', self.attribs)
+        if not self.stops:
+            return head
+        return head[:-3] + '>' + ''.join(self.stops) + '</linearGradient>'
+
+
+class Defs:
+
+    def __init__(self):
+        self.elements = []
+
+    def add(self, element):
+        self.elements.append(element)
+        return element
+
+    def tostring(self):
+        if not self.elements:
+            return '<defs />'
+        return '<defs>' + ''.join(e.tostring() for e in self.elements) + '</defs>'
+
+
+class SvgBuffer:
+    """Drop-in replacement for ``svgwrite.Drawing(size=..., profile='tiny')``."""
+
+    def __init__(self, size):
+        self.width, self.height = size
+        self.defs = Defs()
+        self.elements = []
+
+    def add(self, element):
+        self.elements.append(element)
+        return element
+
+    def linearGradient(self, start, end, id):
+        return LinearGradient(start, end, id)
+
+    def rect(self, insert, size, **attribs):
+        if attribs.keys() == RECT_KEYS:
+            return RECT.format(
+                escape(fmt(attribs['fill'])), fmt(size[1]), escape(fmt(attribs['stroke'])),
+                fmt(attribs['stroke_width']), fmt(size[0]), fmt(insert[0]), fmt(insert[1]),
+            )
+        return element('rect', dict(attribs, x=insert[0], y=insert[1], width=size[0], height=size[1]))
+
+    def line(self, start, end, **attribs):
+        if attribs.keys() == LINE_KEYS:
+            return LINE.format(
+                escape(fmt(attribs['stroke'])), fmt(attribs['stroke_width']),
+                fmt(start[0]), fmt(end[0]), fmt(start[1]), fmt(end[1]),
+            )
+        return element('line', dict(attribs, x1=start[0], y1=start[1], x2=end[0], y2=end[1]))
+
+    def circle(self, center, r, **attribs):
+        return element('circle', dict(attribs, cx=center[0], cy=center[1], r=r))
+
+    def polygon(self, points, **attribs):
+        return element('polygon', dict(attribs, points=fmt_points(points)))
+
+    def polyline(self, points, **attribs):
+        return element('polyline', dict(attribs, points=fmt_points(points)))
+
+    def text(self, text, insert, **attribs):
+        return element('text', dict(attribs, x=insert[0], y=insert[1]), text=text)
+
+    def tostring(self):
+        return ''.join([
+            SVG_OPEN.format(fmt(self.height), fmt(self.width)),
+            self.defs.tostring(),
+            *self.elements,
+            '</svg>',
+        ])
+
+
+PATH_SVG_OPEN = (
+    '<svg baseProfile="full" height="{}" version="1.1" width="{}" '
+    'xmlns="http://www.w3.org/2000/svg" xmlns:xlink="http://www.w3.org/1999/xlink">'
+)
+# SVG attribute -> CSS property, in the order they are written to the <style> block
+STYLE_PROPERTIES = (('fill', 'fill'), ('stroke', 'stroke'), ('stroke_width', 'stroke-width'),
+                    ('stroke_dasharray', 'stroke-dasharray'))
+
+
+def fmt_path(*values):
+    return ' '.join(fmt(v) for v in values)
+
+
+def css_text(value):
+    return str(value).replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+
+
+class PathBuffer:
+    """``SvgBuffer`` counterpart that merges elements sharing a style into one ``<path>``.
+
+    Each distinct fill/stroke combination becomes a class in a ``<style>``
+    block, and every rect, line and polyline drawn with it becomes a subpath
+    of that class's ``<path>``. Polygons and circles that repeat with the same
+    shape become a ``<symbol>`` placed with ``<use>``.
+
+    Merging only happens within a row: the caller sets ``row`` before drawing
+    each transcript, and rows are written in order, each as its paths in the
+    order their style first appears in that row. Paint order between rows is
+    therefore kept, while within a row later elements of an earlier style move
+    below the first element of a newer one. Gradient fills are in object
+    bounding box units, so those paths are also split by vertical extent to
+    keep each gradient's height.
+    """
+
+    def __init__(self, size):
+        self.width, self.height = size
+        self.defs = Defs()
+        self.row = 0
+        # (style, band, d, origin, row): origin is the anchor of a relocatable glyph, else None
+        self.elements = []
+
+    def add(self, element):
+        self.elements.append((*element, self.row))
+        return element
+
+    def linearGradient(self, start, end, id):
+        return LinearGradient(start, end, id)
+
+    def _style(self, attribs, default_fill):
+        attribs = dict(attribs)
+        attribs.setdefault('fill', default_fill)
+        return tuple((prop, fmt(attribs[key])) for key, prop in STYLE_PROPERTIES if attribs.get(key) is not None)
+
+    def _band(self, attribs, y, height):
+        fill = attribs.get('fill')
+        return (fmt(y), fmt(height)) if isinstance(fill, str) and fill.startswith('url(') else None
+
+    def rect(self, insert, size, **attribs):
+        x, y = insert
+        width, height = size
+        d = f'M{fmt_path(x, y)}h{fmt(width)}v{fmt(height)}h{fmt(-width)}z'
+        return (self._style(attribs, 'black'), self._band(attribs, y, height), d, None)
+
+    def line(self, start, end, **attribs):
+        if start[1] == end[1]:
+            d = f'M{fmt_path(*start)}H{fmt(end[0])}'
+        elif start[0] == end[0]:
+            d = f'M{fmt_path(*start)}V{fmt(end[1])}'
+        else:
+            d = f'M{fmt_path(*start)}L{fmt_path(*end)}'
+        return (self._style(attribs, 'none'), None, d, None)
+
+    def polyline(self, points, **attribs):
+        d = f'M{fmt_path(*points[0])}L' + ' '.join(fmt_path(*p) for p in points[1:])
+        return (self._style(attribs, 'black'), None, d, None)
+
+    def polygon(self, points, **attribs):
+        x0, y0 = points[0]
+        d = 'l' + ' '.join(fmt_path(x - px, y - py) for (px, py), (x, y) in zip(points, points[1:])) + 'z'
+        return (self._style(attribs, 'black'), None, d, (x0, y0))
+
+    def circle(self, center, r, **attribs):
+        cx, cy = center
+        d = f'm{fmt(-r)} 0a{fmt_path(r, r)} 0 1 0 {fmt(2 * r)} 0a{fmt_path(r, r)} 0 1 0 {fmt(-2 * r)} 0z'
+        return (self._style(attribs, 'black'), None, d, (cx, cy))
+
+    def tostring(self):
+        glyph_counts = {}
+        for style, _, d, origin, _ in self.elements:
+            if origin is not None:
+                glyph_counts[style, d] = glyph_counts.get((style, d), 0) + 1
+
+        classes = {}
+        symbols = {}
+        groups = {}
+        for style, band, d, origin, row in self.elements:
+            name = classes.setdefault(style, f's{len(classes)}')
+            if origin is not None and glyph_counts[style, d] > 1:
+                symbol = symbols.setdefault((style, d), f'g{len(symbols)}')
+                groups.setdefault(('use', row, symbol), []).append(
+                    f'<use x="{fmt(origin[0])}" xlink:href="#{symbol}" y="{fmt(origin[1])}" />')
+                continue
+            if origin is not None:
+                d = f'M{fmt_path(*origin)}{d}'
+            groups.setdefault(('path', row, name, band), []).append(d)
+
+        style_rules = ''.join(
+            f'.{name}{{' + ';'.join(f'{prop}:{value}' for prop, value in style) + '}'
+            for style, name in classes.items()
+        )
+        defs = [e.tostring() for e in self.defs.elements]
+        defs.append(f'<style type="text/css">{css_text(style_rules)}</style>')
+        for (style, d), symbol in symbols.items():
+            defs.append(f'<symbol id="{symbol}" overflow="visible">'
+                        f'<path class="{classes[style]}" d="M0 0{d}" /></symbol>')
+
+        body = []
+        for key, parts in groups.items():
+            if key[0] == 'use':
+                body.extend(parts)
+            else:
+                body.append(f'<path class="{key[2]}" d="{escape("".join(parts))}" />')
+        return ''.join([
+            PATH_SVG_OPEN.format(fmt(self.height), fmt(self.width)),
+            '<defs>', *defs, '</defs>',
+            *body,
+            '</svg>',
+        ])
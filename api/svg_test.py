@@ -0,0 +1,163 @@
+import os
+import re
+
+import pytest
+import svgwrite
+
+from api.gff import iter_transcripts
+from api.index import DrawSettings, GeneStructureInfo, Variant
+from api.render import render_gene_structures_svg
+from api.svg import SvgBuffer
+
+
+UTILS_DIR = os.path.join(os.path.dirname(__file__), '..', 'app', 'utils')
+GFFS = [
+    os.path.join(UTILS_DIR, 'transcripts.gff'),
+    os.path.join(UTILS_DIR, 'Sorghum_bicolor.Sorghum_bicolor_NCBIv3.51.gff3'),
+]
+
+DRAW_SETTINGS = DrawSettings(
+    mode='gene',
+    utr_color='#d3d3d3',
+    exon_color='#0077cc',
+    line_color='#000000',
+    intron_shape='straight',
+)
+
+
+def load_structures(path):
+    with open(path) as inp:
+        structures = [GeneStructureInfo(**t) for t in iter_transcripts(inp)]
+    # CDS のないものは描画できないので比較対象から除く
+    return [s for s in structures if s.cds]
+
+
+@pytest.mark.parametrize('path', GFFS)
+def test_fast_backend_matches_svgwrite_per_transcript(path):
+    for structure in load_structures(path):
+        expected = render_gene_structures_svg([structure], DRAW_SETTINGS, backend='svgwrite')
+        assert render_gene_structures_svg([structure], DRAW_SETTINGS, backend='fast') == expected
+
+
+def test_fast_backend_matches_svgwrite_for_batches():
+    structures = load_structures(GFFS[0])[:6]
+    expected = render_gene_structures_svg(structures, DRAW_SETTINGS, backend='svgwrite')
+    assert render_gene_structures_svg(structures, DRAW_SETTINGS, backend='fast') == expected
+
+
+@pytest.mark.parametrize('deletion_shape', ['zigzag', 'dashed'])
+def test_fast_backend_matches_svgwrite_with_variants(deletion_shape):
+    structures = load_structures(GFFS[0])[:3]
+    for structure in structures:
+        structure.variants = [
+            Variant(start=structure.start + 10, end=structure.start + 10, kind='substitution'),
+            Variant(start=structure.start + 100, end=structure.start + 180, kind='deletion'),
+            Variant(start=structure.start + 300, end=structure.start + 300, kind='insertion'),
+        ]
+    draw_settings = DRAW_SETTINGS.model_copy(update={'deletion_shape': deletion_shape})
+    expected = render_gene_structures_svg(structures, draw_settings, backend='svgwrite')
+    assert render_gene_structures_svg(structures, draw_settings, backend='fast') == expected
+    assert expected.count('<circle') == 3
+
+
+def test_svg_buffer_matches_svgwrite_elements():
+    kwargs = dict(fill='red', stroke='#000', stroke_width=2)
+    expected = svgwrite.Drawing(size=(100.123456, 50), profile='tiny')
+    actual = SvgBuffer(size=(100.123456, 50))
+    for dwg in (expected, actual):
+        grad = dwg.linearGradient(start=('0%', '100%'), end=('0%', '0%'), id='grad_0')
+        grad.add_stop_color(offset='0.0', color='#ff0000')
+        dwg.defs.add(grad)
+        dwg.add(dwg.rect(insert=(1 / 3, 100), size=(2 / 3, 20), **kwargs))
+        dwg.add(dwg.line(start=(0.0, 1.5), end=(3, 1.5), stroke='#000', stroke_width=1))
+        dwg.add(dwg.polygon(points=[(1, 2), (3.5, 4.123456)], **kwargs))
+        dwg.add(dwg.polyline(points=[(1, 2), (3.5, 4)], fill='none', stroke='#000', stroke_width=1))
+        dwg.add(dwg.line(start=(0, 1), end=(3, 1), stroke='#000', stroke_width=1, stroke_dasharray='5,1'))
+        dwg.add(dwg.circle(center=(1.5, 2), r=2.5, **kwargs))
+        dwg.add(dwg.text('a<b', insert=(1, 2), text_anchor='end', font_size='14px'))
+    assert actual.tostring() == expected.tostring()
+
+
+RECT_ELEMENT = re.compile(r'<rect fill="([^"]+)" height="([^"]+)" stroke="[^"]+" stroke-width="[^"]+" '
+                          r'width="([^"]+)" x="([^"]+)" y="([^"]+)" />')
+RECT_SUBPATH = re.compile(r'M(\S+) (\S+?)h(\S+?)v(\S+?)h\S+?z')
+PATH_ELEMENT = re.compile(r'<path class="(s\d+)" d="([^"]+)" />')
+STYLE_RULE = re.compile(r'\.(s\d+)\{fill:([^;]+);')
+
+
+def rects_of_elements(svg):
+    return sorted((fill, float(x), float(y), float(w), float(h)) for fill, h, w, x, y in RECT_ELEMENT.findall(svg))
+
+
+def rects_of_paths(svg):
+    fills = dict(STYLE_RULE.findall(svg))
+    return sorted(
+        (fills[name], float(x), float(y), float(w), float(h))
+        for name, d in PATH_ELEMENT.findall(svg)
+        for x, y, w, h in RECT_SUBPATH.findall(d)
+    )
+
+SHAPE_ELEMENT = re.compile(r'<(rect|line|polyline|polygon|circle|use|path) ([^>]*)/>')
+ATTRIBUTE = re.compile(r'([\w:-]+)="([^"]*)"')
+SUBPATH = re.compile(r'M[-\d.]+ ([-\d.]+)([a-zA-Z])')
+SHAPE_KINDS = {'rect': 'rect', 'line': 'line', 'polyline': 'line', 'polygon': 'glyph', 'circle': 'glyph',
+               'use': 'glyph'}
+
+
+def paint_order(svg, draw_settings):
+    """``(row, kind)`` of every drawn shape in paint order; kind is rect, line or glyph."""
+    row_h = draw_settings.gene_h * 2
+
+    def row_of(y):
+        # glyphs and insertion marks reach a little above and below their row
+        return int((float(y) - draw_settings.margin_y + row_h * 0.3) // row_h)
+
+    order = []
+    for name, attribs in SHAPE_ELEMENT.findall(svg.split('</defs>', 1)[1]):
+        attribs = dict(ATTRIBUTE.findall(attribs))
+        if name == 'path':
+            order.extend((row_of(y), 'rect' if command == 'h' else 'line')
+                         for y, command in SUBPATH.findall(attribs['d']))
+            continue
+        if 'points' in attribs:
+            y = attribs['points'].split()[0].split(',')[1]
+        else:
+            y = attribs.get('y', attribs.get('y1', attribs.get('cy')))
+        order.append((row_of(y), SHAPE_KINDS[name]))
+    return order
+
+
+def first_kinds_by_row(order):
+    rows = {}
+    for row, kind in order:
+        kinds = rows.setdefault(row, [])
+        if kind not in kinds:
+            kinds.append(kind)
+    return rows
+
+
+def test_merged_paths_draw_the_same_features():
+    structures = load_structures(GFFS[0])[:6]
+    for structure in structures[:3]:
+        structure.variants = [
+            Variant(start=structure.start + 10, end=structure.start + 10, kind='substitution'),
+            Variant(start=structure.start + 500, end=structure.start + 500, kind='substitution'),
+            Variant(start=structure.start + 100, end=structure.start + 180, kind='deletion'),
+            Variant(start=structure.start + 300, end=structure.start + 300, kind='insertion'),
+        ]
+    elements = render_gene_structures_svg(structures, DRAW_SETTINGS)
+    paths = render_gene_structures_svg(structures, DRAW_SETTINGS.model_copy(update={'merge_paths': True}))
+
+    assert rects_of_paths(paths) == rects_of_elements(elements)
+    # rows are painted in order, and within a row insertion marks still cover the exons
+    element_order = paint_order(elements, DRAW_SETTINGS)
+    path_order = paint_order(paths, DRAW_SETTINGS)
+    assert sorted(path_order) == sorted(element_order)
+    assert [row for row, _ in path_order] == sorted(row for row, _ in path_order)
+    assert first_kinds_by_row(path_order) == first_kinds_by_row(element_order)
+    # one path per style per row, repeated glyphs via <use>
+    assert paths.count('<path class="s2"') == len(structures)
+    assert paths.count('<use ') == elements.count('<circle') + elements.count('<polygon') == 9
+    assert paths.count('<symbol ') == 2
+    assert paths.count('<') < elements.count('<') / 2
+    assert len(paths) < len(elements) / 2
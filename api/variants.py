@@ -0,0 +1,160 @@
+"""VCF variants: streaming reader, transcript assignment and per-transcript context."""
+import heapq
+import itertools
+
+import numpy as np
+
+from api.geometry import CDS, DRAWN_KINDS, FIVE_PRIME_UTR, THREE_PRIME_UTR, CoordinateMapper, field, structure_arrays
+
+
+CONTEXT_NAMES = {
+    CDS: 'CDS',
+    FIVE_PRIME_UTR: 'five_prime_UTR',
+    THREE_PRIME_UTR: 'three_prime_UTR',
+}
+
+
+def classify(pos, ref, alt, info):
+    """Return ``(kind, start, end)`` of one REF/ALT pair, or None for unsupported ALTs.
+
+    Deletions and insertions drop the VCF anchor base: a deletion spans the
+    removed bases and an insertion sits between ``start`` and ``start + 1``.
+    """
+    if alt.startswith('<'):
+        if alt.startswith('<DEL') and 'END' in info:
+            return 'deletion', pos + 1, int(info['END'])
+        return None
+    if alt in ('.', '*'):
+        return None
+    if len(ref) == len(alt):
+        return 'substitution', pos, pos + len(ref) - 1
+    if len(ref) > len(alt):
+        return 'deletion', pos + len(alt), pos + len(ref) - 1
+    return 'insertion', pos + len(ref) - 1, pos + len(ref) - 1
+
+
+def parse_info(column):
+    info = {}
+    if column == '.':
+        return info
+    for item in column.split(';'):
+        key, _, value = item.partition('=')
+        info[key] = value
+    return info
+
+
+def iter_vcf(lines):
+    """Stream variants out of VCF text lines, one dict per ALT allele."""
+    for line in lines:
+        if line.startswith('#') or not line.strip():
+            continue
+        fields = line.rstrip('\r\n').split('\t')
+        if len(fields) < 5:
+            continue
+        chrom, pos, variant_id, ref, alts = fields[:5]
+        info = parse_info(fields[7]) if len(fields) > 7 else {}
+        for alt in alts.split(','):
+            classified = classify(int(pos), ref, alt, info)
+            if classified is None:
+                continue
+            kind, start, end = classified
+            yield {
+                'seq_id': chrom,
+                'start': start,
+                'end': end,
+                'kind': kind,
+                'ref': ref,
+                'alt': alt,
+                'id': None if variant_id == '.' else variant_id,
+            }
+
+
+def assign_variants(transcripts, variants):
+    """Assign variants to the transcripts whose span they overlap.
+
+    Both inputs are sorted by (seqid, start) and swept together twice. A
+    transcript and a variant overlap iff one starts inside the other, so the
+    first sweep walks the transcripts with a heap of the variants started
+    before each one and still open at its start, and the second walks the
+    variants with a heap of the transcripts started at or before each one and
+    still open. Every heap entry left after eviction is an overlap, so the cost
+    is O((n + m) log(n + m) + overlaps) rather than a transcript scan per
+    variant. Returns ``{transcript_id: [variant, ...]}`` with each list in
+    (start) order.
+    """
+    transcripts = sorted(transcripts, key=lambda t: (field(t, 'seq_id'), field(t, 'start')))
+    variants = sorted(variants, key=lambda v: (v['seq_id'], v['start']))
+    assigned = {}
+
+    by_seq = itertools.groupby(transcripts, key=lambda t: field(t, 'seq_id'))
+    transcripts_by_seq = {seq_id: list(group) for seq_id, group in by_seq}
+    for seq_id, group in itertools.groupby(variants, key=lambda v: v['seq_id']):
+        seq_variants = list(group)
+        seq_transcripts = transcripts_by_seq.get(seq_id, [])
+
+        # variants starting before the transcript and reaching its start
+        active = []
+        next_variant = 0
+        for transcript in seq_transcripts:
+            start = field(transcript, 'start')
+            while next_variant < len(seq_variants) and seq_variants[next_variant]['start'] < start:
+                heapq.heappush(active, (seq_variants[next_variant]['end'], next_variant))
+                next_variant += 1
+            while active and active[0][0] < start:
+                heapq.heappop(active)
+            if active:
+                assigned[field(transcript, 'transcript_id')] = [seq_variants[i] for i in sorted(i for _, i in active)]
+
+        # transcripts starting at or before the variant and reaching its start
+        active = []
+        next_transcript = 0
+        for variant in seq_variants:
+            while (next_transcript < len(seq_transcripts)
+                   and field(seq_transcripts[next_transcript], 'start') <= variant['start']):
+                transcript = seq_transcripts[next_transcript]
+                heapq.heappush(active, (field(transcript, 'end'), next_transcript))
+                next_transcript += 1
+            while active and active[0][0] < variant['start']:
+                heapq.heappop(active)
+            for _, index in active:
+                transcript_id = field(seq_transcripts[index], 'transcript_id')
+                assigned.setdefault(transcript_id, []).append(variant)
+    return assigned
+
+
+def annotate_variants(gene_structure, variants):
+    """Add ``context``, ``cdna`` and ``protein`` to each variant of one transcript.
+
+    ``context`` is the feature containing the variant start (CDS, five_prime_UTR,
+    three_prime_UTR or intron). Lookups are vectorised over all variants.
+    """
+    if not variants:
+        return variants
+    starts, ends, kinds = structure_arrays(gene_structure)
+    drawn = np.isin(kinds, DRAWN_KINDS)
+    order = np.argsort(starts[drawn], kind='stable')
+    seg_starts = starts[drawn][order]
+    seg_ends = ends[drawn][order]
+    seg_kinds = kinds[drawn][order]
+
+    positions = np.array([v['start'] for v in variants], dtype=np.int64)
+    index = np.searchsorted(seg_starts, positions, side='right') - 1
+    safe = np.clip(index, 0, None)
+    inside = (index >= 0) & (positions <= seg_ends[safe]) if len(seg_starts) else np.zeros(len(positions), bool)
+
+    mapper = CoordinateMapper.from_structure(gene_structure) if len(seg_starts) else None
+    cdna = mapper.genomic_to_cdna(positions) if mapper else np.full(len(positions), -1)
+    protein = (mapper.genomic_to_protein(positions)
+               if mapper is not None and mapper.cds_offset is not None
+               else np.full(len(positions), -1))
+
+    annotated = []
+    for i, variant in enumerate(variants):
+        context = CONTEXT_NAMES[int(seg_kinds[safe[i]])] if inside[i] else 'intron'
+        annotated.append(dict(
+            variant,
+            context=context,
+            cdna=int(cdna[i]) if cdna[i] > 0 else None,
+            protein=int(protein[i]) if protein[i] > 0 else None,
+        ))
+    return annotated
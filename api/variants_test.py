@@ -0,0 +1,105 @@
+import random
+import time
+
+from api.variants import annotate_variants, assign_variants, iter_vcf
+
+
+VCF = """##fileformat=VCFv4.2
+#CHROM	POS	ID	REF	ALT	QUAL	FILTER	INFO
+chr01	100	rs1	A	G	.	PASS	.
+chr01	200	.	ACGT	A	.	PASS	.
+chr01	300	.	A	ATT,C	.	PASS	.
+chr01	400	sv1	N	<DEL>	.	PASS	SVTYPE=DEL;END=450
+chr01	500	.	N	<INV>	.	PASS	END=600
+"""
+
+
+def make_transcript(transcript_id, seq_id, start, end, strand='+'):
+    return {
+        'transcript_id': transcript_id,
+        'seq_id': seq_id,
+        'strand': strand,
+        'start': start,
+        'end': end,
+        'exons': [],
+        'cds': [{'start': start, 'end': end}],
+        'five_prime_utrs': [],
+        'three_prime_utrs': [],
+    }
+
+
+def test_iter_vcf_classifies_and_splits_alleles():
+    variants = list(iter_vcf(VCF.splitlines(keepends=True)))
+    assert [(v['kind'], v['start'], v['end']) for v in variants] == [
+        ('substitution', 100, 100),
+        ('deletion', 201, 203),
+        ('insertion', 300, 300),
+        ('substitution', 300, 300),
+        ('deletion', 401, 450),
+    ]
+    assert variants[0]['id'] == 'rs1'
+    assert variants[1]['id'] is None
+
+
+def test_assign_variants_matches_brute_force():
+    rng = random.Random(0)
+    transcripts = []
+    for i in range(300):
+        start = rng.randrange(1, 100_000)
+        transcripts.append(make_transcript(f't{i}', rng.choice(['chr01', 'chr02']), start, start + rng.randrange(1, 5000)))
+    variants = []
+    for i in range(2000):
+        start = rng.randrange(1, 105_000)
+        # mostly short variants, with some long ones spanning many transcripts
+        span = rng.randrange(0, 20_000) if i % 20 == 0 else rng.randrange(0, 50)
+        variants.append({'seq_id': rng.choice(['chr01', 'chr02', 'chr03']), 'start': start,
+                         'end': start + span, 'kind': 'deletion'})
+
+    assigned = assign_variants(transcripts, variants)
+
+    for t in transcripts:
+        expected = sorted(
+            (v['start'], v['end']) for v in variants
+            if v['seq_id'] == t['seq_id'] and v['start'] <= t['end'] and v['end'] >= t['start']
+        )
+        actual = sorted((v['start'], v['end']) for v in assigned.get(t['transcript_id'], []))
+        assert actual == expected
+
+
+def test_assign_variants_long_variant_does_not_leak_to_short_ones():
+    transcripts = [make_transcript('T', 'chr01', 5000, 6000)]
+    variants = [{'seq_id': 'chr01', 'start': 100, 'end': 10000, 'kind': 'deletion'},
+                {'seq_id': 'chr01', 'start': 200, 'end': 210, 'kind': 'deletion'}]
+    assigned = assign_variants(transcripts, variants)
+    assert [(v['start'], v['end']) for v in assigned['T']] == [(100, 10000)]
+
+
+def test_assign_variants_stays_linear_after_a_long_variant():
+    transcripts = [make_transcript(f't{i}', 'chr01', i * 100 + 1, i * 100 + 50) for i in range(20_000)]
+    variants = [{'seq_id': 'chr01', 'start': 1, 'end': 2_000_000, 'kind': 'deletion'}]
+    variants += [{'seq_id': 'chr01', 'start': i * 100 + 10, 'end': i * 100 + 10, 'kind': 'substitution'}
+                 for i in range(20_000)]
+
+    started = time.perf_counter()
+    assigned = assign_variants(transcripts, variants)
+    elapsed = time.perf_counter() - started
+
+    assert len(assigned) == 20_000
+    assert all(len(v) == 2 and v[0] is variants[0] for v in assigned.values())
+    assert assigned['t123'][1]['start'] == 12_310
+    # a rescan of every open transcript per variant takes tens of seconds here
+    assert elapsed < 5
+
+
+def test_annotate_variants_context_and_protein():
+    structure = make_transcript('t1', 'chr01', 1000, 1299)
+    structure['cds'] = [{'start': 1100, 'end': 1149}, {'start': 1200, 'end': 1249}]
+    structure['five_prime_utrs'] = [{'start': 1000, 'end': 1099}]
+    structure['three_prime_utrs'] = [{'start': 1250, 'end': 1299}]
+    variants = [{'start': p, 'end': p, 'kind': 'substitution'} for p in (1050, 1100, 1160, 1206, 1290)]
+
+    annotated = annotate_variants(structure, variants)
+
+    assert [v['context'] for v in annotated] == ['five_prime_UTR', 'CDS', 'intron', 'CDS', 'three_prime_UTR']
+    assert [v['cdna'] for v in annotated] == [51, 101, None, 157, 241]
+    assert [v['protein'] for v in annotated] == [None, 1, None, 19, None]
@@ -2,7 +2,6 @@
 
 import { useRef, useState, useMemo } from "react";
 import useSWR from "swr";
-import Fuse from "fuse.js";
 
 import {
   parseGff,
@@ -29,8 +28,16 @@ type GeneStructureRequest = {
   gene_structure: GeneStructureInfo;
 };
 
+type SearchResult = {
+  transcript_id: string;
+  field: string;
+  key: string;
+  match: "exact" | "prefix" | "fuzzy";
+  score: number;
+};
+
 type ExportSettings = {
-  format: "svg" | "png";
+  format: "svg" | "png" | "pdf";
   dpi: number;
   background: "transparent" | "white";
   filename: string;
@@ -57,6 +64,26 @@ const postFetcher = async (url: string, data: GeneStructureRequest | null) => {
   return { blob, url: window.URL.createObjectURL(blob) };
 };
 
+const searchFetcher = async (url: string): Promise<SearchResult[]> => {
+  const response = await fetch(url);
+  if (!response.ok) {
+    throw new Error(`API error: ${response.status}`);
+  }
+  return (await response.json()).results;
+};
+
+// 検索用にサーバーへ GFF を送り、annotation_id を受け取る
+const uploadAnnotation = async (file: File): Promise<string> => {
+  const response = await fetch("/api/py/annotations?limit=0", {
+    method: "POST",
+    body: file,
+  });
+  if (!response.ok) {
+    throw new Error(`API error: ${response.status}`);
+  }
+  return (await response.json()).annotation_id;
+};
+
 export default function Home() {
   const [uiState, setUiState] = useState<UIState>("upload");
   const [isLoading, setIsLoading] = useState(false);
@@ -72,7 +99,10 @@ export default function Home() {
   const [selectedFile, setSelectedFile] = useState<File | null>(null);
   const [width, setWidth] = useState(1200);
   const [geneStructures, setGeneStructures] = useState<GeneStructureInfo[]>([]);
+  const [annotationId, setAnnotationId] = useState<string | null>(null);
   const fileInputRef = useRef<HTMLInputElement>(null);
+  // 最後にドロップしたファイル (古いアップロードの annotation_id を使わないため)
+  const uploadingFileRef = useRef<File | null>(null);
   const canvasRef = useRef<HTMLCanvasElement>(null);
   // const [downloadUrl, setDownloadUrl] = useState<string | null>(null);
   const [dragActive, setDragActive] = useState(false);
@@ -84,21 +114,42 @@ export default function Home() {
     filename: "gene_structure",
   });
 
-  const fuseInstance = useMemo(() => {
-    const fuse = new Fuse(geneStructures, {
-      keys: ["transcript_id", "attributes.Parent"],
-      threshold: 0.5, // TODO: しきい値を調整する
-    });
-    return fuse;
-  }, [geneStructures]);
+  const geneStructuresById = useMemo(
+    () => new Map(geneStructures.map((gs) => [gs.transcript_id, gs])),
+    [geneStructures],
+  );
+
+  // 検索はサーバー側の索引で行う (選択済みの分を除いても 20 件残るよう多めに取る)
+  const { data: searchResults } = useSWR(
+    annotationId && input.trim()
+      ? `/api/py/annotations/${annotationId}/search?q=${encodeURIComponent(input)}&limit=${20 + selectedTranscripts.length}`
+      : null,
+    searchFetcher,
+    { keepPreviousData: true },
+  );
 
   const filteredGeneStructures = useMemo(() => {
-    const result = fuseInstance.search(input);
-    const filteredResult = result.filter(
-      (item) => !selectedTranscripts.includes(item.item.transcript_id),
-    );
-    return filteredResult.slice(0, 20).map((item) => item.item);
-  }, [input, fuseInstance, selectedTranscripts]);
+    // サーバーへのアップロードに失敗したときは、ID と Parent の部分一致で絞り込む
+    if (!annotationId) {
+      const query = input.trim().toLowerCase();
+      if (!query) {
+        return [];
+      }
+      return geneStructures
+        .filter((gs) => !selectedTranscripts.includes(gs.transcript_id))
+        .filter((gs) =>
+          [gs.transcript_id, ...(gs.attributes?.Parent ?? [])].some((key) =>
+            key.toLowerCase().includes(query),
+          ),
+        )
+        .slice(0, 20);
+    }
+    return (searchResults ?? [])
+      .filter((result) => !selectedTranscripts.includes(result.transcript_id))
+      .map((result) => geneStructuresById.get(result.transcript_id))
+      .filter((gs): gs is GeneStructureInfo => gs !== undefined)
+      .slice(0, 20);
+  }, [annotationId, input, geneStructures, searchResults, geneStructuresById, selectedTranscripts]);
 
   const handleFileChange = async (e: React.ChangeEvent<HTMLInputElement>) => {
     if (e.target.files && e.target.files.length > 0) {
@@ -130,10 +181,23 @@ export default function Home() {
     e.stopPropagation();
     setDragActive(false);
     if (e.dataTransfer.files && e.dataTransfer.files.length > 0) {
-      setSelectedFile(e.dataTransfer.files[0]);
+      const file = e.dataTransfer.files[0];
+      setSelectedFile(file);
+      setAnnotationId(null);
       setIsLoading(true);
+      // 検索用のアップロードは解析と並行して行い、失敗しても読み込みは続ける
+      uploadingFileRef.current = file;
+      uploadAnnotation(file)
+        .then((uploadedId) => {
+          if (uploadingFileRef.current === file) {
+            setAnnotationId(uploadedId);
+          }
+        })
+        .catch((error) => {
+          console.warn(`Search falls back to local filtering: ${error}`);
+        });
       try {
-        const gffData = await parseGff(e.dataTransfer.files[0]);
+        const gffData = await parseGff(file);
         const mRNAs = getmRNAs(gffData);
         const geneStructureInfo = getGeneStructureInfo(mRNAs);
         setGeneStructures(geneStructureInfo);
@@ -248,6 +312,8 @@ export default function Home() {
       window.URL.revokeObjectURL(svgData.url);
     }
     setGeneStructures([]);
+    setAnnotationId(null);
+    uploadingFileRef.current = null;
     setSelectedFile(null);
     if (fileInputRef.current) {
       fileInputRef.current.value = "";
@@ -262,33 +328,25 @@ export default function Home() {
     let finalUrl = svgData.url;
     const finalFilename = `${exportSettings.filename}.${exportSettings.format}`;
 
-    if (exportSettings.format === "png") {
-      // PNGの場合はcanvasを使用して変換
-      const canvas = document.createElement("canvas");
-      const ctx = canvas.getContext("2d");
-      const img = new Image();
-
-      await new Promise((resolve) => {
-        img.onload = () => {
-          // DPIに応じてキャンバスサイズを設定
-          const scale = exportSettings.dpi / 96; // 96はデフォルトのDPI
-          canvas.width = img.width * scale;
-          canvas.height = img.height * scale;
-
-          if (ctx) {
-            if (exportSettings.background === "white") {
-              ctx.fillStyle = "white";
-              ctx.fillRect(0, 0, canvas.width, canvas.height);
-            }
-
-            ctx.drawImage(img, 0, 0, canvas.width, canvas.height);
-          }
-          resolve(true);
-        };
-        img.src = svgData.url;
+    if (exportSettings.format !== "svg") {
+      // PNG / PDF はサーバー側で同じレイアウトから直接描画する
+      const response = await fetch("/api/py/export-gene-structure", {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+        },
+        body: JSON.stringify({
+          ...getRequestData(),
+          format: exportSettings.format,
+          dpi: exportSettings.dpi,
+          background: exportSettings.background,
+        }),
       });
-
-      finalUrl = canvas.toDataURL("image/png");
+      if (!response.ok) {
+        alert(`Export failed: ${response.status}`);
+        return;
+      }
+      finalUrl = window.URL.createObjectURL(await response.blob());
     }
 
     const a = document.createElement("a");
@@ -297,6 +355,9 @@ export default function Home() {
     document.body.appendChild(a);
     a.click();
     document.body.removeChild(a);
+    if (finalUrl !== svgData.url) {
+      window.URL.revokeObjectURL(finalUrl);
+    }
     setShowExportDialog(false);
   };
 
@@ -627,12 +688,13 @@ export default function Home() {
                   onChange={(e) =>
                     setExportSettings({
                       ...exportSettings,
-                      format: e.target.value as "svg" | "png",
+                      format: e.target.value as "svg" | "png" | "pdf",
                     })
                   }
                 >
                   <option value="svg">SVG</option>
                   <option value="png">PNG</option>
+                  <option value="pdf">PDF</option>
                 </select>
               </div>
 
@@ -0,0 +1,292 @@
+"""Benchmarks for cold-start imports, GFF parsing, transcript geometry, drawing and SVG serialisation.
+
+Run from the repository root::
+
+    python -m benchmarks.run --out bench.json
+    python -m benchmarks.run --quick --compare bench.json
+
+Every case is timed ``--repeat`` times (min and median wall time are kept) and
+then run once more under tracemalloc for its peak Python allocation, so the
+memory measurement never skews the timings. Results are written as JSON with
+the git commit and library versions; ``--compare`` prints per-case ratios
+against an earlier result file.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+import svgwrite
+
+from api.geometry import get_axis, normalize, structure_arrays, transcript_layout, validate
+from api.gff import GffIndex, iter_transcripts
+from api.render import draw_gene_structure, new_drawing, render_gene_structures_svg
+from benchmarks.synthetic import make_transcript, write_gff
+
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+UTILS_DIR = os.path.join(ROOT, 'app', 'utils')
+BUNDLED_GFFS = {
+    'rice': os.path.join(UTILS_DIR, 'transcripts.gff'),
+    'sorghum': os.path.join(UTILS_DIR, 'Sorghum_bicolor.Sorghum_bicolor_NCBIv3.51.gff3'),
+}
+EXON_COUNTS = (1, 10, 100, 1000, 10000)
+FEATURE_COUNTS = (1000, 10000, 100000, 1000000)
+QUICK_EXON_COUNTS = (1, 100, 1000)
+QUICK_FEATURE_COUNTS = (1000, 10000)
+
+DRAW_SETTINGS = SimpleNamespace(
+    mode='gene',
+    utr_color='#d3d3d3',
+    exon_color='#0077cc',
+    line_color='#000000',
+    intron_shape='straight',
+    gene_h=20,
+    margin_x=50,
+    margin_y=100,
+    deletion_shape='zigzag',
+    variant_color='#d62728',
+)
+
+
+def load_cli():
+    """Import geneSTRUCTURE_v2/GeneSTRUCTURE.py so its get_structure can be timed as-is."""
+    path = os.path.join(ROOT, 'geneSTRUCTURE_v2', 'GeneSTRUCTURE.py')
+    spec = importlib.util.spec_from_file_location('GeneSTRUCTURE', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def measure(func, repeat):
+    """Return ``(min, median, peak_bytes)`` for ``func()``."""
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - started)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return min(times), statistics.median(times), peak
+
+
+class Suite:
+
+    def __init__(self, repeat):
+        self.repeat = repeat
+        self.results = []
+
+    def run(self, name, func, **params):
+        best, median, peak = measure(func, self.repeat)
+        self.results.append({
+            'name': name,
+            'params': params,
+            'min_s': best,
+            'median_s': median,
+            'peak_bytes': peak,
+        })
+        label = ' '.join(f'{k}={v}' for k, v in params.items())
+        print(f'{name:<24} {label:<40} {best * 1000:10.3f} ms  {peak / 1024:10.1f} KiB', file=sys.stderr)
+
+
+def bench_transcripts(suite, exon_counts):
+    for n_exons in exon_counts:
+        for strand in '+-':
+            structure = make_transcript(n_exons, strand)
+            axis = get_axis([structure])
+
+            def normalise():
+                starts, ends, kinds = structure_arrays(structure)
+                starts, ends = normalize(starts, ends, axis)
+                validate(starts, ends, kinds)
+
+            suite.run('normalize', normalise, exons=n_exons, strand=strand)
+            suite.run('layout', lambda: transcript_layout(structure, axis, DRAW_SETTINGS.margin_x),
+                      exons=n_exons, strand=strand)
+
+            # svgwrite's tiny profile rejects coordinates above 32767, so very long
+            # transcripts are only drawn with the fast backend
+            fits_tiny = (axis[1] - axis[0]) / 10 + 2 * DRAW_SETTINGS.margin_x <= 32767
+            for backend in ('fast', 'svgwrite') if fits_tiny else ('fast',):
+                def draw():
+                    dwg = new_drawing(size=(1000, 300), backend=backend)
+                    draw_gene_structure(dwg, structure, DRAW_SETTINGS, {}, axis, DRAW_SETTINGS.margin_y)
+                    return dwg
+
+                dwg = draw()
+                suite.run('draw', draw, exons=n_exons, strand=strand, backend=backend)
+                suite.run('tostring', dwg.tostring, exons=n_exons, strand=strand, backend=backend)
+
+
+def bench_gff(suite, name, path, cli, lookups=100):
+    with open(path) as inp:
+        features = sum(1 for line in inp if line.strip() and not line.startswith('#'))
+    with open(path) as inp:
+        transcript_ids = [t['transcript_id'] for t in iter_transcripts(inp)]
+    picked = transcript_ids[::max(1, len(transcript_ids) // lookups)][:lookups]
+
+    def parse():
+        with open(path) as inp:
+            for _ in iter_transcripts(inp):
+                pass
+
+    suite.run('gff.parse', parse, gff=name, features=features)
+    with tempfile.TemporaryDirectory() as index_dir:
+        bench_gff_index(suite, name, path, cli, picked, features, os.path.join(index_dir, 'bench.gsidx'))
+
+    # the bundled GFFs are also drawn whole, all transcripts in one figure
+    if name in BUNDLED_GFFS:
+        with open(path) as inp:
+            structures = [t for t in iter_transcripts(inp) if t['cds']]
+        for backend in ('fast', 'svgwrite'):
+            suite.run('render_svg', lambda: render_gene_structures_svg(structures, DRAW_SETTINGS, backend=backend),
+                      gff=name, transcripts=len(structures), backend=backend)
+
+
+def bench_gff_index(suite, name, path, cli, picked, features, index_path):
+    def build_index():
+        if os.path.exists(index_path):
+            os.remove(index_path)
+        return GffIndex(path, index_path)
+
+    suite.run('gff.index_build', build_index, gff=name, features=features)
+    suite.run('gff.index_load', lambda: GffIndex(path, index_path), gff=name, features=features)
+
+    cli.gff_index = GffIndex(path, index_path)
+
+    def get_structures():
+        for transcript_id in picked:
+            cli.get_structure(transcript_id)
+
+    suite.run('cli.get_structure', get_structures, gff=name, features=features, lookups=len(picked))
+
+
+IMPORT_SNIPPET = """
+import sys, time
+for name in {preload!r}:
+    __import__(name)
+started = time.perf_counter()
+__import__({module!r})
+print(time.perf_counter() - started)
+"""
+
+
+def import_seconds(module, preload=()):
+    """Wall time of importing ``module`` in a fresh interpreter after ``preload``."""
+    code = IMPORT_SNIPPET.format(module=module, preload=list(preload))
+    result = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def bench_imports(suite):
+    """Cold-start cost of the API module and of each lazily imported renderer."""
+    cases = [
+        ('fastapi', ()),
+        ('api.index', ('fastapi', 'pydantic')),
+        ('api.render', ('api.index',)),
+        ('api.raster', ('api.index', 'api.render')),
+        ('api.variants', ('api.index', 'api.render')),
+    ]
+    for module, preload in cases:
+        times = [import_seconds(module, preload) for _ in range(suite.repeat)]
+        suite.results.append({
+            'name': 'import',
+            'params': {'module': module},
+            'min_s': min(times),
+            'median_s': statistics.median(times),
+            'peak_bytes': None,
+        })
+        print(f'{"import":<24} {"module=" + module:<40} {min(times) * 1000:10.3f} ms', file=sys.stderr)
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, threshold, min_time):
+    with open(baseline_path) as inp:
+        baseline = {(r['name'], json.dumps(r['params'], sort_keys=True)): r for r in json.load(inp)['results']}
+    regressions = 0
+    for result in results:
+        old = baseline.get((result['name'], json.dumps(result['params'], sort_keys=True)))
+        if old is None or not old['min_s']:
+            continue
+        ratio = result['min_s'] / old['min_s']
+        flag = ''
+        # sub-millisecond cases are too noisy to call regressions
+        if ratio > 1 + threshold and max(result['min_s'], old['min_s']) >= min_time:
+            flag = '  REGRESSION'
+            regressions += 1
+        label = ' '.join(f'{k}={v}' for k, v in result['params'].items())
+        print(f'{result["name"]:<24} {label:<40} x{ratio:6.2f}{flag}', file=sys.stderr)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--out', help='write results as JSON to this file (default: stdout)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--quick', action='store_true', help='smaller sizes, skips the 1M-feature GFF')
+    parser.add_argument('--only', choices=('imports', 'transcripts', 'gff'), help='run one group only')
+    parser.add_argument('--compare', help='earlier result JSON to compare min times against')
+    parser.add_argument('--threshold', type=float, default=0.2, help='slowdown ratio reported as a regression')
+    parser.add_argument('--min-time', type=float, default=0.001,
+                        help='cases faster than this many seconds are never reported as regressions')
+    args = parser.parse_args(argv)
+
+    suite = Suite(args.repeat)
+    if args.only in (None, 'imports'):
+        bench_imports(suite)
+    if args.only in (None, 'transcripts'):
+        bench_transcripts(suite, QUICK_EXON_COUNTS if args.quick else EXON_COUNTS)
+    if args.only in (None, 'gff'):
+        cli = load_cli()
+        for name, path in BUNDLED_GFFS.items():
+            if os.path.exists(path):
+                bench_gff(suite, name, path, cli)
+        with tempfile.TemporaryDirectory() as tmp:
+            for n_features in QUICK_FEATURE_COUNTS if args.quick else FEATURE_COUNTS:
+                path = write_gff(os.path.join(tmp, f'synthetic_{n_features}.gff3'), n_features)
+                bench_gff(suite, f'synthetic_{n_features}', path, cli)
+
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'svgwrite': svgwrite.__version__,
+        'repeat': args.repeat,
+        'results': suite.results,
+    }
+    if args.out:
+        with open(args.out, mode='w') as out:
+            json.dump(report, out, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        return 1 if compare(suite.results, args.compare, args.threshold, args.min_time) else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Deterministic synthetic transcripts and GFF3 files for the benchmarks."""
+import random
+
+
+def make_transcript(n_exons, strand='+', exon_len=150, intron_len=400, utr_len=60, transcript_id='bench.1', seq_id='chr01'):
+    """A GeneStructureInfo-shaped dict with ``n_exons`` exons and UTRs at both ends."""
+    starts = [1000 + i * (exon_len + intron_len) for i in range(n_exons)]
+    exons = [{'start': s, 'end': s + exon_len - 1} for s in starts]
+    start, end = exons[0]['start'], exons[-1]['end']
+    # the outermost utr_len bases on each side are UTR, the rest is CDS
+    cds = [dict(e) for e in exons]
+    cds[0]['start'] += utr_len
+    cds[-1]['end'] -= utr_len
+    left_utr = {'start': start, 'end': start + utr_len - 1}
+    right_utr = {'start': end - utr_len + 1, 'end': end}
+    five_utr, three_utr = (left_utr, right_utr) if strand == '+' else (right_utr, left_utr)
+    return {
+        'transcript_id': transcript_id,
+        'seq_id': seq_id,
+        'strand': strand,
+        'start': start,
+        'end': end,
+        'total_length': end - start,
+        'exons': exons,
+        'cds': cds,
+        'five_prime_utrs': [five_utr],
+        'three_prime_utrs': [three_utr],
+    }
+
+
+def gff_lines(n_features, exons_per_transcript=5, seed=0):
+    """Yield GFF3 lines for about ``n_features`` features, sorted like a real annotation.
+
+    Each transcript contributes an mRNA, its exons and CDS segments and two UTRs.
+    """
+    rng = random.Random(seed)
+    per_transcript = 1 + 2 * exons_per_transcript + 2
+    n_transcripts = max(1, n_features // per_transcript)
+    yield '##gff-version 3\n'
+    prev_seq_id = None
+    for i in range(n_transcripts):
+        # spread transcripts over ten chromosomes, each starting again at 1
+        seq_id = f'chr{i * 10 // n_transcripts + 1:02d}'
+        if seq_id != prev_seq_id:
+            position = 1
+        prev_seq_id = seq_id
+        strand = rng.choice('+-')
+        transcript_id = f'BENCH{i:07d}.1'
+        t = make_transcript(exons_per_transcript, strand, transcript_id=transcript_id, seq_id=seq_id,
+                            exon_len=rng.randrange(80, 400), intron_len=rng.randrange(60, 2000))
+        shift = position - t['start']
+        position = t['end'] + shift + rng.randrange(500, 5000)
+
+        def row(kind, pos, attributes):
+            return (f"{seq_id}\tbench\t{kind}\t{pos['start'] + shift}\t{pos['end'] + shift}\t.\t{strand}\t"
+                    f"{'0' if kind == 'CDS' else '.'}\t{attributes}\n")
+
+        yield row('mRNA', t, f'ID={transcript_id};Parent=BENCH{i:07d}')
+        for kind, key in (('five_prime_UTR', 'five_prime_utrs'), ('exon', 'exons'),
+                          ('CDS', 'cds'), ('three_prime_UTR', 'three_prime_utrs')):
+            for pos in t[key]:
+                yield row(kind, pos, f'Parent={transcript_id}')
+
+
+def write_gff(path, n_features, **kwargs):
+    with open(path, mode='w') as out:
+        out.writelines(gff_lines(n_features, **kwargs))
+    return path
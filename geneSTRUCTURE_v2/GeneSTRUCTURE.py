@@ -1,26 +1,39 @@
 
-import svgwrite
+import os
 import re
 import sys
 import numpy as np
 import configparser
-import colorsys
+import json
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from types import SimpleNamespace
 from logging import getLogger, StreamHandler, FileHandler, DEBUG, INFO, WARNING, Formatter
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from api.geometry import domain_segments
+from api.gff import GffIndex, iter_transcripts, open_gff, parse_region, strip_prefix
+from api.render import render_gene_structures_svg, render_svg_file
+from api.snapshot import SNAPSHOT_SUFFIX, Snapshot
+
 
 logger = getLogger(__name__)
 logger.setLevel(DEBUG)
 
-sh = StreamHandler()
-sh.setLevel(INFO)
-sh.setFormatter(Formatter("%(asctime)s %(levelname)8s %(message)s"))
 
-fh = FileHandler(filename = 'geneSTRUCTURE.log', mode = 'w')
-fh.setLevel(DEBUG)
-fh.setFormatter(Formatter("%(asctime)s %(levelname)8s %(message)s"))
+# バッチモードのワーカープロセスがこのファイルを import してもログを上書きしないよう、
+# ハンドラの設定は main() の中で行う
+def setup_logger():
+    sh = StreamHandler()
+    sh.setLevel(INFO)
+    sh.setFormatter(Formatter("%(asctime)s %(levelname)8s %(message)s"))
+
+    fh = FileHandler(filename = 'geneSTRUCTURE.log', mode = 'w')
+    fh.setLevel(DEBUG)
+    fh.setFormatter(Formatter("%(asctime)s %(levelname)8s %(message)s"))
 
-logger.addHandler(sh)
-logger.addHandler(fh)
+    logger.addHandler(sh)
+    logger.addHandler(fh)
 
 #################################################
 #   Function Definitions
@@ -63,514 +76,266 @@ def print_welcome_message():
     print("------------------------------------------------------------------------------------------------------")
 
 
-print_welcome_message()
-
-
-def lighten_color(hex_color, factor):
-    hex_color = hex_color.lstrip('#')
-    r, g, b = tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
-    h, l, s = colorsys.rgb_to_hls(r / 255, g / 255, b / 255)
-    l = min(1.0, l + factor * (1.0 - l))
-    r_new, g_new, b_new = colorsys.hls_to_rgb(h, l, s)
-    return '#{:02x}{:02x}{:02x}'.format(int(r_new * 255), int(g_new * 255), int(b_new * 255))
-
-def get_or_create_gradient(dwg, base_color, grad_dict):
-    if base_color in grad_dict:
-        return grad_dict[base_color]
-
-    grad_id = f'grad_{len(grad_dict)}'
-    light_color = lighten_color(base_color, 0.4)
-    lighter_color = lighten_color(base_color, 0.7)
-
-    grad = dwg.linearGradient(start=('0%', '100%'), end=('0%', '0%'), id=grad_id)
-    grad.add_stop_color(offset='0.0', color=base_color)
-    grad.add_stop_color(offset='0.5', color=light_color)
-    grad.add_stop_color(offset='1.0', color=lighter_color)
-    dwg.defs.add(grad)
-
-    grad_dict[base_color] = grad_id
-    return grad_id
-
-def get_structure(transcript_id):
-
-    mRNA_pos = []
-
-    exon_pos = []
-    #exon_len = []
-
-    cds_pos = []
-    cds_len = []
-
-    five_prime_UTR_pos = []
-    three_prime_UTR_pos = []
-
-    five_prime_UTR_len = []
-    three_prime_UTR_len = []
-
-    total_length = 0
-    five_prime_UTR = 0
-    three_prime_UTR = 0
-
-    with open(gff_path, mode = 'r') as inp: 
-        for line in inp:
-            line = line.rstrip('\r|\n|\r\n')
-            if line.startswith('#'):
-                pass
-            else:
-                line = line.split('\t')
-
-                # この書き方はやめる。"id" in line[8] でいい。
-                # id_col = re.split('[:;]', line[8])
-                if transcript_id in line[8]:
-
-                    strand = line[6]
-
-                    if line[2] == 'mRNA':
-                        mRNA_pos.append(int(line[3]))
-                        mRNA_pos.append(int(line[4]))
-                        total_length = (int(line[4]) - int(line[3]))/10
-                    elif line[2] == 'CDS':
-                        exon_pos.append(int(line[3]))
-                        exon_pos.append(int(line[4]))
-                        cds_pos.append(int(line[3]))
-                        cds_pos.append(int(line[4]))
-                        cds_len.append((int(line[4]) - int(line[3]))/10)
-                    elif line[2] == 'five_prime_UTR':
-                        exon_pos.append(int(line[3]))
-                        exon_pos.append(int(line[4]))
-                        five_prime_UTR_pos.append(int(line[3]))
-                        five_prime_UTR_pos.append(int(line[4]))
-                        five_prime_UTR_len.append((int(line[4]) - int(line[3]))/10)
-                        five_prime_UTR = (int(line[4]) - int(line[3]))/10
-                    elif line[2] == 'three_prime_UTR':
-                        exon_pos.append(int(line[3]))
-                        exon_pos.append(int(line[4]))
-                        three_prime_UTR_pos.append(int(line[3]))
-                        three_prime_UTR_pos.append(int(line[4]))
-                        three_prime_UTR_len.append((int(line[4]) - int(line[3]))/10)
-                        three_prime_UTR = (int(line[4]) - int(line[3]))/10
-
-        if strand == '+':
-            mRNA_pos = np.array(mRNA_pos)
-            exon_pos = np.array(exon_pos)
-            cds_pos = np.array(cds_pos)
-            five_prime_UTR_pos = np.array(five_prime_UTR_pos)
-            three_prime_UTR_pos = np.array(three_prime_UTR_pos)
-        
-        if strand == '-':
-            mRNA_pos = np.array(mRNA_pos) * -1
-            exon_pos = np.array(exon_pos) * -1
-            cds_pos = np.array(cds_pos) * -1
-            five_prime_UTR_pos = np.array(five_prime_UTR_pos) * -1
-            three_prime_UTR_pos = np.array(three_prime_UTR_pos) * -1
-    
-    return total_length, mRNA_pos, exon_pos, cds_pos, five_prime_UTR_pos, three_prime_UTR_pos, five_prime_UTR, three_prime_UTR, strand
-
-def cDNA_pos2gDNA_pos(cDNA_exon_pos, domain_cDNA_pos):
-    print('domain_cDNA_pos:', domain_cDNA_pos)
-    print('cDNA_exon_pos:', cDNA_exon_pos)
-    x2 = np.sort(np.append(cDNA_exon_pos, domain_cDNA_pos))
-    index = int(np.where(x2 == domain_cDNA_pos)[0])
-    print('index:', index)
-    gDNA_pos = domain_cDNA_pos + cumsum_intron_len[index-1]
-    print('cumsum_intron_len[index-1]:', cumsum_intron_len[index-1])
-
-    return gDNA_pos
-
-# deletion の両端が exon 内に含まれていなければ exon_pos に追加
-def is_position_in_exon(exon_pos, pos):
-    print("exon_pos", len(exon_pos))
-    for i in range(0, len(exon_pos), 2):
-        if exon_pos[i] <= pos <= exon_pos[i+1]:
-            return True
-    return False
-
-
-def update_exon_positions_with_deletion(exon_pos, del_pos):
-    del_pos = del_pos + np.min(cds_pos)
-    del_start, del_end = del_pos[0], del_pos[1]
-
-    is_del_end_in_exon = True
-    is_del_start_in_exon = True
-
-    if not is_position_in_exon(exon_pos, del_end):
-        exon_pos = np.append(exon_pos, del_end)
-        is_del_end_in_exon = False
-
-    if not is_position_in_exon(exon_pos, del_start):
-        exon_pos = np.append(exon_pos, del_start)
-        is_del_start_in_exon = False
-
-    # deletion の開始・終了点も exon_pos に追加
-    exon_pos = np.append(exon_pos, del_pos)
-
-    # ソートして deletion 範囲内の部分を除去
-    exon_pos.sort()
-    updated_exon_pos = exon_pos[(exon_pos <= del_start) | (exon_pos >= del_end)]
-
-    return updated_exon_pos, is_del_start_in_exon, is_del_end_in_exon
-    
-###################################################
-# config settings
-###################################################
-
-inifile = configparser.ConfigParser()
-inifile.read('./config.ini')
-
-mode = inifile.get('mode_setting', 'mode')
-mode = 'domain'
-# file settings
-gff_path = inifile.get('file_settings', 'gff_path')
-transcript_id = inifile.get('file_settings', 'transcript_id')
-file_name = inifile.get('file_settings', 'file_name')
-
-# color setting
-utr_color = inifile.get('color_settings', 'UTR_color')
-exon_color = inifile.get('color_settings', 'Exon_color')
-line_color = inifile.get('color_settings', 'line_color')
-
-# gradation setting
-utr_gradation = inifile.get('gradation_settings', 'UTR_gradation') # on or off 
-exon_gradation = inifile.get('gradation_settings', 'Exon_gradation') # on or off
-
-# drawing_settings
-deletion_shape = inifile.get('drawing_settings', 'deletion_shape') # dashed or zigzag
-stroke = inifile.get('drawing_settings', 'stroke') # on or off
-
-# 自動的に決まるようにする！！　か、デフォルトで適当に決めるか・・・
-# drawing settings
-margin_x = int(inifile.get('drawing_settings', 'margin_x'))
-margin_y = int(inifile.get('drawing_settings', 'margin_y'))
-gene_h = int(inifile.get('drawing_settings', 'gene_h'))
-
-##################################### main script ############################################ 
-
-total_length, mRNA_pos, exon_pos, cds_pos, five_prime_UTR_pos, three_prime_UTR_pos, five_prime_UTR, three_prime_UTR, strand = get_structure(transcript_id)
-
-print('#################')
-print('total_length:', total_length)
-print('exon_pos:', exon_pos)
-print('cds_pos:', cds_pos)
-print('five_prime_UTR:', five_prime_UTR)
-print('three_prime_UTR:', three_prime_UTR)
-print('#################')
-
-if not get_structure(transcript_id):
-    logger.info(f'Gene ID "{gene_id}" was not found.')
-    sys.exit()
-
-if five_prime_UTR == 0:
-    logger.info("There was no annotation for 5'UTR")
-
-if three_prime_UTR == 0:
-    logger.info("There was no annotation for 3'UTR")
-
-# ここに必要？
-exon_pos = np.array(exon_pos)
-exon_pos = np.sort(exon_pos)
-cds_pos = np.array(cds_pos)
-cds_pos = np.sort(cds_pos)
-#################
-
-del_pos = np.array([1, 100])
-
-
-
-######################################
-# 計算
-######################################
-
-
-#ドメイン構造は、deletionで更新する前の exon_pos を使って、ドメインのstart endを決める。
-
-
-
-
-# ひとまず、deletionは無視！！
-exon_pos, is_del_start_in_exon, is_del_end_in_exon = update_exon_positions_with_deletion(exon_pos, del_pos)
-
-#エキソン＆イントロン長を取得
-exon_intron_length = np.asarray([(exon_pos[i+1] - exon_pos[i])/10 for i in range(len(exon_pos)-1)])
-
-exon_len = np.asarray([exon_intron_length[i] for i in range(len(exon_intron_length)) if i % 2 == 0])
-intron_len = np.asarray([exon_intron_length[i] for i in range(len(exon_intron_length)) if i % 2 == 1])
-print('exon_len:', exon_len)
-
-# 累積イントロン長
-cumsum_intron_len = np.append(np.append(0, np.cumsum(intron_len)), 0)
-print('cumsum_intron_len:', cumsum_intron_len)
-# cDNAでの位置
-cDNA_exon_pos = np.append(0, np.cumsum(exon_len)) + 50
-x  = (exon_pos - np.min(cds_pos))/10 + 50
-cds_pos = (cds_pos - np.min(cds_pos))/10 + 50
-
-######################################
-# Printing Settings
-######################################
-
-pagesize_w = total_length + margin_x * 2
-pagesize_h = gene_h + margin_y * 2
-center_line_y = margin_y + gene_h/2
-
-# SVGファイルの作成
-file_name = "gene_structure.svg"
-dwg = svgwrite.Drawing(filename=file_name, size=(pagesize_w, pagesize_h))
-
-grad_dict = {}
-
-if utr_gradation == "on":
-    utr_color = f'url(#{get_or_create_gradient(dwg, utr_color, grad_dict)})'
-
-if exon_gradation == "on":
-    exon_color = f'url(#{get_or_create_gradient(dwg, exon_color, grad_dict)})'
-
-stroke_width = 1
-
-
-stroke = "on"
-deletion_flag = del_pos[0]/10 + 50
-
-######################################
-# Exon の描画
-######################################
-
-for i in range(0, len(x), 2):
-    dwg.add(dwg.rect(
-        insert=(x[i], margin_y),
-        size=(exon_intron_length[i], gene_h),
-        fill=exon_color,
-        stroke="none" if stroke == "off" else line_color,
-        stroke_width=stroke_width
-    ))
-
-######################################
-# Intron の描画
-######################################
-
-for i in range(1, len(x) - 1, 2):
-    if x[i] == deletion_flag: pass
-    else:
-        dwg.add(dwg.line(
-            start=(x[i], center_line_y),
-            end=(x[i + 1], center_line_y),
-            stroke=line_color,
-            stroke_width=stroke_width
-        ))
-
-######################################
-# UTR の描画
-######################################
-
-five_prime_UTR = x[x < np.min(cds_pos)]
-
-for i in range(0, len(five_prime_UTR), 2):
-    dwg.add(dwg.rect(
-        insert=(five_prime_UTR[i], margin_y),
-        size=(exon_intron_length[i], gene_h),
-        fill=utr_color,
-        stroke="none" if stroke == "off" else line_color,
-        stroke_width=stroke_width
-    ))
-
-three_prime_UTR = x[x > np.max(cds_pos)]
-three_prime_UTR_length = np.asarray([(three_prime_UTR[i+1] - three_prime_UTR[i]) for i in range(len(three_prime_UTR)-1)])
-
-
-for i in range(0, len(three_prime_UTR), 2):
-    if i == len(three_prime_UTR) - 2:
-        x0 = three_prime_UTR[i]       # 左端
-        x1 = three_prime_UTR[i+1]     # 右端
-        x2 = x1 + 10               # 矢印先端
-
-        y0 = margin_y                 # 上端
-        y1 = margin_y + gene_h        # 下端
-
-        # 順序: 左上→左下→右下→右上→矢印先端（中央）
-        dwg.add(dwg.polygon(
-            points=[
-                (x0, y0),
-                (x0, y1),
-                (x1, y1),
-                (x2, center_line_y),
-                (x1, y0)
-            ],
-            fill=utr_color,
-            stroke="none" if stroke == "off" else line_color,
-            stroke_width=stroke_width
-        ))
-
-    else:
-        dwg.add(dwg.rect(
-            insert=(three_prime_UTR[i], margin_y),
-            size=(three_prime_UTR_length[i], gene_h),
-            fill=utr_color,
-            # fill=exon_fill,
-            stroke="none" if stroke == "off" else line_color,
-            stroke_width=stroke_width
-        ))
-
-######################################
-# Deletionの描画
-######################################
-
-
-for i in range(1, len(x) - 1, 2):
-    if x[i] == deletion_flag:
-        if deletion_shape == 'zigzag':
-
-            y1 = center_line_y
-            y2 = margin_y
-            y3 = center_line_y
-
-            if is_del_start_in_exon:
-                y1 = center_line_y - gene_h/2
-                y2 = margin_y - gene_h/2
-
-            if is_del_end_in_exon:
-                y3 = center_line_y - gene_h/2
-                y2 = margin_y - gene_h/2
-
-            points = [
-                (x[i], y1),
-                ((x[i+1]+x[i])/2, y2),
-                (x[i + 1], y3)
-            ]
-            dwg.add(dwg.polyline(
-                points=points,
-                stroke=line_color,
-                stroke_width=stroke_width,
-                fill="none"
-            ))
-
-        if deletion_shape == 'dashed':
-            dwg.add(dwg.line(
-                start=(x[i], center_line_y),
-                end=(x[i + 1], center_line_y),
-                stroke=line_color,
-                stroke_width=stroke_width,
-                style='stroke-dasharray:5,1'
-            ))
-
-######################################
-# Insertionの描画
-######################################
-
-ins_pos = np.array([2000, 6])
-ins_pos_x = int(ins_pos[0]/10 + 50)
-
-add_len = 10
-triangle_w = 30
-triangle_h = 10
-line_upper_y = int(margin_y - add_len)
-line_lower_y = int(margin_y + gene_h + add_len)
-
-dwg.add(dwg.line(
-                start=(ins_pos_x, line_upper_y),
-                end=(ins_pos_x, line_lower_y),
-                stroke=line_color,
-                stroke_width=stroke_width
-            ))
-
-points = [
-    (ins_pos_x, line_upper_y),
-    (ins_pos_x - triangle_w/2, line_upper_y - triangle_h),
-    (ins_pos_x + triangle_w/2, line_upper_y - triangle_h)
-    ]
-
-triangle = dwg.polygon(
-    points=points,
-    fill='black',
-    stroke='black',
-    stroke_width=2
-)
-
-dwg.add(triangle)
-
-
-
-
-###########################################
-# Domain mode
-###########################################
-
-if mode == 'domain':
-
-    n_domain = int(inifile.get('domain_settings', 'number_of_domains'))
-
-    for i in range(n_domain):
-
-        AA_start = int(inifile.get('domain_settings', f'domain{i+1}_AA_start'))
-        AA_end = int(inifile.get('domain_settings', f'domain{i+1}_AA_end'))
-        color = inifile.get('color_settings', f'domain{i+1}_color')
-
-        if exon_gradation == "on":
-            color = f'url(#{get_or_create_gradient(dwg, color, grad_dict)})'
-
-        cDNA_start = (AA_start * 3)/10 + 50
-        cDNA_end = (AA_end * 3)/10 + 50
-
-        print('cDNA_start:', cDNA_start)
-        print('cDNA_end:', cDNA_end)
-
-        gDNA_start = cDNA_pos2gDNA_pos(cDNA_exon_pos, cDNA_start) 
-        gDNA_end = cDNA_pos2gDNA_pos(cDNA_exon_pos, cDNA_end) 
-
-
-
-        if gDNA_end > x[-1]:
-            logger.warning(f'The end position of domain{i+1} is out of range.') 
-        # Even in this case, the end point of the domain is as same as that of codeing region.
-
-        gDNA_start = 100 
-        gDNA_end = 200
-        print('511_x:', x)
-        print('gDNA_start:', gDNA_start)
-        print('gDNA_end:', gDNA_end)
-        domain_pos = x[(gDNA_start <= x) & (x <= gDNA_end)]
-        print('517_domain_pos:', domain_pos)
-
-        print('518', is_position_in_exon(x, gDNA_start), is_position_in_exon(x, gDNA_end))
-        if is_position_in_exon(x, gDNA_start) and is_position_in_exon(x, gDNA_end):
-            domain_pos = np.sort(np.append([gDNA_start, gDNA_end], domain_pos))
-
-        if not is_position_in_exon(x, gDNA_start) and is_position_in_exon(x, gDNA_end):
-            domain_pos = np.sort(np.append([gDNA_end], domain_pos))
-        
-        if is_position_in_exon(x, gDNA_start) and not is_position_in_exon(x, gDNA_end):
-            domain_pos = np.sort(np.append([gDNA_start], domain_pos))
-        
-        if not is_position_in_exon(x, gDNA_start) and not is_position_in_exon(x, gDNA_end):
-            pass
-            
-
-        domain_len = np.asarray([(domain_pos[i+1] - domain_pos[i]) for i in range(len(domain_pos)-1)])
-        print('domain_pos:', domain_pos)
-        print('domain_len:', domain_len)
-
-        for j in range(0,len(domain_len),2):
-            dwg.add(dwg.rect(
-                insert=(domain_pos[j], margin_y),
-                size=(domain_len[j], gene_h),
-                fill=color,
-                # fill=exon_fill,
-                stroke="none" if stroke == "off" else line_color,
-                stroke_width=stroke_width
-            ))
-
-dwg.add(dwg.text(
-    transcript_id,
-    insert=(-150, center_line_y),  # ← 右端を x=50、ベースラインを y=80 に合わせたい
-    text_anchor="end",  # ← 右寄せにする
-    style="dominant-baseline:middle", 
-    font_size="14px"
-))
-
-dwg.viewbox(-300, 0, 1200, 100)
-# SVG を保存
-dwg.save()
-
-logger.info(f'Gene structure was successfully saved as "{file_name}"')
-
-
-
 
+def open_annotation(gff_path):
+    # .gssnap (python -m api.snapshot で GFF から作る) は mmap で開くだけなので GFF の索引より速い
+    if gff_path.endswith(SNAPSHOT_SUFFIX):
+        return Snapshot(gff_path)
+    return GffIndex(gff_path)
+
+def iter_annotation(gff_path):
+    if gff_path.endswith(SNAPSHOT_SUFFIX):
+        yield from Snapshot(gff_path).records(columns=True)
+        return
+    with open_gff(gff_path) as inp:
+        yield from iter_transcripts(inp)
+
+def read_positions(inifile, key, fallback):
+    # "[4000, 5000]" のような JSON 形式の配列を読む
+    value = inifile.get('mutaion_settings', key, fallback=None)
+    return np.array(json.loads(value) if value else fallback, dtype=np.int64)
+
+def config_variants(inifile, structure):
+    """[mutaion_settings] の変異を、ゲノム座標の variant (api.index.Variant の形) にする"""
+    cds = structure['cds']
+    cds_start = min(c['start'] for c in cds)
+    cds_end = max(c['end'] for c in cds)
+
+    # 相対座標は 5' 側の CDS 開始点から 3' 向きに数える
+    def genomic(position):
+        return cds_end - position if structure['strand'] == '-' else cds_start + position
+
+    variants = []
+    del_pos = read_positions(inifile, 'deletion', [])
+    if len(del_pos):
+        start, end = sorted((genomic(del_pos[0]), genomic(del_pos[1])))
+        variants.append({'start': start, 'end': end, 'kind': 'deletion'})
+    ins_pos = read_positions(inifile, 'insertion', [])
+    if len(ins_pos):
+        position = genomic(ins_pos[0])
+        variants.append({'start': position, 'end': position, 'kind': 'insertion'})
+    for position in read_positions(inifile, 'substitution', []).tolist():
+        position = genomic(position)
+        variants.append({'start': position, 'end': position, 'kind': 'substitution'})
+    return variants
+
+def read_domains(inifile):
+    # [domain_settings] の domainN_AA_start / domainN_AA_end (色は [color_settings] の domainN_color)
+    domains = []
+    for i in range(1, int(inifile.get('domain_settings', 'number_of_domains', fallback='0')) + 1):
+        domain = {
+            'start': int(inifile.get('domain_settings', f'domain{i}_AA_start')),
+            'end': int(inifile.get('domain_settings', f'domain{i}_AA_end')),
+            'name': f'domain{i}',
+        }
+        color = inifile.get('color_settings', f'domain{i}_color', fallback=None)
+        if color:
+            domain['color'] = color
+        domains.append(domain)
+    # InterProScan の TSV (protein ID, ..., signature, description, start, stop, ...) は転写産物ごとに描く
+    domain_file = inifile.get('domain_settings', 'domain_file', fallback='').strip()
+    if domain_file:
+        with open(domain_file, mode='r') as inp:
+            for line in inp:
+                fields = line.rstrip('\r\n').split('\t')
+                if len(fields) < 8 or line.startswith('#'):
+                    continue
+                domains.append({
+                    'transcript_id': fields[0],
+                    'name': fields[4],
+                    'start': int(fields[6]),
+                    'end': int(fields[7]),
+                })
+    return domains
+
+def read_transcript_ids(spec):
+    # "all" ならすべての転写産物、それ以外は1行1IDのファイル
+    if spec == 'all':
+        return None
+    with open(spec, mode='r') as inp:
+        return {line.strip() for line in inp if line.strip() and not line.startswith('#')}
+
+def batch_file_name(transcript_id, used):
+    # 置換で同じ名前になる ID (gene:1 と gene_1 など) は _2, _3 ... を付けて別のファイルにする
+    # 大文字小文字を区別しないファイルシステムでも重ならないよう、used は小文字で持つ
+    base = re.sub(r'[^A-Za-z0-9._-]', '_', transcript_id)
+    name = base + '.svg'
+    n = 1
+    while name.lower() in used:
+        n += 1
+        name = f'{base}_{n}.svg'
+    used.add(name.lower())
+    if n > 1:
+        logger.warning(f'Transcript "{transcript_id}" is saved as "{name}" because its file name is already used.')
+    return name
+
+def run_batch(gff_path, spec, output_dir, workers, draw_settings):
+    """GFF を1回だけ読み、選んだ転写産物をプロセスプールで並列に描画する"""
+    wanted = read_transcript_ids(spec)
+    found = set()
+    os.makedirs(output_dir, exist_ok=True)
+
+    def selected():
+        for structure in iter_annotation(gff_path):
+            transcript_id = structure['transcript_id']
+            if wanted is None:
+                yield structure
+                continue
+            for key in (transcript_id, strip_prefix(transcript_id)):
+                if key in wanted:
+                    found.add(key)
+                    yield structure
+                    break
+
+    started = time.perf_counter()
+    last_report = started
+    done = 0
+    failed = []
+
+    def collect(futures):
+        nonlocal done, last_report
+        for future in futures:
+            transcript_id = pending.pop(future)
+            try:
+                future.result()
+                done += 1
+            except Exception as e:
+                failed.append(transcript_id)
+                logger.warning(f'Failed to draw "{transcript_id}": {e}')
+        now = time.perf_counter()
+        if now - last_report >= 1:
+            last_report = now
+            logger.info(f'{done} drawn, {len(failed)} failed ({done / (now - started):.1f} transcripts/s)')
+
+    logger.info(f'Batch mode: drawing {spec} from "{gff_path}" with {workers} workers into "{output_dir}"')
+    pending = {}
+    used_names = set()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for structure in selected():
+            path = os.path.join(output_dir, batch_file_name(structure['transcript_id'], used_names))
+            future = executor.submit(render_svg_file, structure, draw_settings, path)
+            pending[future] = structure['transcript_id']
+            # 投入済みのタスクを workers の数倍までに抑えてメモリを一定に保つ
+            if len(pending) >= workers * 4:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+
+    elapsed = time.perf_counter() - started
+    logger.info(f'{done} gene structures were saved in "{output_dir}" in {elapsed:.1f} s '
+                f'({done / elapsed if elapsed else 0:.1f} transcripts/s)')
+    if failed:
+        logger.warning(f'{len(failed)} transcripts failed: {", ".join(failed)}')
+    if wanted is not None:
+        for transcript_id in sorted(wanted - found):
+            logger.warning(f'Transcript ID "{transcript_id}" was not found.')
+    return done, failed
+
+
+def run_region(gff_path, region, path, draw_settings):
+    """region (chr:start-end) に重なる転写産物を共通の座標軸上に積み重ねて1枚の SVG に描く"""
+    seq_id, start, end = parse_region(region)
+    structures = open_annotation(gff_path).region(seq_id, start, end)
+    if not structures:
+        logger.info(f'No transcripts were found in {region}.')
+        return None
+    # CDS のない転写産物 (ncRNA など) は描画できないので除く
+    drawable = [structure for structure in structures if structure['cds']]
+    for structure in structures:
+        if not structure['cds']:
+            logger.warning(f'Transcript "{structure["transcript_id"]}" has no CDS and was skipped.')
+    if not drawable:
+        return None
+    with open(path, mode='w', encoding='utf-8') as out:
+        out.write(render_gene_structures_svg(drawable, draw_settings))
+    logger.info(f'{len(drawable)} transcripts in {region} were saved in "{path}"')
+    return path
+
+
+def main():
+    setup_logger()
+    print_welcome_message()
+
+    ###################################################
+    # config settings
+    ###################################################
+
+    inifile = configparser.ConfigParser()
+    inifile.read('./config.ini')
+
+    mode = inifile.get('mode_setting', 'mode')
+    # file settings
+    gff_path = inifile.get('file_settings', 'gff_path')
+    transcript_id = inifile.get('file_settings', 'transcript_id')
+
+    # color setting
+    utr_color = inifile.get('color_settings', 'UTR_color')
+    exon_color = inifile.get('color_settings', 'Exon_color')
+    line_color = inifile.get('color_settings', 'line_color')
+    variant_color = inifile.get('color_settings', 'variant_color', fallback='#d62728')
+
+    # drawing_settings
+    deletion_shape = inifile.get('drawing_settings', 'deletion_shape') # dashed or zigzag
+
+    # 自動的に決まるようにする！！　か、デフォルトで適当に決めるか・・・
+    # drawing settings
+    margin_x = int(inifile.get('drawing_settings', 'margin_x'))
+    margin_y = int(inifile.get('drawing_settings', 'margin_y'))
+    gene_h = int(inifile.get('drawing_settings', 'gene_h'))
+
+    draw_settings = SimpleNamespace(
+        mode=mode,
+        utr_color=utr_color,
+        exon_color=exon_color,
+        line_color=line_color,
+        margin_x=margin_x,
+        margin_y=margin_y,
+        gene_h=gene_h,
+        deletion_shape=deletion_shape,
+        variant_color=variant_color,
+        domains=read_domains(inifile) if mode == 'domain' else None,
+    )
+
+    # batch settings (transcript_ids が空なら transcript_id の1本だけを描画する)
+    batch_ids = inifile.get('batch_settings', 'transcript_ids', fallback='').strip()
+    if batch_ids:
+        output_dir = inifile.get('batch_settings', 'output_dir', fallback='./gene_structures')
+        workers = int(inifile.get('batch_settings', 'workers', fallback=str(os.cpu_count() or 1)))
+        run_batch(gff_path, batch_ids, output_dir, workers, draw_settings)
+        return
+
+    # region settings (chr:start-end に重なる転写産物をすべて1枚に描画する)
+    region = inifile.get('region_settings', 'region', fallback='').strip()
+    if region:
+        region_file = inifile.get('region_settings', 'region_file', fallback='region.svg')
+        run_region(gff_path, region, region_file, draw_settings)
+        return
+
+    structure = open_annotation(gff_path).structure(transcript_id)
+    if structure is None:
+        logger.info(f'Transcript ID "{transcript_id}" was not found.')
+        sys.exit()
+
+    if not structure['five_prime_utrs']:
+        logger.info("There was no annotation for 5'UTR")
+    if not structure['three_prime_utrs']:
+        logger.info("There was no annotation for 3'UTR")
+
+    if draw_settings.domains:
+        _, domain_index, _, _ = domain_segments([structure], draw_settings.domains)
+        drawn = set(domain_index.tolist())
+        for i, domain in enumerate(draw_settings.domains):
+            if domain.get('transcript_id', transcript_id) == transcript_id and i not in drawn:
+                logger.warning(f'{domain["name"]} ({domain["start"]}-{domain["end"]} aa) is outside the coding region.')
+
+    # バッチ・領域モードと同じ api.render で描く
+    structure['variants'] = config_variants(inifile, structure)
+    file_name = "gene_structure.svg"
+    render_svg_file(structure, draw_settings, file_name)
+    logger.info(f'Gene structure was successfully saved as "{file_name}"')
+
+
+if __name__ == '__main__':
+    main()